@@ -3,10 +3,38 @@ Emotion Detection Agent - Analyzes child's emotional state
 """
 from typing import Dict, Any, List
 import asyncio
+import re
 
 from tools.gemini_tools import GeminiClient
+from tools.prompts import prompts, fit_to_budget, input_budget
+from tools.cpu_pool import cpu_pool, cpu_bound
 from config import config
 
+EMOTION_PROMPT = prompts.register('emotion_detector.text', """
+    Analyze the emotional content of this child's statement.
+    Consider their age and be sensitive to subtle emotional cues.
+
+    Statement: "{text}"
+
+    Score each emotion from 0-1:
+    - happiness: joy, excitement, contentment, fun, play
+    - sadness: disappointment, loneliness, grief, missing someone
+    - fear: worry, anxiety, scared, nervous
+    - anger: frustration, annoyance, mad, upset
+    - surprise: amazement, confusion, wonder
+    - neutral: calm, balanced, matter-of-fact
+
+    Also identify any concerning themes like:
+    - Bullying or conflict with others
+    - Physical hurt or pain
+    - Family stress or problems
+    - Isolation or loneliness
+
+    Respond with just the six scores, one per line, like "happiness: 0.8".
+""")
+
+_SCORE = re.compile(r'\b(happiness|sadness|fear|anger|surprise|neutral)\b\W{0,3}(\d+(?:\.\d+)?)', re.IGNORECASE)
+
 class EmotionDetectorAgent:
     """
     Detects emotions from text and voice inputs.
@@ -14,7 +42,7 @@ class EmotionDetectorAgent:
     """
     
     def __init__(self):
-        self.gemini = GeminiClient()
+        self.gemini = GeminiClient('emotion_detector')
         self.alert_threshold = config.EMOTION_ALERT_THRESHOLD
         
     async def analyze_emotion(self, 
@@ -32,9 +60,30 @@ class EmotionDetectorAgent:
         text_emotions = await self._analyze_text_emotions(text)
         
         # Check for concerning keywords
-        concerns = self._check_concerns(text)
+        concerns = await cpu_pool.run(self._check_concerns, text)
         
-        # Combine all signals
+        result = self._build_result(text_emotions, concerns, mood, audio_features)
+        print(f"[EmotionDetector] Analysis complete. Alerts: {len(result['alerts'])}, Sentiment: {result['overall_sentiment']}")
+        return result
+    
+    async def analyze_emotions(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        analyze_emotion for many inputs at once (batch story creation).
+        items are analyze_emotion keyword arguments; the keyword passes for
+        every text run in one worker round trip.
+        """
+        signals = await cpu_pool.run(self._analyze_texts, [item.get('text') or '' for item in items])
+        results = [
+            self._build_result(text_emotions, concerns, item.get('mood', 'neutral'), item.get('audio_features'))
+            for item, (text_emotions, concerns) in zip(items, signals)
+        ]
+        print(f"[EmotionDetector] Batch analysis complete. Inputs: {len(items)}, "
+              f"Alerts: {sum(len(result['alerts']) for result in results)}")
+        return results
+    
+    def _build_result(self, text_emotions: Dict[str, float], concerns: List[str],
+                      mood: str, audio_features: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Combine the signals of one input and generate its alerts"""
         combined_emotions = self._combine_emotion_signals(
             text_emotions, mood, audio_features
         )
@@ -42,7 +91,7 @@ class EmotionDetectorAgent:
         # Generate alerts if needed
         alerts = self._generate_alerts(combined_emotions, concerns)
         
-        result = {
+        return {
             'emotions': combined_emotions,
             'mood': mood,
             'concerns': concerns,
@@ -51,45 +100,65 @@ class EmotionDetectorAgent:
             'overall_sentiment': self._calculate_overall_sentiment(combined_emotions)
         }
         
-        print(f"[EmotionDetector] Analysis complete. Alerts: {len(alerts)}, Sentiment: {result['overall_sentiment']}")
-        return result
+    def quick_analyze_emotion(self,
+                              text: str,
+                              mood: str = 'neutral',
+                              audio_features: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Provisional analysis from the keyword pass only, without any LLM call.
+        Used by the executor to start dependent work before analyze_emotion finishes.
+        """
+        combined_emotions = self._combine_emotion_signals(
+            self._rule_based_emotion_analysis(text or ''), mood, audio_features
+        )
+        return {
+            'emotions': combined_emotions,
+            'mood': mood,
+            'provisional': True
+        }
         
     async def _analyze_text_emotions(self, text: str) -> Dict[str, float]:
-        """Use Gemini to analyze emotional content"""
-        
-        prompt = f"""
-        Analyze the emotional content of this child's statement.
-        Consider their age and be sensitive to subtle emotional cues.
-        
-        Statement: "{text}"
-        
-        Score each emotion from 0-1:
-        - happiness: joy, excitement, contentment, fun, play
-        - sadness: disappointment, loneliness, grief, missing someone
-        - fear: worry, anxiety, scared, nervous
-        - anger: frustration, annoyance, mad, upset
-        - surprise: amazement, confusion, wonder
-        - neutral: calm, balanced, matter-of-fact
-        
-        Also identify any concerning themes like:
-        - Bullying or conflict with others
-        - Physical hurt or pain
-        - Family stress or problems
-        - Isolation or loneliness
-        
-        Respond with just the emotion scores as a simple assessment.
         """
-        
+        Keyword scores, averaged with Gemini's reading of the text when it is
+        available. The keyword scores alone are the quick_analyze_emotion
+        result, so a story started from them is re-issued when Gemini's
+        reading puts the child in a different emotion bucket.
+        """
         try:
-            # For MVP, use rule-based analysis with some Gemini enhancement
-            emotions = await self._rule_based_emotion_analysis(text)
-            return emotions
+            emotions = await cpu_pool.run(self._rule_based_emotion_analysis, text)
         except Exception as e:
             print(f"[EmotionDetector] Error in text analysis: {e}")
             # Fallback to basic analysis
             return self._basic_emotion_analysis(text)
         
-    def _rule_based_emotion_analysis(self, text: str) -> Dict[str, float]:
+        if not config.EMOTION_LLM_ANALYSIS or not text.strip() or self.gemini.mock_mode or self.gemini.circuit_open:
+            return emotions
+        
+        prompt = EMOTION_PROMPT.render(
+            text=fit_to_budget(text, input_budget('emotion_detector'))
+        )
+        try:
+            scores = self._parse_scores(await self.gemini.generate(prompt, temperature=0.2, max_tokens=100))
+        except Exception as e:
+            print(f"[EmotionDetector] Gemini analysis failed, using keyword scores: {e}")
+            return emotions
+        
+        return {
+            emotion: round((score + scores[emotion]) / 2, 4) if emotion in scores else score
+            for emotion, score in emotions.items()
+        }
+        
+    @staticmethod
+    def _parse_scores(response: str) -> Dict[str, float]:
+        """Emotion scores named in a model response, clamped to 0-1"""
+        return {
+            emotion.lower(): min(1.0, max(0.0, float(value)))
+            for emotion, value in _SCORE.findall(response or '')
+        }
+        
+    @staticmethod
+    @cpu_bound(inline_below=4096)
+    def _rule_based_emotion_analysis(text: str) -> Dict[str, float]:
         """Rule-based emotion analysis with keyword matching"""
         text_lower = text.lower()
         emotions = {
@@ -144,7 +213,18 @@ class EmotionDetectorAgent:
             'neutral': 0.0
         }
         
-    def _check_concerns(self, text: str) -> List[str]:
+    @staticmethod
+    @cpu_bound
+    def _analyze_texts(texts: List[str]) -> List[tuple]:
+        """Keyword emotion scores and concerns of several texts"""
+        return [
+            (EmotionDetectorAgent._rule_based_emotion_analysis(text), EmotionDetectorAgent._check_concerns(text))
+            for text in texts
+        ]
+    
+    @staticmethod
+    @cpu_bound(inline_below=4096)
+    def _check_concerns(text: str) -> List[str]:
         """Check for concerning keywords or phrases"""
         concerns = []
         text_lower = text.lower()
@@ -1,51 +1,109 @@
 """
 Illustrator Agent - Creates visual elements for stories
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import asyncio
 import uuid
+from urllib.parse import quote_plus
 
 from tools.gemini_tools import GeminiClient
+from tools.prompts import prompts, fit_to_budget, input_budget
+from tools.character_designs import CharacterDesignCache, normalise_character
+from tools.images import ImagePipeline
 from config import config
 
+SCENE_PROMPT = prompts.register('illustrator.scene', """
+    Create a detailed image generation prompt for this children's story scene.
+    Make it perfect for AI image generation.
+
+    Scene: "{scene_text}"
+
+    Guidelines:
+    - Child-friendly, whimsical illustration style
+    - Bright, warm, inviting colors
+    - Safe, positive atmosphere
+    - Include specific visual details about characters and setting
+    - Describe character appearances (clothing, expressions, poses)
+    - Set the scene with background elements
+    - Use watercolor or digital painting style
+    - Suitable for ages 3-8
+
+    Format: One detailed paragraph description for an AI image generator.
+    Start with "Children's book illustration:"
+""")
+
+CHARACTER_PROMPT = prompts.register('illustrator.character', """
+    Create a character design for a {character} in a children's story.
+
+    Character: {character}
+    Target age: {age} years old
+    Favorite colors: {favorite_colors}
+
+    Design a friendly, approachable character that a {age}-year-old would love.
+    Include specific details about:
+    - Appearance and clothing
+    - Facial expression (always happy/kind)
+    - Color scheme using the child's favorite colors
+    - Any magical or special features
+
+    Style: Child-friendly cartoon illustration, soft and warm
+""")
+
+# Style of character designs when none is asked for
+DEFAULT_STYLE = 'child-friendly cartoon'
+
 class IllustratorAgent:
     """
-    Generates image prompts and manages visual elements for stories.
-    In production, would integrate with image generation APIs.
+    Generates image prompts and renders visual elements for stories.
     """
     
-    def __init__(self):
-        self.gemini = GeminiClient()
+    def __init__(self, memory: Any = None, images: ImagePipeline = None):
+        self.gemini = GeminiClient('illustrator')
+        self.designs = CharacterDesignCache(memory)
+        self.images = images or ImagePipeline()
         
-    async def create_scene_images(self, story_id: str, scenes: List[Dict] = None) -> Dict[str, Any]:
+    async def create_scene_images(self, story_id: str, scenes: List[Dict] = None,
+                                  child_id: str = None, style: str = DEFAULT_STYLE) -> Dict[str, Any]:
         """
-        Create image descriptions for story scenes.
-        
-        In production, this would:
+        Create images for story scenes:
         1. Generate detailed prompts using Gemini
-        2. Call image generation API (Vertex AI Imagen)
-        3. Store images in Cloud Storage
-        4. Return URLs
+        2. Render them with the configured image backend
+        3. Store originals, WebP and thumbnail variants in the image store
+        4. Return URLs (placeholders for scenes that failed to render)
         
-        For MVP, returns placeholder data with enhanced prompts.
+        Character references use designs in the scene's 'style', or style.
+        Planned as a background stage, so the story text is returned first.
         """
         
         print(f"[Illustrator] Creating images for story {story_id}")
         
-        # For MVP, create placeholder image data with enhanced prompts
         image_results = []
         
         if scenes:
-            for scene in scenes:
-                # Generate enhanced image prompt using Gemini
-                enhanced_prompt = await self._enhance_image_prompt(scene['text'])
-                
-                # Create placeholder image data
+            # Generate enhanced image prompts using Gemini, all scenes at once
+            enhanced_prompts = await asyncio.gather(
+                *(self._enhance_image_prompt(scene['text']) for scene in scenes)
+            )
+            
+            # Known character designs keep recurring characters consistent
+            if child_id:
+                enhanced_prompts = [
+                    await self._with_character_designs(child_id, scene['text'], enhanced_prompt,
+                                                       scene.get('style', style))
+                    for scene, enhanced_prompt in zip(scenes, enhanced_prompts)
+                ]
+            
+            rendered = await asyncio.gather(
+                *(self._render_image(enhanced_prompt) for enhanced_prompt in enhanced_prompts)
+            )
+            
+            for scene, enhanced_prompt, urls in zip(scenes, enhanced_prompts, rendered):
                 image_data = {
                     'sceneNumber': scene['sceneNumber'],
                     'prompt': enhanced_prompt,
-                    'imageUrl': self._generate_placeholder_url(scene['sceneNumber'], enhanced_prompt),
-                    'thumbnailUrl': self._generate_thumbnail_url(scene['sceneNumber'])
+                    'imageUrl': urls['original'] if urls else self._generate_placeholder_url(scene['sceneNumber'], enhanced_prompt),
+                    'webpUrl': urls['webp'] if urls else None,
+                    'thumbnailUrl': urls['thumb'] if urls else self._generate_thumbnail_url(scene['sceneNumber'])
                 }
                 
                 image_results.append(image_data)
@@ -57,28 +115,33 @@ class IllustratorAgent:
             'total_images': len(image_results)
         }
         
-    async def _enhance_image_prompt(self, scene_text: str) -> str:
-        """Use Gemini to create detailed image generation prompt"""
+    async def _render_image(self, prompt: str) -> Optional[Dict[str, str]]:
+        """Render and store one image, or None so the caller can use a placeholder"""
+        try:
+            return await self.images.create(prompt)
+        except Exception as e:
+            print(f"[Illustrator] Error rendering image: {e}")
+            return None
         
-        prompt = f"""
-        Create a detailed image generation prompt for this children's story scene.
-        Make it perfect for AI image generation.
+    async def _with_character_designs(self, child_id: str, scene_text: str, prompt: str, style: str) -> str:
+        """Prefix a scene prompt with the designs, in its style, of characters that appear in it"""
+        designs = await self.designs.mentioned_in(child_id, scene_text, style)
+        if not designs:
+            return prompt
         
-        Scene: "{scene_text}"
+        references = ' '.join(
+            f"Character reference ({design['character']}): {design['prompt']}" for design in designs
+        )
+        return f"{references}\n{prompt}"
         
-        Guidelines:
-        - Child-friendly, whimsical illustration style
-        - Bright, warm, inviting colors
-        - Safe, positive atmosphere
-        - Include specific visual details about characters and setting
-        - Describe character appearances (clothing, expressions, poses)
-        - Set the scene with background elements
-        - Use watercolor or digital painting style
-        - Suitable for ages 3-8
+    async def _enhance_image_prompt(self, scene_text: str) -> str:
+        """Use Gemini to create detailed image generation prompt"""
+        if self.gemini.circuit_open:
+            return self._create_fallback_prompt(scene_text)
         
-        Format: One detailed paragraph description for an AI image generator.
-        Start with "Children's book illustration:"
-        """
+        prompt = SCENE_PROMPT.render(
+            scene_text=fit_to_budget(scene_text, input_budget('illustrator'))
+        )
         
         try:
             enhanced = await self.gemini.generate(prompt, temperature=0.7, max_tokens=200)
@@ -139,42 +202,55 @@ class IllustratorAgent:
         
         return f"https://via.placeholder.com/200x150/{color}/4A4A4A?text=Scene+{scene_number}"
     
-    async def generate_character_avatar(self, character_description: str, child_preferences: Dict) -> Dict[str, str]:
-        """Generate avatar for recurring characters"""
-        # This would be used for character consistency across stories
-        avatar_prompt = await self._create_character_prompt(character_description, child_preferences)
+    async def generate_character_avatar(self, character_description: str, child_preferences: Dict,
+                                        child_id: str = None,
+                                        style: str = DEFAULT_STYLE) -> Dict[str, str]:
+        """
+        Generate avatar for recurring characters.
+        Designs are cached per child, so a repeat character costs no LLM call
+        and looks the same in every story.
+        """
+        if child_id:
+            cached = await self.designs.get(child_id, character_description, style)
+            if cached:
+                return {**cached, 'cached': True}
         
-        return {
+        design_prompt = await self._create_character_prompt(character_description, child_preferences)
+        avatar = {
             'character': character_description,
-            'prompt': avatar_prompt,
-            'avatarUrl': f"https://via.placeholder.com/200x200/FFE4E1/8B4513?text={character_description}",
-            'style': 'child-friendly cartoon'
+            'characterKey': normalise_character(character_description),
+            'prompt': design_prompt or self._fallback_character_prompt(character_description),
+            'avatarUrl': f"https://via.placeholder.com/200x200/FFE4E1/8B4513?text={quote_plus(character_description)}",
+            'style': style
         }
-    
-    async def _create_character_prompt(self, character: str, preferences: Dict) -> str:
-        """Create consistent character appearance prompt"""
-        age = preferences.get('age', 5)
-        favorite_colors = preferences.get('favoriteColors', ['rainbow'])
         
-        prompt = f"""
-        Create a character design for a {character} in a children's story.
+        # Fallback designs are not cached so a real design replaces them later
+        if child_id and design_prompt:
+            await self.designs.put(child_id, character_description, style, avatar)
         
-        Character: {character}
-        Target age: {age} years old
-        Favorite colors: {', '.join(favorite_colors)}
+        return {**avatar, 'cached': False}
+    
+    async def _create_character_prompt(self, character: str, preferences: Dict) -> Optional[str]:
+        """Create consistent character appearance prompt, or None if Gemini is unavailable"""
+        if self.gemini.circuit_open:
+            return None
         
-        Design a friendly, approachable character that a {age}-year-old would love.
-        Include specific details about:
-        - Appearance and clothing
-        - Facial expression (always happy/kind)
-        - Color scheme using the child's favorite colors
-        - Any magical or special features
+        age = preferences.get('age', 5)
+        favorite_colors = preferences.get('favoriteColors', ['rainbow'])
         
-        Style: Child-friendly cartoon illustration, soft and warm
-        """
+        prompt = CHARACTER_PROMPT.render(
+            character=fit_to_budget(character, input_budget('illustrator')),
+            age=age,
+            favorite_colors=', '.join(favorite_colors)
+        )
         
         try:
             character_design = await self.gemini.generate(prompt, temperature=0.6)
             return f"Character design: {character_design}"
-        except:
-            return f"Friendly {character} character with warm colors, kind expression, child-friendly cartoon style"
\ No newline at end of file
+        except Exception as e:
+            print(f"[Illustrator] Error creating character design: {e}")
+            return None
+    
+    def _fallback_character_prompt(self, character: str) -> str:
+        """Local character prompt used when no design could be generated"""
+        return f"Friendly {character} character with warm colors, kind expression, child-friendly cartoon style"
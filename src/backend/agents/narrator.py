@@ -0,0 +1,56 @@
+"""
+Narrator Agent - Reads stories aloud for children who cannot read yet
+"""
+from typing import Dict, Any, List, Optional
+import asyncio
+
+from tools.narration import NarrationPipeline
+from config import config
+
+class NarratorAgent:
+    """
+    Synthesises narration for each scene of a story.
+    """
+    
+    def __init__(self, narration: NarrationPipeline = None):
+        self.narration = narration or NarrationPipeline()
+        
+    async def narrate_scenes(self, story_id: str, scenes: List[Dict] = None, child_id: str = None,
+                             voice: Optional[str] = None, speed: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Narrate story scenes concurrently (at most NARRATION_CONCURRENCY at
+        once), returning an audio URL per scene, or None for scenes that
+        could not be synthesised.
+        
+        Planned as a background stage alongside the illustrations, so the
+        story text is returned first.
+        """
+        voice = voice or config.NARRATION_VOICE
+        speed = speed or config.NARRATION_SPEED
+        print(f"[Narrator] Narrating story {story_id} (voice {voice}, speed {speed})")
+        
+        limit = asyncio.Semaphore(config.NARRATION_CONCURRENCY)
+        
+        async def narrate(scene: Dict) -> Optional[str]:
+            if not (scene.get('text') or '').strip():
+                return None
+            async with limit:
+                try:
+                    return await self.narration.narrate(scene.get('text', ''), voice, speed)
+                except Exception as e:
+                    print(f"[Narrator] Error narrating scene {scene.get('sceneNumber')}: {e}")
+                    return None
+        
+        scenes = scenes or []
+        urls = await asyncio.gather(*(narrate(scene) for scene in scenes))
+        
+        return {
+            'storyId': story_id,
+            'narration': [
+                {'sceneNumber': scene['sceneNumber'], 'audioUrl': url}
+                for scene, url in zip(scenes, urls)
+            ],
+            'voice': voice,
+            'speed': speed,
+            'status': 'complete'
+        }
@@ -1,22 +1,87 @@
 """
 Storyteller Agent - Generates personalized stories using Gemini
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import asyncio
 import uuid
 from datetime import datetime
 
 from tools.gemini_tools import GeminiClient
+from tools.prompts import prompts, fit_to_budget, input_budget
+from tools.story_elements import extract_story_elements
 from config import config
 
+STORY_PROMPT = prompts.register('storyteller.story', """
+    Create a magical children's story for a {age}-year-old based on this input:
+
+    Child's words: "{input_text}"
+
+    {char_string}
+    {edu_string}
+    Include these elements: {elements}
+    {emotion_note}
+    {variation_note}
+
+    Guidelines:
+    - Create exactly {scene_count} short scenes
+    - Each scene should be 2-3 sentences max
+    - Use simple, age-appropriate language for a {age}-year-old
+    - Make it engaging and imaginative
+    - Include a gentle lesson or positive message
+    - Start each scene with "Scene X:" where X is the scene number
+    - Give the story a creative title on the first line
+    - Keep it positive and child-friendly
+
+    Format:
+    Title: [Creative Story Title]
+
+    Scene 1: [First scene text - 2-3 sentences]
+
+    Scene 2: [Second scene text - 2-3 sentences]
+
+    Scene 3: [Third scene text - 2-3 sentences]
+
+    Scene 4: [Fourth scene text - 2-3 sentences]
+
+    Scene 5: [Fifth scene text - 2-3 sentences with happy ending]
+""")
+
 class StorytellerAgent:
     """
     Creates engaging, educational stories based on child input.
     Incorporates child preferences, educational goals, and safety guidelines.
     """
     
+    # Prompt line added for each emotion bucket
+    EMOTION_NOTES = {
+        'sad': "The child seems sad, so make the story uplifting and reassuring with positive outcomes.",
+        'fear': "The child seems worried, so make the story calming and safe with brave characters.",
+        'excited': "The child is excited, so make the story adventurous and fun!"
+    }
+    
     def __init__(self):
-        self.gemini = GeminiClient()
+        self.gemini = GeminiClient('storyteller')
+        
+    @staticmethod
+    def emotion_bucket(emotion_context: Dict[str, float] = None) -> Optional[str]:
+        """Classify emotion scores into the bucket that shapes the story prompt"""
+        if not emotion_context:
+            return None
+        if emotion_context.get('sadness', 0) > 0.5:
+            return 'sad'
+        if emotion_context.get('fear', 0) > 0.5:
+            return 'fear'
+        if emotion_context.get('excitement', 0) > 0.7:
+            return 'excited'
+        return None
+        
+    def speculation_key(self, params: Dict[str, Any]) -> Optional[str]:
+        """
+        Key used by the executor for speculative generation.
+        A story started from provisional emotions is kept when the final
+        analysis maps to the same key, since the prompt would be identical.
+        """
+        return self.emotion_bucket(params.get('emotion_context'))
         
     async def generate_story(self, 
                            input_text: str,
@@ -24,9 +89,12 @@ class StorytellerAgent:
                            preferences: Dict[str, Any],
                            educational_focus: List[str],
                            include_elements: List[str],
-                           emotion_context: Dict[str, float] = None) -> Dict[str, Any]:
+                           emotion_context: Dict[str, float] = None,
+                           similar_story: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Generate a complete story with multiple scenes.
+        similar_story ({'id', 'title'}) is an earlier story from nearly the
+        same input, which the new story should differ from.
         
         Returns:
             Dictionary containing story metadata and scenes
@@ -34,12 +102,22 @@ class StorytellerAgent:
         
         # Build comprehensive prompt
         prompt = self._build_story_prompt(
-            input_text, preferences, educational_focus, include_elements, emotion_context
+            input_text, preferences, educational_focus, include_elements, emotion_context, similar_story
         )
         
-        # Generate story
+        # Generate story, going straight to the offline templates while Gemini is unhealthy
         print(f"[Storyteller] Generating story for child {child_id}")
-        story_text = await self.gemini.generate(prompt, temperature=0.8, max_tokens=2000)
+        offline = self.gemini.circuit_open
+        if not offline:
+            try:
+                story_text = await self.gemini.generate(prompt, temperature=0.8, max_tokens=2000)
+            except Exception as e:
+                print(f"[Storyteller] Error generating story, using offline templates: {e}")
+                offline = True
+        if offline:
+            story_text = self._create_offline_story(
+                input_text, preferences, educational_focus, include_elements, emotion_context
+            )
         
         # Parse story into scenes
         scenes = self._parse_story_scenes(story_text)
@@ -55,17 +133,21 @@ class StorytellerAgent:
                 'educationalTopics': educational_focus,
                 'includedElements': include_elements,
                 'emotionContext': emotion_context,
+                'variedFrom': (similar_story or {}).get('id'),
+                'generatedOffline': offline,
                 'createdAt': datetime.now().isoformat()
             },
             'status': 'complete'
         }
+        # Characters and themes, counted towards the child's favourites when stored
+        story_doc.update(extract_story_elements(story_doc, input_text, include_elements, preferences))
         
         print(f"[Storyteller] Generated story '{story_doc['title']}' with {len(scenes)} scenes")
         return story_doc
         
     def _build_story_prompt(self, input_text: str, preferences: Dict, 
                            educational_focus: List[str], include_elements: List[str],
-                           emotion_context: Dict = None) -> str:
+                           emotion_context: Dict = None, similar_story: Dict = None) -> str:
         """Build comprehensive prompt for story generation"""
         
         # Get child's age for appropriate language
@@ -79,50 +161,69 @@ class StorytellerAgent:
         edu_string = f"Subtly teach about: {', '.join(educational_focus)}" if educational_focus else ""
         
         # Emotion-aware adjustments
-        emotion_note = ""
-        if emotion_context:
-            if emotion_context.get('sadness', 0) > 0.5:
-                emotion_note = "The child seems sad, so make the story uplifting and reassuring with positive outcomes."
-            elif emotion_context.get('fear', 0) > 0.5:
-                emotion_note = "The child seems worried, so make the story calming and safe with brave characters."
-            elif emotion_context.get('excitement', 0) > 0.7:
-                emotion_note = "The child is excited, so make the story adventurous and fun!"
-            
-        prompt = f"""
-        Create a magical children's story for a {age}-year-old based on this input:
-        
-        Child's words: "{input_text}"
-        
-        {char_string}
-        {edu_string}
-        Include these elements: {', '.join(include_elements)}
-        {emotion_note}
-        
-        Guidelines:
-        - Create exactly {config.MIN_STORY_SCENES} short scenes
-        - Each scene should be 2-3 sentences max
-        - Use simple, age-appropriate language for a {age}-year-old
-        - Make it engaging and imaginative
-        - Include a gentle lesson or positive message
-        - Start each scene with "Scene X:" where X is the scene number
-        - Give the story a creative title on the first line
-        - Keep it positive and child-friendly
+        emotion_note = self.EMOTION_NOTES.get(self.emotion_bucket(emotion_context), "")
         
-        Format:
-        Title: [Creative Story Title]
-        
-        Scene 1: [First scene text - 2-3 sentences]
+        # The child told nearly the same thing before - avoid retelling that story
+        variation_note = (
+            f'The child already has a story called "{similar_story["title"]}" about this. '
+            "Make this one different: a new setting, a new twist and a different title."
+        ) if similar_story else ""
+            
+        return STORY_PROMPT.render(
+            age=age,
+            input_text=fit_to_budget(input_text, input_budget('storyteller')),
+            char_string=char_string,
+            edu_string=edu_string,
+            elements=', '.join(include_elements),
+            emotion_note=emotion_note,
+            variation_note=variation_note,
+            scene_count=config.MIN_STORY_SCENES
+        )
         
-        Scene 2: [Second scene text - 2-3 sentences]
+    def _create_offline_story(self, input_text: str, preferences: Dict,
+                              educational_focus: List[str], include_elements: List[str],
+                              emotion_context: Dict = None) -> str:
+        """
+        Template-based story used when Gemini is unavailable.
+        Returns text in the same Title/Scene format as the model so it parses the same way.
+        """
+        favorite_chars = preferences.get('favoriteCharacters') or ['little explorer']
+        elements = [e for e in include_elements if e] or ['a shiny pebble']
+        hero = favorite_chars[0]
+        friend = favorite_chars[1] if len(favorite_chars) > 1 else 'a kind friend'
+        setting = elements[0]
+        lesson = educational_focus[0] if educational_focus else 'kindness'
         
-        Scene 3: [Third scene text - 2-3 sentences]
+        # Pick a title deterministically so retries of the same input match
+        titles = [
+            f"The {hero.title()} and the {setting.title()}",
+            f"A Day of {lesson.title()}",
+            f"{hero.title()}'s Big Adventure"
+        ]
+        title = titles[sum(map(ord, input_text or '')) % len(titles)]
         
-        Scene 4: [Fourth scene text - 2-3 sentences]
+        bucket = self.emotion_bucket(emotion_context)
+        if bucket == 'sad':
+            middle = f"{hero.capitalize()} felt a little sad, but {friend} gave a warm hug. Together they found that sharing feelings makes them lighter."
+        elif bucket == 'fear':
+            middle = f"Something seemed scary at first, but {hero} took a deep breath. With {friend} close by, everything felt safe again."
+        else:
+            middle = f"{hero.capitalize()} and {friend} laughed and explored. Every corner held a new surprise."
         
-        Scene 5: [Fifth scene text - 2-3 sentences with happy ending]
-        """
+        other_elements = ', '.join(elements[1:]) or 'lots of wonderful things'
+        scenes = [
+            f"Once upon a time, a cheerful {hero} set off to find {setting}. The sun was bright and the sky was full of fluffy clouds.",
+            f"Along the way, {hero} met {friend}, who wanted to come along. They saw {other_elements}.",
+            middle,
+            f"When a friend needed help, {hero} remembered to show {lesson}. Everyone smiled and felt proud.",
+            f"At the end of the day, {hero} and {friend} went home happy. It had been the best adventure ever!"
+        ]
         
-        return prompt
+        lines = [f"Title: {title}", ""]
+        for number, text in enumerate(scenes, 1):
+            lines.append(f"Scene {number}: {text}")
+            lines.append("")
+        return '\n'.join(lines)
         
     def _parse_story_scenes(self, story_text: str) -> List[Dict[str, Any]]:
         """Parse generated story into structured scenes"""
@@ -1,20 +1,39 @@
 """
 FastAPI server for StoryGrow API
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from tools.startup import startup, LazyComponent
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
+import asyncio
+import hashlib
+import json
 import uuid
 import os
+import time
+from collections import Counter
 from datetime import datetime
 
 from config import config
-from planner import Planner
-from executor import Executor
 from memory_pg import MemoryPG
 from database import db
+from tools.metrics import metrics
+from tools.gemini_tools import set_request_deadline, gemini_breaker
+from tools.images import ImageStore
+from tools.narration import AudioStore, MEDIA_TYPES, MIN_SPEED, MAX_SPEED, byte_range
+from tools.cpu_pool import cpu_pool, encode_json
+from tools.single_flight import SingleFlight
+from tools.admission import admission, AdmissionRejected
+from tools.alert_stream import alert_hub
+from tools.near_duplicates import near_duplicates, input_signature, NearMatch
+from tools.emotion_analytics import EmotionSeries
+from tools.partitions import partitions
+from auth import auth, AuthMiddleware
+
+startup.record('import.api_server', time.monotonic() - startup.started)
 
 # Create FastAPI app
 app = FastAPI(
@@ -23,6 +42,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Resolve session tokens (added before CORS so 401s still carry CORS headers)
+app.add_middleware(AuthMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -32,33 +54,72 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize core components
-planner = Planner()
-executor = Executor()
+# Core components are built on first use (or by the startup warm-up)
+planner = LazyComponent('planner:Planner')
+executor = None  # Will be initialized with the memory backend after DB connection
 memory = None  # Will be initialized after DB connection
+image_store = ImageStore()
+audio_store = AudioStore()
+story_flights = SingleFlight('story.create')  # duplicate story requests in flight on this worker
 
 # Startup event to connect to database
 @app.on_event("startup")
 async def startup_event():
     """Connect to database on startup"""
-    global memory
-    connected = await db.connect()
-    if connected:
-        print("[API] Database connected successfully")
-        # Initialize PostgreSQL memory after DB connection
-        memory = MemoryPG(db)
-        print("[API] PostgreSQL memory initialized")
-    else:
-        print("[API] Warning: Database connection failed")
-        # Fallback to Firestore memory if PG fails
-        from memory import Memory
-        memory = Memory()
-        print("[API] Falling back to Firestore memory")
+    global memory, executor
+    with startup.timed('init.cpu_pool'):
+        await cpu_pool.start()
+    with startup.timed('init.database'):
+        connected = await db.connect()
+    with startup.timed('init.memory'):
+        if connected:
+            print("[API] Database connected successfully")
+            # Initialize PostgreSQL memory after DB connection
+            memory = MemoryPG(db)
+            print("[API] PostgreSQL memory initialized")
+            await alert_hub.start(db)
+            auth.start(db)
+            partitions.start(db)
+        else:
+            print("[API] Warning: Database connection failed")
+            # Fallback to Firestore memory if PG fails
+            from memory import Memory
+            memory = Memory()
+            print("[API] Falling back to Firestore memory")
+    
+    # The executor's memory agent, design cache and near-duplicate index use the same backend
+    executor = LazyComponent('executor:Executor', memory=memory)
+    near_duplicates.start(memory)
+    
+    if config.STARTUP_WARMUP:
+        with startup.timed('warm_up'):
+            await _warm_up()
+    startup.print_report()
+
+async def _warm_up():
+    """Build the agents, open database connections and the LLM connection before serving"""
+    planner.get()
+    executor.get()
+    
+    if db.pool:
+        async def ping():
+            async with db.acquire() as conn:
+                await conn.fetchval('SELECT 1')
+        await asyncio.gather(*(ping() for _ in range(min(4, db.pool_max_size))),
+                             return_exceptions=True)
+    
+    await executor.agents['storyteller'].gemini.warm_up()
 
 # Shutdown event to disconnect from database
 @app.on_event("shutdown")
 async def shutdown_event():
     """Disconnect from database on shutdown"""
+    if executor is not None and executor.built:
+        await executor.drain(timeout=config.SERVER_GRACEFUL_TIMEOUT)
+    await alert_hub.stop()
+    await auth.stop()
+    await partitions.stop()
+    cpu_pool.shutdown()
     await db.disconnect()
 
 # Request/Response models
@@ -69,6 +130,10 @@ class StoryRequest(BaseModel):
     session_mood: str = "neutral"
     educational_focus: Optional[List[str]] = []
     include_elements: Optional[List[str]] = []
+    allow_reuse: bool = True  # False always writes a new story, even for a retold input
+    narrate: bool = True  # read the scenes aloud (unless NARRATION_ENABLED is off)
+    narration_voice: Optional[str] = Field(None, pattern=r'^[A-Za-z0-9-]{1,64}$')
+    narration_speed: Optional[float] = Field(None, ge=MIN_SPEED, le=MAX_SPEED)
 
 class StoryResponse(BaseModel):
     story_id: str
@@ -82,6 +147,17 @@ class ChildProfile(BaseModel):
     avatar: Optional[Dict[str, Any]] = None
     preferences: Optional[Dict[str, Any]] = None
 
+class BatchStoryRequest(BaseModel):
+    stories: List[StoryRequest]
+
+class NarrationRequest(BaseModel):
+    voice: Optional[str] = Field(None, pattern=r'^[A-Za-z0-9-]{1,64}$')
+    speed: Optional[float] = Field(None, ge=MIN_SPEED, le=MAX_SPEED)
+
+class MarkAlertsReadRequest(BaseModel):
+    parent_id: str
+    alert_ids: List[str]
+
 # API Routes
 @app.get("/")
 async def root():
@@ -102,10 +178,17 @@ async def health_check():
         "components": {
             "api": "running",
             "memory": "connected" if memory.db else "disconnected",
-            "gemini": "configured" if config.GEMINI_API_KEY else "not configured"
+            "gemini": "configured" if config.GEMINI_API_KEY else "not configured",
+            "gemini_circuit": gemini_breaker.status()
         }
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """In-process metrics (counters, gauges and latency summaries)"""
+    db.pool_stats()  # refresh the pool gauges
+    return metrics.snapshot()
+
 @app.get("/database/test")
 async def test_database():
     """Test database connection and return info"""
@@ -132,8 +215,9 @@ async def test_database():
         )
 
 @app.post("/database/init")
-async def initialize_database():
+async def initialize_database(http_request: Request):
     """Initialize database tables from schema"""
+    _authorize_admin(http_request)
     try:
         # Check if already connected
         if not db.pool:
@@ -160,12 +244,96 @@ async def initialize_database():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/story/create", response_model=StoryResponse)
-async def create_story(request: StoryRequest):
+async def create_story(request: StoryRequest, http_request: Request):
     """
     Create a new story from child input.
     This is the main endpoint that orchestrates all agents.
+    Retries are idempotent: send the same Idempotency-Key header (or the
+    same input within STORY_DEDUP_WINDOW) to get the first request's story.
+    """
+    _authorize_child(http_request, request.child_id)
+    key, ttl = _story_request_key(request, http_request.headers.get('idempotency-key'))
+    family = await _family_of(http_request, request.child_id)
+    return await story_flights.do(key, _create_story_once, request, key, ttl, family)
+
+async def _create_story_once(request: StoryRequest, key: str, ttl: float, family: str,
+                             lane: str = 'interactive', preloaded: Optional[Dict] = None) -> StoryResponse:
+    """Generate the story unless another worker already has, or is, for this key"""
+    if not hasattr(memory, 'claim_story_request'):
+        return await _admitted_story(request, family, lane, preloaded)
+    
+    try:
+        existing = await memory.claim_story_request(key, request.child_id, ttl)
+    except Exception as e:
+        # Unknown child or database trouble - generate without deduplication
+        print(f"[API] Could not claim story request: {e}")
+        return await _admitted_story(request, family, lane, preloaded)
+    if existing is not None:
+        metrics.increment('story.create.deduplicated')
+        return await _await_story_request(request, key, ttl, family, lane, preloaded, existing)
+    
+    try:
+        response = await _admitted_story(request, family, lane, preloaded)
+    except BaseException:
+        await asyncio.shield(memory.release_story_request(key))
+        raise
+    
+    if response.story_id == 'unknown':
+        await memory.release_story_request(key)
+    else:
+        await memory.complete_story_request(key, response.model_dump())
+    return response
+
+async def _await_story_request(request: StoryRequest, key: str, ttl: float, family: str, lane: str,
+                               preloaded: Optional[Dict], existing: Dict) -> StoryResponse:
+    """Wait for a duplicate request being generated by another worker"""
+    deadline = time.monotonic() + config.STORY_REQUEST_DEADLINE
+    while existing is not None and existing['status'] != 'completed':
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=409, detail="An identical story request is still being processed")
+        await asyncio.sleep(0.5)
+        existing = await memory.get_story_request(key)
+    
+    if existing is None:
+        # The other request failed and released the key - generate it here
+        return await _create_story_once(request, key, ttl, family, lane, preloaded)
+    return StoryResponse(**existing['response'])
+
+async def _admitted_story(request: StoryRequest, family: str, lane: str,
+                          preloaded: Optional[Dict] = None) -> StoryResponse:
+    """Generate the story once admission control gives it a slot (raises AdmissionRejected)"""
+    similar = await _similar_story(request)
+    if similar and request.allow_reuse and similar.similarity >= config.NEAR_DUPLICATE_REUSE_THRESHOLD:
+        # The child retold an earlier input almost word for word - serve that story,
+        # but still track how they felt today and alert parents to any concerns
+        emotions = (preloaded or {}).get('emotion_detector.analyze_emotion')
+        if emotions is None:
+            emotions = await executor.agents['emotion_detector'].analyze_emotion(
+                request.text_input or '', request.session_mood)
+        await _store_session(request, similar.story_id, emotions)
+        metrics.increment('story.create.reused')
+        return StoryResponse(story_id=similar.story_id, status='reused', preview=similar.title, processing_time=0.0)
+    
+    async with admission.admit(family, MemoryPG.DEMO_MAPPINGS.get(request.child_id, request.child_id), lane):
+        return await _generate_story(request, family, preloaded, similar)
+
+async def _similar_story(request: StoryRequest) -> Optional[NearMatch]:
+    """The child's earlier story with nearly the same text input, if any"""
+    try:
+        return await near_duplicates.find(request.child_id, input_signature(request.text_input))
+    except Exception as e:
+        print(f"[API] Near-duplicate lookup failed: {e}")
+        return None
+
+async def _generate_story(request: StoryRequest, family: str, preloaded: Optional[Dict] = None,
+                          similar: Optional[NearMatch] = None) -> StoryResponse:
+    """
+    Run the planner and executor for a story request and store the results.
+    similar is an earlier story from nearly the same input; the storyteller
+    is asked to make this one different.
     """
     start_time = datetime.now()
+    set_request_deadline(config.STORY_REQUEST_DEADLINE)
     
     try:
         print(f"[API] Creating story for child {request.child_id}")
@@ -181,49 +349,38 @@ async def create_story(request: StoryRequest):
             'child_id': request.child_id,
             'session_mood': request.session_mood,
             'educational_focus': request.educational_focus or [],
-            'include_elements': request.include_elements or []
+            'include_elements': request.include_elements or [],
+            'similar_story': {'id': similar.story_id, 'title': similar.title} if similar else None,
+            'narrate': request.narrate,
+            'narration_voice': request.narration_voice,
+            'narration_speed': request.narration_speed
         }
         
         # Plan tasks
         tasks = await planner.plan(planner_input)
         
         # Execute tasks
-        results = await executor.execute(tasks)
+        results = await executor.execute(tasks, preloaded)
         
         # Extract story from results
         story = results.get('story', {})
         
-        # Store story in memory
+        # Store story in memory, with its input's signature for near-duplicate detection
         if story and story.get('id'):
+            signature = input_signature(request.text_input)
+            if signature:
+                story.setdefault('metadata', {})['inputSignature'] = signature
             await memory.store('stories', story['id'], story)
+            near_duplicates.add(request.child_id, story['id'], signature, story.get('title', ''))
             
-            # Store session data for emotional tracking
-            session_data = {
-                'childId': request.child_id,
-                'timestamp': datetime.now(),
-                'mood': request.session_mood,
-                'emotions': results.get('emotions', {}),
-                'storyId': story['id']
-            }
-            await memory.store('sessions', f"{request.child_id}_{datetime.now().timestamp()}", session_data)
+            await _store_session(request, story['id'], results.get('emotions', {}))
             
-            # Store alerts if any were generated
-            emotion_data = results.get('emotions', {})
-            if emotion_data.get('alerts'):
-                for alert in emotion_data['alerts']:
-                    alert_data = {
-                        'childId': request.child_id,
-                        'storyId': story['id'],
-                        'timestamp': datetime.now(),
-                        'type': alert.get('type', 'emotional_concern'),
-                        'severity': alert.get('severity', 'low'),
-                        'message': alert.get('message', ''),
-                        'concerns': emotion_data.get('concerns', []),
-                        'read': False
-                    }
-                    alert_id = f"{request.child_id}_alert_{datetime.now().timestamp()}"
-                    await memory.store('alerts', alert_id, alert_data)
-                    print(f"[API] Stored alert: {alert['message']}")
+            # Illustrations and narration render after the response and back-fill the stored scenes,
+            # queueing behind interactive and batch stories for a generation slot
+            executor.run_in_background(
+                results.get('background_tasks', []), on_complete=_store_background_result,
+                slot=lambda: admission.admit(family, lane='background')
+            )
             
         # Calculate processing time
         processing_time = (datetime.now() - start_time).total_seconds()
@@ -239,22 +396,136 @@ async def create_story(request: StoryRequest):
         print(f"[API] Error creating story: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to create story: {str(e)}")
 
+async def _store_session(request: StoryRequest, story_id: str, emotion_data: Dict):
+    """Store the session for emotional tracking, and any alerts its analysis raised"""
+    session_data = {
+        'childId': request.child_id,
+        'timestamp': datetime.now(),
+        'mood': request.session_mood,
+        'emotions': emotion_data,
+        'storyId': story_id
+    }
+    await memory.store('sessions', f"{request.child_id}_{datetime.now().timestamp()}", session_data)
+    
+    if emotion_data.get('alerts'):
+        alerts = [
+            {
+                'childId': request.child_id,
+                'storyId': story_id,
+                'timestamp': datetime.now(),
+                'type': alert.get('type', 'emotional_concern'),
+                'severity': alert.get('severity', 'low'),
+                'message': alert.get('message', ''),
+                'concerns': emotion_data.get('concerns', []),
+                'read': False
+            }
+            for alert in emotion_data['alerts']
+        ]
+        await memory.store_alerts(alerts)
+        print(f"[API] Stored {len(alerts)} alerts")
+
+@app.post("/api/story/batch")
+async def create_story_batch(batch: BatchStoryRequest, http_request: Request):
+    """
+    Create many stories in one request (a classroom, or siblings).
+    Emotion analysis and context loading run once for the whole batch.
+    The batch is admitted as a whole against each family's batch budget
+    (429 if it is spent); its stories then queue in the batch lane.
+    Streams one JSON line per story as it completes (in completion order,
+    with its index in the request), then a summary line.
+    """
+    if not batch.stories or len(batch.stories) > config.BATCH_MAX_STORIES:
+        raise HTTPException(status_code=400, detail=f"Send 1 to {config.BATCH_MAX_STORIES} stories")
+    for request in batch.stories:
+        _authorize_child(http_request, request.child_id)
+    
+    families = await asyncio.gather(*(_family_of(http_request, request.child_id) for request in batch.stories))
+    admission.admit_batch(Counter(families))
+    
+    client_key = http_request.headers.get('idempotency-key')
+    user_inputs = [
+        {
+            'audio_url': request.audio_url,
+            'text_input': request.text_input,
+            'child_id': request.child_id,
+            'session_mood': request.session_mood
+        }
+        for request in batch.stories
+    ]
+    preloaded = await executor.execute_shared(await planner.plan_batch(user_inputs), len(user_inputs))
+    
+    async def create(index: int, request: StoryRequest, family: str) -> Dict[str, Any]:
+        line = {'index': index, 'child_id': request.child_id}
+        try:
+            key, ttl = _story_request_key(request, f"{client_key}:{index}" if client_key else None)
+            response = await story_flights.do(
+                key, _create_story_once, request, key, ttl, family, 'batch', preloaded[index]
+            )
+            return {**line, **response.model_dump()}
+        except AdmissionRejected as e:
+            return {**line, 'status': 'rejected', 'detail': str(e), 'retry_after': e.retry_after}
+        except HTTPException as e:
+            return {**line, 'status': 'failed', 'detail': e.detail}
+        except Exception as e:
+            print(f"[API] Error creating batch story {index}: {e}")
+            return {**line, 'status': 'failed', 'detail': str(e)}
+    
+    async def lines():
+        jobs = [asyncio.ensure_future(create(index, request, family))
+                for index, (request, family) in enumerate(zip(batch.stories, families))]
+        completed = 0
+        try:
+            for job in asyncio.as_completed(jobs):
+                line = await job
+                completed += line['status'] == 'complete'
+                yield json.dumps(line) + "\n"
+            yield json.dumps({'done': True, 'completed': completed, 'total': len(jobs)}) + "\n"
+        finally:
+            # Client went away - stop the stories nobody will receive
+            for job in jobs:
+                job.cancel()
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/api/story/{story_id}")
-async def get_story(story_id: str):
+async def get_story(story_id: str, http_request: Request):
     """Retrieve a specific story"""
     try:
         story = await memory.retrieve('stories', story_id)
-        if not story:
-            raise HTTPException(status_code=404, detail="Story not found")
-        return story
     except Exception as e:
         if "not found" in str(e).lower():
             raise HTTPException(status_code=404, detail="Story not found")
         raise HTTPException(status_code=500, detail=str(e))
+    if not story:
+        raise HTTPException(status_code=404, detail="Story not found")
+    _authorize_child(http_request, story.get('childId', ''))
+    return story
+
+@app.post("/api/story/{story_id}/narration")
+async def narrate_story(story_id: str, request: NarrationRequest, http_request: Request):
+    """
+    Narrate a story now (e.g. one written before narration existed, or at
+    another speed) and store the scenes' audio URLs. Scenes already
+    narrated with this voice and speed come straight from the audio cache.
+    """
+    story = await memory.retrieve('stories', story_id)
+    if not story:
+        raise HTTPException(status_code=404, detail="Story not found")
+    _authorize_child(http_request, story.get('childId', ''))
+    
+    family = await _family_of(http_request, story.get('childId', ''))
+    async with admission.admit(family, story.get('childId'), 'interactive'):
+        result = await executor.agents['narrator'].narrate_scenes(
+            story['id'], story.get('scenes', []), child_id=story.get('childId'),
+            voice=request.voice, speed=request.speed
+        )
+    await memory.update_scene_audio(story['id'], result['narration'])
+    return result
 
 @app.post("/api/voice/upload")
-async def upload_voice(file: UploadFile = File(...), child_id: str = "default"):
+async def upload_voice(http_request: Request, file: UploadFile = File(...), child_id: str = "default"):
     """Handle voice file uploads"""
+    _authorize_child(http_request, child_id)
     try:
         # Validate file type
         if not file.content_type or not file.content_type.startswith('audio/'):
@@ -287,9 +558,64 @@ async def upload_voice(file: UploadFile = File(...), child_id: str = "default"):
         print(f"[API] Error uploading voice file: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/media/images/{filename}")
+async def get_image(filename: str):
+    """Serve stored illustrations; names are content hashes, so they never change"""
+    path = image_store.path_for(filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/media/audio/{filename}")
+async def get_audio(filename: str, range: Optional[str] = Header(None), if_range: Optional[str] = Header(None)):
+    """
+    Serve narration audio. Names are content hashes, so files never change;
+    a Range request gets just those bytes (206), so players can seek and
+    resume without downloading the whole file.
+    """
+    path = audio_store.path_for(filename)
+    if not path:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    
+    size = os.path.getsize(path)
+    etag = f'"{filename.split(".")[0]}"'
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+        "ETag": etag
+    }
+    media_type = MEDIA_TYPES.get(filename.rsplit('.', 1)[-1], 'application/octet-stream')
+    
+    try:
+        # If-Range names the copy the client already has part of; any other copy is sent whole
+        span = byte_range(range, size) if if_range in (None, etag) else None
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if span is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    
+    first, last = span
+    metrics.increment('media.audio.range_requests')
+    return StreamingResponse(
+        _file_chunks(path, first, last - first + 1), status_code=206, media_type=media_type,
+        headers={**headers, "Content-Range": f"bytes {first}-{last}/{size}", "Content-Length": str(last - first + 1)}
+    )
+
+def _file_chunks(path: str, offset: int, length: int, chunk_size: int = 64 * 1024):
+    """length bytes of a file from offset (iterated in the threadpool by StreamingResponse)"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
 @app.get("/api/child/{child_id}/stories")
-async def get_child_stories(child_id: str, limit: int = 10):
+async def get_child_stories(child_id: str, http_request: Request, limit: int = 10):
     """Get recent stories for a child"""
+    _authorize_child(http_request, child_id)
     try:
         # Get child context which includes recent stories
         context = await memory.get_child_context(child_id)
@@ -303,9 +629,34 @@ async def get_child_stories(child_id: str, limit: int = 10):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/stories/search")
+async def search_stories(q: str, http_request: Request, child_id: Optional[str] = None,
+                         parent_id: Optional[str] = None, limit: int = 20, offset: int = 0):
+    """Search a child's stories, or all of a parent's children's (pass next_offset for more)"""
+    if not child_id and not parent_id:
+        raise HTTPException(status_code=400, detail="Pass child_id or parent_id")
+    query = q.strip()[:200]
+    if not query:
+        raise HTTPException(status_code=400, detail="Empty search")
+    if parent_id:
+        _authorize_parent(http_request, parent_id)
+    if child_id:
+        _authorize_child(http_request, child_id)
+    if not hasattr(memory, 'search_stories'):
+        raise HTTPException(status_code=503, detail="Story search requires the PostgreSQL backend")
+    try:
+        results = await memory.search_stories(
+            query, child_id=child_id, parent_id=parent_id,
+            limit=max(1, min(limit, 50)), offset=max(0, offset)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid child id or parent id: {e}")
+    return await _json_response(results, len(results['results']))
+
 @app.get("/api/child/{child_id}/dashboard")
-async def get_child_dashboard(child_id: str):
+async def get_child_dashboard(child_id: str, http_request: Request):
     """Get dashboard data for a child"""
+    _authorize_child(http_request, child_id)
     try:
         # Get child context
         context = await memory.get_child_context(child_id)
@@ -323,15 +674,16 @@ async def get_child_dashboard(child_id: str):
             "recent_stories": context.get('recent_stories', [])[:5],
             "favorite_elements": context.get('favorite_elements', {}),
             "badges": [],  # TODO: Implement badge system
-            "mood_trend": self._calculate_mood_trend(emotional_history)
+            "mood_trend": EmotionSeries.from_history(emotional_history).mood_trend()
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/parent/insights/{child_id}")
-async def get_parent_insights(child_id: str, days: int = 7):
+async def get_parent_insights(child_id: str, http_request: Request, days: int = 7):
     """Get emotional insights for parent dashboard"""
+    _authorize_child(http_request, child_id)
     try:
         # Get emotional history
         emotional_history = await memory.get_emotional_history(child_id, days=days)
@@ -340,15 +692,12 @@ async def get_parent_insights(child_id: str, days: int = 7):
         context = await memory.get_child_context(child_id)
         
         # Calculate insights
-        insights = self._calculate_insights(emotional_history, context)
+        series = EmotionSeries.from_history(emotional_history)
+        insights = series.insights()
         
-        # Fetch stored alerts from database
+        # Fetch stored (unread) alerts from database
         try:
-            # In a real implementation, this would query alerts by child_id
-            # For now, using the basic memory storage pattern
-            stored_alerts = []
-            # This is a simplified approach - in production, use proper database queries
-            print(f"[API] Fetching alerts for child {child_id}")
+            stored_alerts = await memory.get_child_alerts(child_id)
         except Exception as e:
             print(f"[API] Error fetching alerts: {e}")
             stored_alerts = []
@@ -356,10 +705,13 @@ async def get_parent_insights(child_id: str, days: int = 7):
         # Combine calculated insights with stored alerts
         all_alerts = insights.get('alerts', []) + stored_alerts
         
-        return {
+        return await _json_response({
             "child_id": child_id,
             "timeframe": f"Last {days} days",
             "emotional_summary": insights['emotional_summary'],
+            "emotional_trends": insights['trends'],
+            "anomalies": insights['anomalies'],
+            "weekday_patterns": insights['weekday_patterns'],
             "story_engagement": {
                 "total_stories": len(context.get('recent_stories', [])),
                 "favorite_themes": context.get('favorite_elements', {}).get('themes', [])[:3],
@@ -367,15 +719,108 @@ async def get_parent_insights(child_id: str, days: int = 7):
             },
             "alerts": all_alerts,
             "recommendations": insights.get('recommendations', []),
-            "mood_chart_data": self._prepare_mood_chart_data(emotional_history)
-        }
+            "mood_chart_data": series.chart_data()
+        }, items=len(emotional_history))
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/parent/alerts")
+async def get_parent_alerts(parent_id: str, http_request: Request, limit: int = 20,
+                            cursor: Optional[str] = None, child_id: Optional[str] = None):
+    """Unread alerts for all of a parent's children, newest first (pass next_cursor for more)"""
+    _authorize_parent(http_request, parent_id)
+    if not hasattr(memory, 'get_parent_alerts'):
+        raise HTTPException(status_code=503, detail="Alert feed requires the PostgreSQL backend")
+    try:
+        return await memory.get_parent_alerts(
+            parent_id, limit=max(1, min(limit, 100)), cursor=cursor, child_id=child_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid parent id, child id or cursor: {e}")
+
+@app.post("/api/auth/stream-token")
+async def create_stream_token(http_request: Request):
+    """
+    A short-lived token for opening an event stream from a browser, whose
+    EventSource cannot send an Authorization header:
+    new EventSource(`/api/parent/alerts/stream?parent_id=...&access_token=${token}`).
+    Get a new one before each (re)connect; it expires after AUTH_STREAM_TOKEN_TTL seconds.
+    """
+    principal = getattr(http_request.state, 'principal', None)
+    if principal is None:
+        raise HTTPException(status_code=401, detail="Sign in to open an event stream",
+                            headers={"WWW-Authenticate": "Bearer"})
+    token = await auth.issue_stream_token(principal)
+    return {'access_token': token, 'expires_in': int(config.AUTH_STREAM_TOKEN_TTL)}
+
+@app.get("/api/parent/alerts/stream")
+async def stream_parent_alerts(parent_id: str, http_request: Request):
+    """
+    Server-sent events: each new alert for the parent's children as an
+    'alert' event, as soon as it is stored. Fetch /api/parent/alerts after
+    (re)connecting for anything stored while disconnected.
+    Browsers authenticate with ?access_token= (see /api/auth/stream-token).
+    """
+    _authorize_parent(http_request, parent_id)
+    if not alert_hub.listening:
+        raise HTTPException(status_code=503, detail="Alert stream requires the PostgreSQL backend")
+    real_parent_id = memory._map_id(parent_id)
+    try:
+        uuid.UUID(real_parent_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid parent id")
+    
+    async def events():
+        async with alert_hub.subscribe(real_parent_id) as queue:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    alert = await asyncio.wait_for(queue.get(), timeout=config.ALERT_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies and load balancers from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                if alert is None:
+                    break
+                yield f"id: {alert['id']}\nevent: alert\ndata: {json.dumps(alert)}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.post("/api/parent/alerts/read")
+async def mark_alerts_read(request: MarkAlertsReadRequest, http_request: Request):
+    """Mark alerts as read so they leave the unread feed"""
+    _authorize_parent(http_request, request.parent_id)
+    if not hasattr(memory, 'mark_alerts_read'):
+        raise HTTPException(status_code=503, detail="Alert feed requires the PostgreSQL backend")
+    try:
+        updated = await memory.mark_alerts_read(request.parent_id, request.alert_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid parent or alert id: {e}")
+    return {"updated": updated}
+
+@app.get("/api/child/{child_id}/characters/{character}/avatar")
+async def get_character_avatar(child_id: str, http_request: Request, character: str, style: str = "child-friendly cartoon"):
+    """Get (or lazily design) a recurring character's avatar for a child"""
+    _authorize_child(http_request, child_id)
+    try:
+        context = await memory.get_child_context(child_id)
+        illustrator = executor.agents['illustrator']
+        
+        return await illustrator.generate_character_avatar(
+            character, context.get('preferences', {}), child_id=child_id, style=style
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/child/{child_id}/profile")
-async def update_child_profile(child_id: str, profile: ChildProfile):
+async def update_child_profile(child_id: str, http_request: Request, profile: ChildProfile):
     """Update child profile"""
+    _authorize_child(http_request, child_id)
     try:
         profile_data = {
             "name": profile.name,
@@ -393,87 +838,72 @@ async def update_child_profile(child_id: str, profile: ChildProfile):
         raise HTTPException(status_code=500, detail=str(e))
 
 # Helper methods
-def _calculate_mood_trend(emotional_history: List[Dict]) -> str:
-    """Calculate overall mood trend"""
-    if not emotional_history:
-        return "neutral"
-    
-    recent_moods = [session.get('mood', 'neutral') for session in emotional_history[-5:]]
-    positive_moods = sum(1 for mood in recent_moods if mood in ['happy', 'excited'])
-    
-    if positive_moods >= len(recent_moods) * 0.7:
-        return "positive"
-    elif positive_moods <= len(recent_moods) * 0.3:
-        return "concerning"
+async def _family_of(http_request: Request, child_id: str) -> str:
+    """Family (parent id) a child's requests are scheduled and rate-limited under"""
+    principal = getattr(http_request.state, 'principal', None)
+    if principal is not None and principal.parent_id:
+        return principal.parent_id
+    if hasattr(memory, 'get_parent_id'):
+        try:
+            return await memory.get_parent_id(child_id) or child_id
+        except Exception:
+            pass
+    return child_id
+
+def _story_request_key(request: StoryRequest, client_key: Optional[str]) -> tuple:
+    """
+    Idempotency key and how long it holds, scoped to the child.
+    Without a client key, identical input from the same child is treated
+    as a retry for STORY_DEDUP_WINDOW seconds.
+    """
+    if client_key:
+        digest = hashlib.sha256(f"{request.child_id}\0{client_key}".encode()).hexdigest()
+        return f"client:{digest}", config.IDEMPOTENCY_KEY_TTL
+    digest = hashlib.sha256(json.dumps(request.model_dump(), sort_keys=True).encode()).hexdigest()
+    return f"input:{digest}", config.STORY_DEDUP_WINDOW
+
+def _authorize_child(http_request: Request, child_id: str):
+    """403 unless the caller's session covers the child (anonymous callers pass unless AUTH_REQUIRED)"""
+    principal = getattr(http_request.state, 'principal', None)
+    if principal is not None and not principal.can_access_child(MemoryPG.DEMO_MAPPINGS.get(child_id, child_id)):
+        raise HTTPException(status_code=403, detail="Not allowed to access this child")
+
+def _authorize_parent(http_request: Request, parent_id: str):
+    """403 unless the caller is this parent (anonymous callers pass unless AUTH_REQUIRED)"""
+    principal = getattr(http_request.state, 'principal', None)
+    if principal is not None and not principal.can_access_parent(MemoryPG.DEMO_MAPPINGS.get(parent_id, parent_id)):
+        raise HTTPException(status_code=403, detail="Not allowed to access this parent's data")
+
+def _authorize_admin(http_request: Request):
+    """403 for signed-in users other than admins (anonymous callers pass unless AUTH_REQUIRED)"""
+    principal = getattr(http_request.state, 'principal', None)
+    if principal is not None and principal.role != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+
+async def _json_response(payload: Dict, items: int = 0) -> Response:
+    """JSON response, encoded in the CPU pool when the payload is large"""
+    if items >= config.JSON_OFFLOAD_MIN_ITEMS:
+        body = await cpu_pool.run(encode_json, payload)
     else:
-        return "mixed"
-
-def _calculate_insights(emotional_history: List[Dict], context: Dict) -> Dict:
-    """Calculate insights from emotional history"""
-    insights = {
-        'emotional_summary': {},
-        'alerts': [],
-        'recommendations': []
-    }
-    
-    if not emotional_history:
-        return insights
-    
-    # Calculate emotional averages
-    all_emotions = {}
-    for session in emotional_history:
-        emotions = session.get('emotions', {}).get('emotions', {})
-        for emotion, score in emotions.items():
-            if emotion not in all_emotions:
-                all_emotions[emotion] = []
-            all_emotions[emotion].append(score)
-    
-    # Average emotions
-    avg_emotions = {
-        emotion: sum(scores) / len(scores) 
-        for emotion, scores in all_emotions.items()
-    }
-    
-    insights['emotional_summary'] = avg_emotions
-    
-    # Generate recommendations
-    if avg_emotions.get('happiness', 0) < 0.4:
-        insights['recommendations'].append({
-            'type': 'emotional_support',
-            'message': 'Consider activities that boost your child\'s mood',
-            'actions': ['Plan fun activities', 'Spend more one-on-one time', 'Ask about their day']
-        })
-    
-    if avg_emotions.get('sadness', 0) > 0.6:
-        insights['alerts'].append({
-            'type': 'emotional_concern',
-            'severity': 'medium',
-            'message': 'Child has shown elevated sadness recently',
-            'recommendation': 'Consider talking with your child about their feelings'
-        })
-    
-    return insights
+        body = encode_json(payload)
+    return Response(content=body, media_type="application/json")
 
-def _prepare_mood_chart_data(emotional_history: List[Dict]) -> List[Dict]:
-    """Prepare data for mood chart visualization"""
-    chart_data = []
-    
-    for session in emotional_history[-14:]:  # Last 2 weeks
-        timestamp = session.get('timestamp')
-        emotions = session.get('emotions', {}).get('emotions', {})
-        
-        chart_data.append({
-            'date': timestamp.isoformat() if timestamp else datetime.now().isoformat(),
-            'happiness': emotions.get('happiness', 0),
-            'sadness': emotions.get('sadness', 0),
-            'fear': emotions.get('fear', 0),
-            'anger': emotions.get('anger', 0),
-            'overall_mood': session.get('mood', 'neutral')
-        })
-    
-    return chart_data
+async def _store_background_result(task, result: Dict):
+    """Persist results of background tasks started after a story was stored"""
+    if task.agent == 'illustrator' and result.get('images'):
+        await memory.update_scene_images(result['storyId'], result['images'])
+    elif task.agent == 'narrator' and result.get('narration'):
+        await memory.update_scene_audio(result['storyId'], result['narration'])
 
 # Error handlers
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "reason": exc.reason, "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     print(f"[API] Unhandled exception: {str(exc)}")
@@ -0,0 +1,243 @@
+"""
+Bearer-token authentication against the sessions table.
+Resolved sessions are cached per worker, so authorising a request is a
+dict lookup rather than database queries.
+"""
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import parse_qs
+import asyncio
+import secrets
+import time
+
+from starlette.responses import JSONResponse
+
+from config import config
+from database import Database
+from tools.metrics import metrics
+from tools.single_flight import SingleFlight
+
+# One query per uncached token: the user, their role, their parent record
+# and every kid they may access (a parent's children, or a kid's own record)
+SESSION_QUERY = """
+    SELECT s.user_id, u.role::text AS role, s.expires_at,
+           COALESCE(p.id, own.parent_id) AS parent_id,
+           ARRAY(
+               SELECT k.id FROM kids k
+               WHERE k.parent_id = p.id OR k.user_id = s.user_id
+           ) AS kid_ids
+    FROM sessions s
+    JOIN users u ON u.id = s.user_id
+    LEFT JOIN parents p ON p.user_id = s.user_id
+    LEFT JOIN kids own ON own.user_id = s.user_id
+    WHERE s.token = $1 AND s.expires_at > NOW()
+    LIMIT 1
+"""
+
+# Routes that need a session when AUTH_REQUIRED is set (media stays public for <img> tags)
+PROTECTED_PREFIXES = ('/api/', '/database/')
+
+# Event streams: browsers' EventSource cannot send an Authorization header,
+# so these routes also take a stream token as ?access_token=
+STREAM_PATHS = ('/api/parent/alerts/stream',)
+
+# Stream tokens are only accepted on STREAM_PATHS, so one leaked from a URL
+# cannot be used against the rest of the API
+STREAM_TOKEN_PREFIX = 'stream.'
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The signed-in user a request acts for"""
+    user_id: str
+    role: str  # 'parent', 'kid' or 'admin'
+    parent_id: Optional[str]
+    kid_ids: FrozenSet[str]
+
+    def can_access_child(self, kid_id: str) -> bool:
+        return self.role == 'admin' or kid_id in self.kid_ids
+
+    def can_access_parent(self, parent_id: str) -> bool:
+        return self.role == 'admin' or (self.role == 'parent' and parent_id == self.parent_id)
+
+
+class SessionAuth:
+    """
+    Resolves session tokens to principals through a TTL cache.
+    Valid sessions are cached for AUTH_CACHE_TTL seconds (never past the
+    session's own expiry), unknown or expired tokens for AUTH_NEGATIVE_TTL,
+    so repeated bad tokens do not reach the database either. Concurrent
+    lookups of one uncached token share a query. A background sweeper
+    evicts expired entries and deletes expired sessions.
+
+    A deleted session stays usable on a worker until its cache entry
+    expires, so AUTH_CACHE_TTL bounds how long a logout takes to apply.
+    """
+
+    def __init__(self):
+        self._db: Optional[Database] = None
+        self._cache: 'OrderedDict[str, Tuple[Optional[Principal], float]]' = OrderedDict()
+        self._flights = SingleFlight('auth.sessions')
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        return self._db is not None and self._db.pool is not None
+
+    def start(self, db: Database):
+        """Resolve tokens against this database and start the sweeper"""
+        self._db = db
+        if self._sweeper is None:
+            self._sweeper = asyncio.ensure_future(self._sweep_forever())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        self._cache.clear()
+
+    async def resolve(self, token: str) -> Optional[Principal]:
+        """The token's principal, or None for an unknown or expired token"""
+        entry = self._cache.get(token)
+        if entry is not None and entry[1] > time.time():
+            metrics.increment('auth.cache_hits')
+            return entry[0]
+
+        metrics.increment('auth.cache_misses')
+        return await self._flights.do(token, self._load, token)
+
+    async def issue_stream_token(self, principal: Principal) -> str:
+        """
+        A session token for opening an event stream, valid for
+        AUTH_STREAM_TOKEN_TTL seconds. It is a row in the sessions table,
+        so every worker resolves it like any other session.
+        """
+        token = f"{STREAM_TOKEN_PREFIX}{secrets.token_urlsafe(32)}"
+        async with self._db.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO sessions (user_id, token, expires_at)
+                VALUES ($1, $2, NOW() + make_interval(secs => $3))
+            """, principal.user_id, token, float(config.AUTH_STREAM_TOKEN_TTL))
+        metrics.increment('auth.stream_tokens')
+        return token
+
+    async def _load(self, token: str) -> Optional[Principal]:
+        async with self._db.acquire() as conn:
+            row = await conn.fetchrow(SESSION_QUERY, token)
+
+        now = time.time()
+        if row is None:
+            metrics.increment('auth.rejected')
+            self._remember(token, None, now + config.AUTH_NEGATIVE_TTL)
+            return None
+
+        principal = Principal(
+            user_id=str(row['user_id']),
+            role=row['role'],
+            parent_id=str(row['parent_id']) if row['parent_id'] else None,
+            kid_ids=frozenset(str(kid_id) for kid_id in row['kid_ids'])
+        )
+        self._remember(token, principal, min(now + config.AUTH_CACHE_TTL, row['expires_at'].timestamp()))
+        return principal
+
+    def _remember(self, token: str, principal: Optional[Principal], until: float):
+        self._cache[token] = (principal, until)
+        self._cache.move_to_end(token)
+        while len(self._cache) > config.AUTH_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        metrics.gauge('auth.cache_size', len(self._cache))
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(config.AUTH_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"[Auth] Sweep failed: {e}")
+
+    async def sweep(self) -> Dict[str, Any]:
+        """Evict expired cache entries and delete expired sessions"""
+        now = time.time()
+        expired = [token for token, (_, until) in self._cache.items() if until <= now]
+        for token in expired:
+            del self._cache[token]
+        metrics.gauge('auth.cache_size', len(self._cache))
+
+        deleted = 0
+        if self.available:
+            async with self._db.acquire() as conn:
+                result = await conn.execute("DELETE FROM sessions WHERE expires_at <= NOW()")
+            deleted = int(result.split()[-1])
+        if expired or deleted:
+            print(f"[Auth] Evicted {len(expired)} cached tokens, deleted {deleted} expired sessions")
+        return {'evicted': len(expired), 'deleted': deleted}
+
+
+def _bearer_token(headers) -> Optional[str]:
+    for name, value in headers:
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() == 'bearer' and token.strip():
+                return token.strip()
+    return None
+
+
+def _request_token(scope) -> Optional[str]:
+    """The bearer token, or on an event stream the ?access_token= query parameter"""
+    token = _bearer_token(scope['headers'])
+    if token is None and scope['path'] in STREAM_PATHS:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        token = (query.get('access_token') or [None])[0]
+    return token
+
+
+def _unauthorized(detail: str) -> JSONResponse:
+    return JSONResponse(status_code=401, content={"detail": detail},
+                        headers={"WWW-Authenticate": "Bearer"})
+
+
+class AuthMiddleware:
+    """
+    Resolves the request's bearer token into request.state.principal.
+    A bad token is always rejected. Without a token the request continues
+    as anonymous (demo access) unless AUTH_REQUIRED is set, in which case
+    /api and /database routes answer 401. Routes check access with the principal.
+
+    Event streams (STREAM_PATHS) also accept ?access_token= with a stream
+    token from POST /api/auth/stream-token; stream tokens are rejected
+    everywhere else. The token only has to be valid when the stream opens.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+
+        principal = None
+        token = _request_token(scope)
+        if token is not None:
+            if token.startswith(STREAM_TOKEN_PREFIX) and scope['path'] not in STREAM_PATHS:
+                await _unauthorized("Stream tokens only open event streams")(scope, receive, send)
+                return
+            if not auth.available:
+                response = JSONResponse(status_code=503, content={"detail": "Authentication requires the PostgreSQL backend"})
+                await response(scope, receive, send)
+                return
+            principal = await auth.resolve(token)
+            if principal is None:
+                await _unauthorized("Invalid or expired session")(scope, receive, send)
+                return
+        elif config.AUTH_REQUIRED and scope['path'].startswith(PROTECTED_PREFIXES):
+            await _unauthorized("Authentication required")(scope, receive, send)
+            return
+
+        scope.setdefault('state', {})['principal'] = principal
+        await self.app(scope, receive, send)
+
+
+# Singleton instance
+auth = SessionAuth()
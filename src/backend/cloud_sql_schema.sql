@@ -1,6 +1,8 @@
 -- StoryGrow Database Schema for Google Cloud SQL (PostgreSQL)
 -- For Cloud SQL Instance: database-storygrow
 -- Database name: storygrow
+-- For a new, empty database; bring an existing one up to date with
+-- migrate_schema.sql (and partition_tables.sql)
 
 -- Drop existing tables if doing a fresh install (comment out if updating)
 -- DROP SCHEMA public CASCADE;
@@ -9,6 +11,8 @@
 -- Enable UUID extension
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE EXTENSION IF NOT EXISTS "pgcrypto";
+-- Trigram matching for fuzzy story title search
+CREATE EXTENSION IF NOT EXISTS "pg_trgm";
 
 -- ==============================================
 -- USER ROLES AND TYPES
@@ -81,6 +85,7 @@ CREATE TABLE public.stories (
     prompt TEXT NOT NULL,
     status story_status DEFAULT 'draft',
     metadata JSONB DEFAULT '{}'::jsonb,
+    search_vector TSVECTOR,  -- title, prompt and scene text; maintained by triggers
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
 );
@@ -111,19 +116,25 @@ CREATE TABLE public.voice_recordings (
 );
 
 -- Emotion tracking table
+-- Partitioned by month; tools/partitions.py creates partitions ahead of time
+-- and archives ones older than the retention period
 CREATE TABLE public.emotion_logs (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
     kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
     emotion emotion_type NOT NULL,
     intensity INTEGER CHECK (intensity >= 1 AND intensity <= 5),
     context TEXT,
     story_id UUID REFERENCES public.stories(id) ON DELETE SET NULL,
-    created_at TIMESTAMPTZ DEFAULT NOW()
-);
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+-- Holds rows no monthly partition covers yet
+CREATE TABLE public.emotion_logs_default PARTITION OF public.emotion_logs DEFAULT;
 
 -- Parent alerts table
+-- Partitioned by month like emotion_logs
 CREATE TABLE public.alerts (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
     parent_id UUID NOT NULL REFERENCES public.parents(id) ON DELETE CASCADE,
     kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
     type TEXT NOT NULL,
@@ -131,8 +142,10 @@ CREATE TABLE public.alerts (
     message TEXT NOT NULL,
     is_read BOOLEAN DEFAULT FALSE,
     metadata JSONB DEFAULT '{}'::jsonb,
-    created_at TIMESTAMPTZ DEFAULT NOW()
-);
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE public.alerts_default PARTITION OF public.alerts DEFAULT;
 
 -- AI Analysis table
 CREATE TABLE public.ai_analysis (
@@ -153,16 +166,56 @@ CREATE TABLE public.sessions (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Character designs, reused across stories for consistent illustrations
+CREATE TABLE IF NOT EXISTS public.character_designs (
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    character_key TEXT NOT NULL,
+    style TEXT NOT NULL,
+    character TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    avatar_url TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (kid_id, character_key, style)
+);
+
+-- How often each character and theme appeared in a child's stories, updated
+-- as stories are stored so favourites never rescan the story history
+CREATE TABLE IF NOT EXISTS public.child_favorites (
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,  -- 'character' or 'theme'
+    element TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    last_seen TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (kid_id, kind, element)
+);
+
+-- Story creation requests by idempotency key, so retried or double-submitted
+-- requests reuse the first request's story instead of generating another
+CREATE TABLE IF NOT EXISTS public.story_requests (
+    idempotency_key TEXT PRIMARY KEY,
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending',  -- 'pending' or 'completed'
+    response JSONB,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
 -- ==============================================
 -- INDEXES
 -- ==============================================
 
 CREATE INDEX idx_stories_kid_id ON public.stories(kid_id);
 CREATE INDEX idx_stories_created_at ON public.stories(created_at DESC);
-CREATE INDEX idx_emotion_logs_kid_id ON public.emotion_logs(kid_id);
-CREATE INDEX idx_emotion_logs_created_at ON public.emotion_logs(created_at DESC);
+-- Story library search: full text, fuzzy title matches, and newest stories first
+CREATE INDEX IF NOT EXISTS idx_stories_search ON public.stories USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_stories_title_trgm ON public.stories USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_stories_kid_created ON public.stories(kid_id, created_at DESC);
+-- Indexes on the partitioned tables are created on every partition, so each
+-- month's index only covers that month. A child's emotional history reads
+-- (kid_id, created_at) within the partitions its date range touches.
+CREATE INDEX idx_emotion_logs_kid_created ON public.emotion_logs(kid_id, created_at DESC);
 CREATE INDEX idx_alerts_parent_id ON public.alerts(parent_id);
-CREATE INDEX idx_alerts_is_read ON public.alerts(is_read);
+-- Unread alert feed per parent (keyset pagination on created_at, id)
+CREATE INDEX IF NOT EXISTS idx_alerts_parent_unread ON public.alerts(parent_id, created_at DESC, id DESC) WHERE is_read = FALSE;
 CREATE INDEX idx_voice_recordings_kid_id ON public.voice_recordings(kid_id);
 CREATE INDEX idx_sessions_token ON public.sessions(token);
 CREATE INDEX idx_sessions_expires_at ON public.sessions(expires_at);
@@ -212,6 +265,66 @@ CREATE TRIGGER update_stories_updated_at BEFORE UPDATE ON public.stories
 CREATE TRIGGER update_auth_users_updated_at BEFORE UPDATE ON public.auth_users
     FOR EACH ROW EXECUTE FUNCTION update_updated_at();
 
+-- Story search vector: title (weight A), prompt (B) and scene text (C)
+CREATE OR REPLACE FUNCTION public.story_search_vector(story UUID, story_title TEXT, story_prompt TEXT)
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('english', coalesce(story_title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(story_prompt, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(
+               (SELECT string_agg(text, ' ' ORDER BY scene_number)
+                FROM public.story_scenes WHERE story_id = story), ''
+           )), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.update_story_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector = public.story_search_vector(NEW.id, NEW.title, NEW.prompt);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Runs once per statement, so a story whose scenes are written together
+-- is recomputed once rather than once per scene
+CREATE OR REPLACE FUNCTION public.update_scene_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE public.stories
+        SET search_vector = public.story_search_vector(id, title, prompt)
+        WHERE id IN (SELECT story_id FROM new_scenes);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE public.stories
+        SET search_vector = public.story_search_vector(id, title, prompt)
+        WHERE id IN (SELECT story_id FROM old_scenes);
+    ELSE
+        UPDATE public.stories
+        SET search_vector = public.story_search_vector(id, title, prompt)
+        WHERE id IN (
+            SELECT new_scenes.story_id
+            FROM new_scenes JOIN old_scenes ON old_scenes.id = new_scenes.id
+            WHERE old_scenes.text IS DISTINCT FROM new_scenes.text
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER update_stories_search_vector BEFORE INSERT OR UPDATE OF title, prompt ON public.stories
+    FOR EACH ROW EXECUTE FUNCTION update_story_search_vector();
+
+CREATE TRIGGER update_story_scenes_insert_search_vector AFTER INSERT ON public.story_scenes
+    REFERENCING NEW TABLE AS new_scenes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_scene_search_vector();
+
+CREATE TRIGGER update_story_scenes_delete_search_vector AFTER DELETE ON public.story_scenes
+    REFERENCING OLD TABLE AS old_scenes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_scene_search_vector();
+
+CREATE TRIGGER update_story_scenes_text_search_vector AFTER UPDATE ON public.story_scenes
+    REFERENCING OLD TABLE AS old_scenes NEW TABLE AS new_scenes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_scene_search_vector();
+
 -- ==============================================
 -- INITIAL ADMIN USER
 -- ==============================================
@@ -24,8 +24,136 @@ class Config:
     MIN_STORY_SCENES = 5
     MAX_RECORDING_DURATION = 120  # seconds
     
+    # Start the story from the keyword emotion pass while full analysis runs
+    SPECULATIVE_STORY_GENERATION = os.getenv('SPECULATIVE_STORY_GENERATION', 'true').lower() == 'true'
+    
+    # Admission control of story generation (per worker, see tools/admission.py)
+    ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', 8))  # stories generated at once
+    ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 64))  # waiting requests before shedding
+    ADMISSION_FAMILY_QUEUE = int(os.getenv('ADMISSION_FAMILY_QUEUE', 4))  # waiting requests per family
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 20))  # seconds before a waiting request is shed
+    CHILD_STORIES_PER_MINUTE = float(os.getenv('CHILD_STORIES_PER_MINUTE', 4))
+    CHILD_STORY_BURST = float(os.getenv('CHILD_STORY_BURST', 3))
+    FAMILY_STORIES_PER_MINUTE = float(os.getenv('FAMILY_STORIES_PER_MINUTE', 10))
+    FAMILY_STORY_BURST = float(os.getenv('FAMILY_STORY_BURST', 6))
+    
+    BATCH_MAX_STORIES = int(os.getenv('BATCH_MAX_STORIES', 50))  # stories per /api/story/batch request
+    BATCH_STORIES_PER_MINUTE = float(os.getenv('BATCH_STORIES_PER_MINUTE', 25))  # per family, charged when a batch starts
+    BATCH_STORY_BURST = float(os.getenv('BATCH_STORY_BURST', BATCH_MAX_STORIES))
+    SEARCH_CANDIDATES = int(os.getenv('SEARCH_CANDIDATES', 1000))  # newest matches per child ranked by story search
+    
+    # A new input this similar (estimated Jaccard over its content words) to one
+    # of the child's earlier inputs gets that story back; at the vary threshold
+    # the storyteller is asked to make the new story different from it
+    NEAR_DUPLICATE_REUSE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_REUSE_THRESHOLD', 0.9))
+    NEAR_DUPLICATE_VARY_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_VARY_THRESHOLD', 0.6))
+    NEAR_DUPLICATE_HISTORY = int(os.getenv('NEAR_DUPLICATE_HISTORY', 200))  # earlier stories compared per child
+    NEAR_DUPLICATE_INDEX_TTL = float(os.getenv('NEAR_DUPLICATE_INDEX_TTL', 300))  # seconds before a child's index reloads
+    
+    # Duplicate story requests reuse the first one's story: for a day with a
+    # client Idempotency-Key, for a few minutes when matched by their content
+    IDEMPOTENCY_KEY_TTL = float(os.getenv('IDEMPOTENCY_KEY_TTL', 86400))
+    STORY_DEDUP_WINDOW = float(os.getenv('STORY_DEDUP_WINDOW', 300))
+    
+    # LLM call policy - defaults, overridden per agent below
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 30))  # seconds per attempt
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+    STORY_REQUEST_DEADLINE = float(os.getenv('STORY_REQUEST_DEADLINE', 90))  # seconds for all LLM calls of one story
+    LLM_POLICIES = {
+        'storyteller': {'timeout': 45, 'hedge': True},
+        'emotion_detector': {'timeout': 10, 'max_retries': 1},
+        'illustrator': {'timeout': 15},
+        'planner': {'timeout': 10}
+    }
+    
+    # Token budgets for user-supplied prompt input, per agent
+    PROMPT_INPUT_BUDGETS = {
+        'storyteller': 400,
+        'illustrator': 150,
+        'emotion_detector': 300,
+        'default': 300
+    }
+    
+    # Circuit breaker around Gemini - open when too many recent calls fail or are slow
+    CIRCUIT_WINDOW = 20  # recent calls considered
+    CIRCUIT_MIN_CALLS = 5
+    CIRCUIT_FAILURE_RATE = 0.5
+    CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', 20))
+    CIRCUIT_COOLDOWN = float(os.getenv('CIRCUIT_COOLDOWN', 30))  # seconds before a probe call
+    
+    # Production server (main.py --production, and always on Cloud Run)
+    SERVER_WORKERS = int(os.getenv('WEB_CONCURRENCY', 0))  # 0 sizes from the CPUs available
+    SERVER_KEEPALIVE = int(os.getenv('SERVER_KEEPALIVE', 65))  # seconds, above the load balancer idle timeout
+    SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 8))  # Cloud Run kills 10s after SIGTERM
+    SERVER_LIMIT_CONCURRENCY = int(os.getenv('SERVER_LIMIT_CONCURRENCY', 0))  # per worker, 0 for no limit
+    STARTUP_WARMUP = os.getenv('STARTUP_WARMUP', 'false').lower() == 'true'  # prime agents, DB and LLM before serving
+    DB_MAX_CONNECTIONS = int(os.getenv('DB_MAX_CONNECTIONS', 20))  # shared by all workers of one instance
+    
+    # Database pool (per worker)
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 2))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 0))  # 0 for this worker's share of DB_MAX_CONNECTIONS
+    DB_ACQUIRE_TIMEOUT = float(os.getenv('DB_ACQUIRE_TIMEOUT', 5))  # seconds to wait for a free connection
+    DB_COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', 60))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 256))
+    DB_MAX_INACTIVE_LIFETIME = float(os.getenv('DB_MAX_INACTIVE_LIFETIME', 300))  # close idle connections after
+    
+    # Optional read replica for dashboard/insights reads
+    DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST', '')
+    DB_REPLICA_PORT = int(os.getenv('DB_REPLICA_PORT', os.getenv('DB_PORT', 5432)))
+    DB_REPLICA_INSTANCE_CONNECTION_NAME = os.getenv('DB_REPLICA_INSTANCE_CONNECTION_NAME', '')  # Cloud Run
+    READ_YOUR_WRITES_WINDOW = float(os.getenv('READ_YOUR_WRITES_WINDOW', 10))  # seconds reads stay on the primary after a write
+    
+    # Session token auth (AUTH_REQUIRED=false keeps anonymous demo access to the API)
+    AUTH_REQUIRED = os.getenv('AUTH_REQUIRED', 'false').lower() == 'true'
+    AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', 60))  # seconds a resolved session is trusted per worker
+    AUTH_NEGATIVE_TTL = float(os.getenv('AUTH_NEGATIVE_TTL', 30))  # seconds an unknown token stays rejected
+    AUTH_CACHE_SIZE = 50000
+    AUTH_SWEEP_INTERVAL = float(os.getenv('AUTH_SWEEP_INTERVAL', 60))
+    AUTH_STREAM_TOKEN_TTL = float(os.getenv('AUTH_STREAM_TOKEN_TTL', 60))  # seconds to open an event stream with a query token
+    
+    # Push delivery of parent alerts (server-sent events fed by LISTEN/NOTIFY)
+    ALERT_STREAM_HEARTBEAT = float(os.getenv('ALERT_STREAM_HEARTBEAT', 15))  # seconds between keep-alive comments
+    ALERT_STREAM_QUEUE_SIZE = 100  # undelivered alerts held per connection before the oldest are dropped
+    
+    # Worker processes for CPU-bound work (0 runs it inline on the event loop)
+    CPU_POOL_WORKERS = int(os.getenv('CPU_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+    CPU_POOL_START_METHOD = os.getenv('CPU_POOL_START_METHOD', 'spawn')
+    JSON_OFFLOAD_MIN_ITEMS = 500  # history rows above which response encoding is offloaded
+    
+    # Illustrations
+    IMAGE_BACKEND = os.getenv('IMAGE_BACKEND', 'local')  # 'local' or 'imagen'
+    IMAGE_STORE_DIR = os.getenv('IMAGE_STORE_DIR', 'media/images')
+    MEDIA_BASE_URL = os.getenv('MEDIA_BASE_URL', '')  # Prefix for media URLs, empty for same origin
+    IMAGEN_MODEL = os.getenv('IMAGEN_MODEL', 'imagegeneration@005')
+    IMAGEN_LOCATION = os.getenv('IMAGEN_LOCATION', 'us-central1')
+    
+    # Narration of story scenes
+    NARRATION_ENABLED = os.getenv('NARRATION_ENABLED', 'true').lower() == 'true'
+    NARRATION_BACKEND = os.getenv('NARRATION_BACKEND', 'local')  # 'local' or 'google'
+    NARRATION_STORE_DIR = os.getenv('NARRATION_STORE_DIR', 'media/audio')
+    NARRATION_VOICE = os.getenv('NARRATION_VOICE', 'en-US-Neural2-F')
+    NARRATION_SPEED = float(os.getenv('NARRATION_SPEED', 0.9))  # a little slower for young listeners
+    NARRATION_CONCURRENCY = int(os.getenv('NARRATION_CONCURRENCY', 4))  # scenes of one story synthesised at once
+    
     # Safety Settings
     EMOTION_ALERT_THRESHOLD = 0.8
+    EMOTION_LLM_ANALYSIS = os.getenv('EMOTION_LLM_ANALYSIS', 'true').lower() == 'true'  # refine keyword emotion scores with Gemini
     TRAUMA_KEYWORDS = ['scared', 'hurt', 'pain', 'cry', 'hit']
+    
+    # Emotion trend analytics (counted in sessions)
+    EMOTION_TREND_WINDOW = int(os.getenv('EMOTION_TREND_WINDOW', 7))  # rolling mean window, and how far back a trend compares
+    EMOTION_EWMA_SPAN = max(1.0, float(os.getenv('EMOTION_EWMA_SPAN', 7)))  # 1 means no smoothing
+    EMOTION_BASELINE_SESSIONS = int(os.getenv('EMOTION_BASELINE_SESSIONS', 30))  # history a session is compared with for anomalies
+    EMOTION_ANOMALY_MIN_SESSIONS = int(os.getenv('EMOTION_ANOMALY_MIN_SESSIONS', 8))
+    EMOTION_ANOMALY_Z = float(os.getenv('EMOTION_ANOMALY_Z', 2.5))
+    
+    # Monthly partitions of emotion_logs and alerts (tools/partitions.py)
+    PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+    PARTITION_MAINTENANCE_INTERVAL = float(os.getenv('PARTITION_MAINTENANCE_INTERVAL', 21600))  # seconds
+    EMOTION_LOG_RETENTION_MONTHS = int(os.getenv('EMOTION_LOG_RETENTION_MONTHS', 24))  # 0 keeps every month
+    ALERT_RETENTION_MONTHS = int(os.getenv('ALERT_RETENTION_MONTHS', 12))
+    PARTITION_ARCHIVE_DIR = os.getenv('PARTITION_ARCHIVE_DIR', 'archive')
+    PARTITION_AUTO_ARCHIVE = os.getenv('PARTITION_AUTO_ARCHIVE', 'false').lower() == 'true'  # else only the maintenance command archives
 
 config = Config()
\ No newline at end of file
@@ -4,19 +4,83 @@ PostgreSQL database connection and utilities
 import os
 import asyncio
 import asyncpg
+import time
+import uuid
+from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 import json
-from google.cloud.sql.connector import Connector
 
 from config import config
+from tools.metrics import metrics
+
+# Queries on the story and dashboard hot paths. Every new connection runs each
+# once with a placeholder id, so they are parsed and in the connection's
+# statement cache before a request needs them.
+STATEMENTS = {
+    'kid_by_id': """
+        SELECT * FROM kids WHERE id = $1
+    """,
+    'recent_stories': """
+        SELECT id, title, created_at
+        FROM stories
+        WHERE kid_id = $1
+        ORDER BY created_at DESC
+        LIMIT 5
+    """,
+    'emotional_history': """
+        SELECT * FROM emotion_logs
+        WHERE kid_id = $1
+        AND created_at > NOW() - make_interval(days => $2)
+        ORDER BY created_at DESC
+    """,
+    'story_by_id': """
+        SELECT s.*, k.name as child_name
+        FROM stories s
+        JOIN kids k ON s.kid_id = k.id
+        WHERE s.id = $1
+    """,
+    'child_favorites': """
+        SELECT kind, element, count
+        FROM (
+            SELECT kind, element, count,
+                   row_number() OVER (PARTITION BY kind ORDER BY count DESC, last_seen DESC) AS position
+            FROM child_favorites
+            WHERE kid_id = $1
+        ) ranked
+        WHERE position <= 3
+        ORDER BY kind, position
+    """,
+    'story_scenes': """
+        SELECT scene_number, text, image_prompt, image_url, audio_url
+        FROM story_scenes
+        WHERE story_id = $1
+        ORDER BY scene_number
+    """
+}
+
+_PLACEHOLDER_ID = uuid.UUID(int=0)
+_WARM_UP_ARGS = {'emotional_history': (_PLACEHOLDER_ID, 1)}
+
+# Upper bounds (seconds) of the acquire wait histogram
+ACQUIRE_WAIT_BUCKETS = (0.001, 0.005, 0.025, 0.1, 0.5, 2.0)
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+def json_dumps(value: Any) -> str:
+    """JSON-encode a value for a json/jsonb/text column (datetimes as ISO strings)"""
+    return json.dumps(value, default=_json_default)
 
 class Database:
     """PostgreSQL database connection manager"""
     
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
-        self.connector: Optional[Connector] = None
+        self.read_pool: Optional[asyncpg.Pool] = None  # Optional read replica
+        self.connector = None  # Cloud SQL connector, only created on Cloud Run
         
         # Database configuration from environment
         self.db_config = {
@@ -36,8 +100,41 @@ class Database:
         # Check if running on Cloud Run
         self.is_cloud_run = os.getenv('K_SERVICE') is not None
         
+    @property
+    def pool_max_size(self) -> int:
+        """Connections for this worker's pool - each server worker gets an equal share"""
+        if config.DB_POOL_MAX_SIZE:
+            return config.DB_POOL_MAX_SIZE
+        workers = max(1, config.SERVER_WORKERS)
+        return max(2, config.DB_MAX_CONNECTIONS // workers)
+    
+    @property
+    def pool_settings(self) -> Dict[str, Any]:
+        """Pool options shared by the Cloud SQL connector and direct paths"""
+        return {
+            'min_size': min(config.DB_POOL_MIN_SIZE, self.pool_max_size),
+            'max_size': self.pool_max_size,
+            'max_inactive_connection_lifetime': config.DB_MAX_INACTIVE_LIFETIME,
+            'command_timeout': config.DB_COMMAND_TIMEOUT,
+            'init': self._init_connection
+        }
+    
+    async def _init_connection(self, conn: asyncpg.Connection):
+        """Set up a new pooled connection: JSON codecs and hot statements"""
+        for type_name in ('json', 'jsonb'):
+            await conn.set_type_codec(
+                type_name, encoder=json_dumps, decoder=json.loads, schema='pg_catalog'
+            )
+        
+        for name, query in STATEMENTS.items():
+            try:
+                await conn.fetch(query, *_WARM_UP_ARGS.get(name, (_PLACEHOLDER_ID,)))
+            except asyncpg.PostgresError as e:
+                print(f"[Database] Warning: could not prepare statement '{name}': {e}")
+        metrics.increment('db.pool.connections_opened')
+        
     async def connect(self):
-        """Create connection pool"""
+        """Create connection pool (one per server worker process)"""
         try:
             if self.is_cloud_run and self.instance_connection_name:
                 # Use Cloud SQL connector for Cloud Run
@@ -53,37 +150,18 @@ class Database:
                 except Exception as e:
                     print(f"[Database] Auth error: {e}")
                 
+                from google.cloud.sql.connector import Connector
                 self.connector = Connector(refresh_strategy="lazy")
                 
-                # Create connection function for the pool
-                async def get_conn(*args, **kwargs):
-                    conn = await self.connector.connect_async(
-                        self.instance_connection_name,
-                        "asyncpg",
-                        user=self.db_config['user'],
-                        password=self.db_config['password'],
-                        db=self.db_config['database']
-                    )
-                    return conn
-                
                 # Create pool with the connector
-                self.pool = await asyncpg.create_pool(
-                    connect=get_conn,
-                    min_size=1,
-                    max_size=10,
-                    command_timeout=60
-                )
-                print(f"[Database] Connected via Cloud SQL connector")
+                self.pool = await self._create_connector_pool(self.instance_connection_name)
+                print(f"[Database] Connected via Cloud SQL connector (pid {os.getpid()}, max {self.pool_max_size} connections)")
             else:
                 # Direct connection for local development
-                self.pool = await asyncpg.create_pool(
-                    **self.db_config,
-                    min_size=1,
-                    max_size=10,
-                    command_timeout=60
-                )
-                print(f"[Database] Connected to PostgreSQL at {self.db_config['host']}")
+                self.pool = await self._create_direct_pool(self.db_config['host'], self.db_config['port'])
+                print(f"[Database] Connected to PostgreSQL at {self.db_config['host']} (pid {os.getpid()}, max {self.pool_max_size} connections)")
             
+            await self._connect_read_replica()
             return True
         except Exception as e:
             print(f"[Database] Connection failed: {e}")
@@ -91,8 +169,51 @@ class Database:
             traceback.print_exc()
             return False
     
+    async def _create_connector_pool(self, instance_connection_name: str) -> asyncpg.Pool:
+        """Pool whose connections are opened through the Cloud SQL connector"""
+        async def get_conn(*args, **kwargs):
+            conn = await self.connector.connect_async(
+                instance_connection_name,
+                "asyncpg",
+                user=self.db_config['user'],
+                password=self.db_config['password'],
+                db=self.db_config['database'],
+                statement_cache_size=config.DB_STATEMENT_CACHE_SIZE
+            )
+            return conn
+        
+        return await asyncpg.create_pool(connect=get_conn, **self.pool_settings)
+    
+    async def _create_direct_pool(self, host: str, port: int) -> asyncpg.Pool:
+        """Pool of direct TCP (or Unix socket) connections"""
+        return await asyncpg.create_pool(
+            **{**self.db_config, 'host': host, 'port': port},
+            statement_cache_size=config.DB_STATEMENT_CACHE_SIZE,
+            **self.pool_settings
+        )
+    
+    async def _connect_read_replica(self):
+        """Open the optional read replica pool; reads use the primary without one"""
+        use_connector = self.connector is not None and config.DB_REPLICA_INSTANCE_CONNECTION_NAME
+        if not (use_connector or config.DB_REPLICA_HOST):
+            return
+        
+        try:
+            if use_connector:
+                self.read_pool = await self._create_connector_pool(config.DB_REPLICA_INSTANCE_CONNECTION_NAME)
+                print(f"[Database] Connected read replica {config.DB_REPLICA_INSTANCE_CONNECTION_NAME}")
+            else:
+                self.read_pool = await self._create_direct_pool(config.DB_REPLICA_HOST, config.DB_REPLICA_PORT)
+                print(f"[Database] Connected read replica at {config.DB_REPLICA_HOST}")
+        except Exception as e:
+            print(f"[Database] Warning: read replica unavailable, reading from primary: {e}")
+            self.read_pool = None
+    
     async def disconnect(self):
-        """Close connection pool"""
+        """Close connection pools"""
+        if self.read_pool:
+            await self.read_pool.close()
+            print("[Database] Disconnected from read replica")
         if self.pool:
             await self.pool.close()
             print("[Database] Disconnected from PostgreSQL")
@@ -100,10 +221,93 @@ class Database:
             await self.connector.close()
             print("[Database] Closed Cloud SQL connector")
     
+    @asynccontextmanager
+    async def acquire(self, consistency: str = 'strong'):
+        """
+        Check out a pooled connection.
+        consistency='eventual' reads from the read replica when there is one
+        (data may be a few seconds old); 'strong' always uses the primary.
+        Gives up after DB_ACQUIRE_TIMEOUT rather than queueing forever when
+        the pool is exhausted, and records how long the checkout waited.
+        """
+        pool, name = self.pool, 'pool'
+        if consistency == 'eventual' and self.read_pool is not None:
+            pool, name = self.read_pool, 'read_pool'
+        
+        start = time.monotonic()
+        try:
+            conn = await pool.acquire(timeout=config.DB_ACQUIRE_TIMEOUT)
+        except (asyncio.TimeoutError, OSError, asyncpg.PostgresConnectionError) as e:
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.increment(f"db.{name}.acquire_timeouts")
+            if pool is self.pool:
+                raise
+            # Replica exhausted or unreachable - the primary can serve the read
+            metrics.increment('db.read_pool.fallbacks')
+            pool, name = self.pool, 'pool'
+            conn = await pool.acquire(timeout=config.DB_ACQUIRE_TIMEOUT)
+        metrics.observe(f"db.{name}.acquire_wait", time.monotonic() - start)
+        metrics.increment(f"db.{name}.checkouts")
+        
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+    
+    async def listen(self, channel: str, callback, on_lost=None) -> asyncpg.Connection:
+        """
+        Check out a primary connection that LISTENs on a NOTIFY channel.
+        It stays checked out until unlisten(); on_lost(conn) is called if the
+        server closes it.
+        """
+        conn = await self.pool.acquire(timeout=config.DB_ACQUIRE_TIMEOUT)
+        try:
+            await conn.add_listener(channel, callback)
+        except Exception:
+            await self.pool.release(conn)
+            raise
+        if on_lost is not None:
+            conn.add_termination_listener(on_lost)
+        return conn
+
+    async def unlisten(self, conn: asyncpg.Connection, channel: str, callback):
+        """Stop listening and return the connection to the pool"""
+        try:
+            if not conn.is_closed():
+                await conn.remove_listener(channel, callback)
+        finally:
+            await self.pool.release(conn)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Current pool usage, also published as db.pool.* / db.read_pool.* gauges"""
+        if not self.pool:
+            return {'status': 'not connected'}
+        
+        stats = self._pool_stats(self.pool, 'pool')
+        stats['read_replica'] = self._pool_stats(self.read_pool, 'read_pool') if self.read_pool else None
+        return stats
+    
+    def _pool_stats(self, pool: asyncpg.Pool, name: str) -> Dict[str, Any]:
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        stats = {
+            'size': size,
+            'in_use': size - idle,
+            'idle': idle,
+            'min_size': pool.get_min_size(),
+            'max_size': pool.get_max_size()
+        }
+        for key, value in stats.items():
+            metrics.gauge(f"db.{name}.{key}", value)
+        
+        stats['acquire_timeouts'] = metrics.counter(f"db.{name}.acquire_timeouts")
+        stats['acquire_wait_histogram'] = metrics.histogram(f"db.{name}.acquire_wait", ACQUIRE_WAIT_BUCKETS)
+        return stats
+    
     async def test_connection(self) -> Dict[str, Any]:
         """Test database connection and get basic info"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Test basic query
                 version = await conn.fetchval('SELECT version()')
                 
@@ -130,7 +334,8 @@ class Database:
                     'table_count': table_count,
                     'tables': table_names,
                     'database': self.db_config['database'],
-                    'host': self.db_config['host']
+                    'host': self.db_config['host'],
+                    'pool': self.pool_stats()
                 }
         except Exception as e:
             return {
@@ -142,17 +347,17 @@ class Database:
     
     async def execute_query(self, query: str, *args):
         """Execute a query that doesn't return results"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.execute(query, *args)
     
     async def fetch_one(self, query: str, *args):
         """Fetch a single row"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.fetchrow(query, *args)
     
     async def fetch_all(self, query: str, *args):
         """Fetch multiple rows"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.fetch(query, *args)
     
     async def create_tables(self):
@@ -171,7 +376,7 @@ class Database:
             with open(schema_path, 'r') as f:
                 schema_sql = f.read()
             
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 # Execute schema in a transaction
                 async with conn.transaction():
                     await conn.execute(schema_sql)
@@ -192,7 +397,7 @@ class Database:
                 RETURNING id
             """
             
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 row = await conn.fetchrow(query, parent_id, name, age, 'default')
                 return str(row['id'])
                 
@@ -211,7 +416,7 @@ class Database:
                 WHERE id = $1
             """
             
-            async with self.pool.acquire() as conn:
+            async with self.acquire() as conn:
                 row = await conn.fetchrow(query, child_id)
                 if row:
                     return dict(row)
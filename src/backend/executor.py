@@ -3,14 +3,16 @@ Executes planned tasks using Gemini API and other tools.
 Required for hackathon - demonstrates tool calling and orchestration.
 """
 import asyncio
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable, Awaitable, AsyncContextManager
 from datetime import datetime
 
 from config import config
 from agents.storyteller import StorytellerAgent
 from agents.emotion_detector import EmotionDetectorAgent
 from agents.illustrator import IllustratorAgent
+from agents.narrator import NarratorAgent
 from memory import Memory
+from tools.metrics import metrics
 
 class Executor:
     """
@@ -18,44 +20,183 @@ class Executor:
     Manages agent lifecycle and result aggregation.
     """
     
-    def __init__(self):
+    def __init__(self, memory: Any = None):
+        """
+        Args:
+            memory: Memory backend shared with the caller (the API passes its
+                    MemoryPG); a Firestore Memory is created when omitted
+        """
         # Initialize all agents
+        memory = memory or Memory()
         self.agents = {
             'storyteller': StorytellerAgent(),
             'emotion_detector': EmotionDetectorAgent(),
-            'illustrator': IllustratorAgent(),
-            'memory': Memory()
+            'illustrator': IllustratorAgent(memory=memory),
+            'narrator': NarratorAgent(),
+            'memory': memory
         }
         self.results = {}
+        self._background = set()
         
-    async def execute(self, tasks: List[Any]) -> Dict[str, Any]:
+    async def execute(self, tasks: List[Any], preloaded: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Execute tasks respecting dependencies and priorities.
         
+        Tasks marked with speculate_on start before that dependency finishes,
+        using a provisional result, and are re-issued only if the final
+        result would change what they produce.
+        
         Args:
             tasks: List of Task objects from planner
+            preloaded: Results already computed for this request, keyed by
+                       'agent.action' (from execute_shared); those tasks are
+                       not run again
             
         Returns:
             Dictionary of results from all executed tasks
         """
         # Sort tasks by priority
         sorted_tasks = sorted(tasks, key=lambda x: x.priority)
+        tasks_by_id = {task.task_id: task for task in tasks}
+        
+        # Dependencies of speculative tasks run in the background so the
+        # speculative task can start while they are still in flight
+        background_ids = {
+            dep
+            for task in tasks if task.speculate_on
+            for dep in (task.depends_on or [])
+        }
+        background = []
         
         # Track completed tasks
         completed = set()
         results = {}
         
+        deferred = []
+        
         # Execute tasks
         for task in sorted_tasks:
+            if preloaded and f"{task.agent}.{task.action}" in preloaded and not task.depends_on:
+                result = preloaded[f"{task.agent}.{task.action}"]
+                results[task.task_id] = result
+                results[f"{task.agent}_{task.action}"] = result
+                completed.add(task.task_id)
+                continue
+            
+            if task.background:
+                deferred.append(task)
+                continue
+            
+            if task.speculate_on in tasks_by_id:
+                await self._execute_speculative(
+                    task, tasks_by_id[task.speculate_on], completed, results
+                )
+                continue
+            
             # Check dependencies
             if task.depends_on:
                 await self._wait_for_dependencies(task.depends_on, completed)
             
-            # Execute task
-            print(f"[Executor] Running {task.agent}.{task.action}")
-            start_time = datetime.now()
+            if task.task_id in background_ids:
+                background.append(asyncio.create_task(self._run_task(task, completed, results)))
+            else:
+                await self._run_task(task, completed, results)
+                
+        if background:
+            await asyncio.gather(*background)
             
-            try:
+        # Background tasks get their inputs now and are started by the caller
+        for task in deferred:
+            if task.depends_on:
+                task.params = self._inject_dependency_results(
+                    task.params, task.depends_on, results
+                )
+                
+        # Compile final results
+        compiled = self._compile_results(results)
+        compiled['background_tasks'] = deferred
+        return compiled
+    
+    async def execute_shared(self, tasks: List[Any], count: int) -> List[Dict[str, Any]]:
+        """
+        Run the shared tasks of a batch (Planner.plan_batch) and split their
+        results into the preloaded results of each of the count requests.
+        A shared task that fails, or that the agent has no batch action for,
+        is left out, so each request runs its own task instead.
+        """
+        preloaded = [{} for _ in range(count)]
+        runnable = [task for task in tasks if hasattr(self.agents.get(task.agent), task.action)]
+        
+        async def run(task):
+            start_time = datetime.now()
+            result = await getattr(self.agents[task.agent], task.action)(**task.params)
+            metrics.observe(f"executor.{task.agent}.{task.action}", (datetime.now() - start_time).total_seconds())
+            return result
+        
+        outcomes = await asyncio.gather(*(run(task) for task in runnable), return_exceptions=True)
+        for task, outcome in zip(runnable, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"[Executor] Error in shared {task.agent}.{task.action}: {outcome}")
+                continue
+            for index, result in zip(task.batch_indices, outcome):
+                preloaded[index][task.replaces] = result
+            metrics.increment('executor.batch.merged_tasks', len(task.batch_indices))
+        
+        return preloaded
+    
+    def run_in_background(self, tasks: List[Any],
+                          on_complete: Optional[Callable[[Any, Any], Awaitable[None]]] = None,
+                          slot: Optional[Callable[[], AsyncContextManager]] = None):
+        """
+        Start deferred tasks without waiting for them.
+        on_complete(task, result) is awaited for each task that succeeds.
+        slot(), if given, is entered before the tasks run (e.g. to wait for
+        admission control).
+        """
+        if not tasks:
+            return
+        job = asyncio.create_task(self._run_background(tasks, on_complete, slot))
+        self._background.add(job)
+        job.add_done_callback(self._background.discard)
+    
+    async def _run_background(self, tasks: List[Any], on_complete, slot=None):
+        if slot is not None:
+            async with slot():
+                await self._run_background(tasks, on_complete)
+            return
+        
+        completed = set()
+        results = {}
+        
+        async def run(task):
+            await self._run_task(task, completed, results)
+            result = results.get(task.task_id)
+            if on_complete and isinstance(result, dict) and 'error' not in result:
+                try:
+                    await on_complete(task, result)
+                except Exception as e:
+                    print(f"[Executor] Error handling result of {task.agent}.{task.action}: {e}")
+        
+        # Tasks of equal priority (illustrations and narration) run side by side
+        for priority in sorted({task.priority for task in tasks}):
+            await asyncio.gather(*(run(task) for task in tasks if task.priority == priority))
+    
+    async def drain(self, timeout: float = 30):
+        """Wait for background tasks to finish, e.g. on shutdown"""
+        if self._background:
+            print(f"[Executor] Waiting for {len(self._background)} background jobs")
+            await asyncio.wait(self._background, timeout=timeout)
+    
+    async def _run_task(self, task: Any, completed: set, results: Dict,
+                        pending: Optional[asyncio.Task] = None):
+        """Run a single task, or collect the result of an already started run"""
+        print(f"[Executor] Running {task.agent}.{task.action}")
+        start_time = datetime.now()
+        
+        try:
+            if pending is not None:
+                result = await pending
+            else:
                 agent = self.agents.get(task.agent)
                 if not agent:
                     raise ValueError(f"Unknown agent: {task.agent}")
@@ -71,23 +212,85 @@ class Executor:
                 
                 # Execute the task
                 result = await method(**task.params)
-                
-                # Store result
-                results[task.task_id] = result
-                results[f"{task.agent}_{task.action}"] = result
-                
-                # Mark as completed
-                completed.add(task.task_id)
-                
-                duration = (datetime.now() - start_time).total_seconds()
-                print(f"[Executor] Completed {task.agent}.{task.action} in {duration:.2f}s")
-                
-            except Exception as e:
-                print(f"[Executor] Error in {task.agent}.{task.action}: {str(e)}")
-                results[task.task_id] = {'error': str(e)}
-                
-        # Compile final results
-        return self._compile_results(results)
+            
+            # Store result
+            results[task.task_id] = result
+            results[f"{task.agent}_{task.action}"] = result
+            
+            duration = (datetime.now() - start_time).total_seconds()
+            metrics.observe(f"executor.{task.agent}.{task.action}", duration)
+            print(f"[Executor] Completed {task.agent}.{task.action} in {duration:.2f}s")
+            
+        except Exception as e:
+            print(f"[Executor] Error in {task.agent}.{task.action}: {str(e)}")
+            results[task.task_id] = {'error': str(e)}
+            
+        # Failed tasks also count as finished so dependents are not blocked forever
+        completed.add(task.task_id)
+    
+    async def _execute_speculative(self, task: Any, speculated: Any,
+                                   completed: set, results: Dict):
+        """
+        Start a task from a provisional result of one of its dependencies.
+        The run is cancelled and re-issued if the final result lands in a
+        different speculation key (e.g. a different emotion bucket).
+        """
+        agent = self.agents.get(task.agent)
+        other_deps = [dep for dep in task.depends_on or [] if dep != speculated.task_id]
+        await self._wait_for_dependencies(other_deps, completed)
+        
+        provisional = None
+        if speculated.task_id not in completed and not speculated.depends_on:
+            provisional = self._provisional_result(speculated)
+            
+        if provisional is None or not hasattr(agent, 'speculation_key'):
+            # Nothing to speculate with - run as a normal dependent task
+            await self._wait_for_dependencies(task.depends_on, completed)
+            await self._run_task(task, completed, results)
+            return
+        
+        params = self._inject_dependency_results(
+            dict(task.params), task.depends_on, {**results, speculated.task_id: provisional}
+        )
+        provisional_key = agent.speculation_key(params)
+        
+        print(f"[Executor] Speculatively starting {task.agent}.{task.action} (key: {provisional_key})")
+        metrics.increment('executor.speculation.started')
+        speculative_run = asyncio.create_task(getattr(agent, task.action)(**params))
+        
+        await self._wait_for_dependencies([speculated.task_id], completed)
+        final_params = self._inject_dependency_results(
+            dict(task.params), task.depends_on, results
+        )
+        
+        if agent.speculation_key(final_params) == provisional_key:
+            metrics.increment('executor.speculation.kept')
+            task.params = params
+            await self._run_task(task, completed, results, pending=speculative_run)
+            return
+        
+        # Final analysis changed the outcome - discard the speculative run
+        if not speculative_run.done():
+            speculative_run.cancel()
+            metrics.increment('llm.calls_cancelled')
+        metrics.increment('executor.speculation.cancelled')
+        print(f"[Executor] Speculation missed for {task.agent}.{task.action}, re-issuing")
+        
+        task.params = final_params
+        await self._run_task(task, completed, results)
+    
+    def _provisional_result(self, task: Any) -> Optional[Dict[str, Any]]:
+        """Fast provisional result from an agent's quick_<action> method, if it has one"""
+        agent = self.agents.get(task.agent)
+        quick = getattr(agent, f"quick_{task.action}", None)
+        if not quick:
+            return None
+        
+        try:
+            return quick(**task.params)
+        except Exception as e:
+            print(f"[Executor] Provisional {task.agent}.{task.action} failed: {e}")
+            return None
     
     async def _wait_for_dependencies(self, dependencies: List[str], completed: set):
         """Wait for dependent tasks to complete"""
@@ -108,6 +311,10 @@ class Executor:
                     params['emotion_context'] = dep_result['emotions']
                 if 'preferences' in dep_result:
                     params['preferences'] = dep_result['preferences']
+                if 'scenes' in dep_result:
+                    params['story_id'] = dep_result.get('id')
+                    params['scenes'] = dep_result['scenes']
+                    params['child_id'] = dep_result.get('childId')
         return params
     
     def _compile_results(self, results: Dict) -> Dict[str, Any]:
@@ -4,14 +4,12 @@ Can run in demo mode (for hackathon) or server mode (production)
 """
 import argparse
 import asyncio
+import importlib.util
 import os
 import subprocess
 import sys
 from datetime import datetime
 
-from planner import Planner
-from executor import Executor
-from memory import Memory
 from config import config
 
 async def demo_mode():
@@ -26,6 +24,9 @@ async def demo_mode():
     
     # Initialize core components
     print("Initializing AI agents...")
+    from planner import Planner
+    from executor import Executor
+    from memory import Memory
     planner = Planner()
     executor = Executor()
     memory = Memory()
@@ -111,7 +112,52 @@ async def demo_mode():
     print("✅ Demo completed successfully!")
     print("=" * 60)
 
-def server_mode():
+def available_cpus() -> int:
+    """CPUs this process may run on (respects container CPU pinning)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def production_server(workers: int = None):
+    """
+    Multi-worker production server.
+    Runs one uvicorn worker process per CPU (or WEB_CONCURRENCY / --workers),
+    each with its own event loop, database pool and CPU pool.
+    """
+    import uvicorn
+    
+    cpus = available_cpus()
+    workers = workers or config.SERVER_WORKERS or cpus
+    
+    # Workers are fresh processes that read these when they import config:
+    # the database connection budget and the CPUs are split between them
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    os.environ.setdefault('CPU_POOL_WORKERS', str(max(1, cpus // workers)))
+    
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    
+    print(f"✓ API server starting on http://{config.API_HOST}:{config.API_PORT}")
+    print(f"   {workers} workers ({cpus} CPUs), loop={loop}, http={http}, "
+          f"keep-alive={config.SERVER_KEEPALIVE}s, backlog={config.SERVER_BACKLOG}")
+    
+    uvicorn.run("api_server:app",
+               host=config.API_HOST,
+               port=config.API_PORT,
+               workers=workers,
+               loop=loop,
+               http=http,
+               backlog=config.SERVER_BACKLOG,
+               timeout_keep_alive=config.SERVER_KEEPALIVE,
+               timeout_graceful_shutdown=config.SERVER_GRACEFUL_TIMEOUT,
+               limit_concurrency=config.SERVER_LIMIT_CONCURRENCY or None,
+               proxy_headers=True,
+               forwarded_allow_ips="*",
+               log_level="info",
+               reload=False)  # No reload in production
+
+def server_mode(production: bool = False, workers: int = None):
     """
     Production server mode - runs backend API server
     """
@@ -120,6 +166,7 @@ def server_mode():
     
     # Check if running in Cloud Run
     is_cloud_run = os.getenv('K_SERVICE') is not None
+    production = production or is_cloud_run
     
     processes = []
     
@@ -133,15 +180,9 @@ def server_mode():
         # Start backend API server
         print("Starting API server...")
         
-        if is_cloud_run:
-            # In Cloud Run, run directly without subprocess
-            import uvicorn
-            print(f"✓ API server starting on http://{config.API_HOST}:{config.API_PORT}")
-            uvicorn.run("api_server:app", 
-                       host=config.API_HOST, 
-                       port=config.API_PORT,
-                       log_level="info",
-                       reload=False)  # No reload in production
+        if production:
+            # In Cloud Run / production, run directly without subprocess
+            production_server(workers)
         else:
             # Local development - use subprocess
             api_process = subprocess.Popen(
@@ -170,7 +211,7 @@ def server_mode():
                 print("   For local development with frontend:")
                 print("   cd src/frontend && npm run dev")
         
-        if not is_cloud_run:
+        if not production:
             print("\n✨ StoryGrow is running!")
             print("📱 Open http://localhost:3000 to use the app")
             print("📚 API docs available at http://localhost:8080/docs")
@@ -274,6 +315,16 @@ def main():
         action='store_true',
         help='Run tests to verify installation'
     )
+    parser.add_argument(
+        '--production',
+        action='store_true',
+        help='Run the API with multiple workers and no reload (default on Cloud Run)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Number of API worker processes in production (default: one per CPU)'
+    )
     
     args = parser.parse_args()
     
@@ -285,7 +336,7 @@ def main():
         test_mode()
     else:
         # Run server
-        server_mode()
+        server_mode(production=args.production, workers=args.workers)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
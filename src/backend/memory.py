@@ -5,6 +5,7 @@ Required for hackathon - demonstrates stateful agent memory.
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import asyncio
+import uuid
 
 from config import config
 
@@ -43,12 +44,26 @@ class Memory:
                 data['createdAt'] = datetime.now()
                 
             # Store document
-            self.db.collection(collection).document(doc_id).set(data, merge=True)
+            doc_ref = self.db.collection(collection).document(doc_id)
+            first_store = collection == 'stories' and 'childId' in data and not doc_ref.get().exists
+            doc_ref.set(data, merge=True)
             print(f"[Memory] Stored document {doc_id} in {collection}")
             
+            if first_store:
+                self._count_favorites(data['childId'], data.get('characters', []), data.get('themes', []))
+            
         except Exception as e:
             print(f"[Memory] Error storing document: {e}")
             
+    def _count_favorites(self, child_id: str, characters: List[str], themes: List[str]):
+        """Add a new story's characters and themes to the child's running counts"""
+        if not characters and not themes:
+            return
+        from google.cloud import firestore
+        counts = {'characters': {name: firestore.Increment(1) for name in characters},
+                  'themes': {name: firestore.Increment(1) for name in themes}}
+        self.db.collection('child_favorites').document(child_id).set(counts, merge=True)
+            
     async def retrieve(self, collection: str, doc_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve single document"""
         if not self.db:
@@ -64,6 +79,34 @@ class Memory:
             print(f"[Memory] Error retrieving document: {e}")
             return None
             
+    async def update_scene_images(self, story_id: str, images: List[Dict[str, Any]]):
+        """Back-fill image URLs for a story's scenes once illustrations are ready"""
+        story = await self.retrieve('stories', story_id)
+        if not story:
+            return
+            
+        urls = {image['sceneNumber']: image for image in images}
+        for scene in story.get('scenes', []):
+            image = urls.get(scene.get('sceneNumber'))
+            if image:
+                scene['imageUrl'] = image['imageUrl']
+                scene['thumbnailUrl'] = image.get('thumbnailUrl')
+                
+        await self.store('stories', story_id, {'scenes': story.get('scenes', [])})
+            
+    async def update_scene_audio(self, story_id: str, narration: List[Dict[str, Any]]):
+        """Back-fill narration URLs for a story's scenes once they are synthesised"""
+        story = await self.retrieve('stories', story_id)
+        if not story:
+            return
+            
+        urls = {item['sceneNumber']: item['audioUrl'] for item in narration if item.get('audioUrl')}
+        for scene in story.get('scenes', []):
+            if scene.get('sceneNumber') in urls:
+                scene['audioUrl'] = urls[scene['sceneNumber']]
+                
+        await self.store('stories', story_id, {'scenes': story.get('scenes', [])})
+            
     async def get_child_context(self, child_id: str) -> Dict[str, Any]:
         """
         Get comprehensive context for a child including:
@@ -118,19 +161,13 @@ class Memory:
                 for doc in stories
             ]
             
-            # Extract favorite elements from recent stories
-            all_characters = []
-            all_themes = []
-            for story in context['recent_stories']:
-                all_characters.extend(story.get('characters', []))
-                all_themes.extend(story.get('themes', []))
-                
-            # Count frequency
-            from collections import Counter
-            if all_characters or all_themes:
+            # Favourite elements from the counts kept as stories are stored
+            favorites = await self.retrieve('child_favorites', child_id)
+            if favorites:
+                from collections import Counter
                 context['favorite_elements'] = {
-                    'characters': Counter(all_characters).most_common(3),
-                    'themes': Counter(all_themes).most_common(3)
+                    kind: Counter(favorites.get(kind, {})).most_common(3)
+                    for kind in ('characters', 'themes')
                 }
             
             print(f"[Memory] Retrieved context for child {child_id}")
@@ -140,6 +177,26 @@ class Memory:
             print(f"[Memory] Error getting child context: {e}")
             return context
             
+    async def get_input_signatures(self, child_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Input signatures of the child's newest stories, for near-duplicate detection"""
+        if not self.db:
+            return []
+        from google.cloud import firestore
+        stories = (
+            self.db.collection('stories')
+            .where(filter=self.FieldFilter('childId', '==', child_id))
+            .order_by('createdAt', direction=firestore.Query.DESCENDING)
+            .limit(limit)
+            .get()
+        )
+        signatures = []
+        for doc in stories:
+            story = doc.to_dict()
+            signature = story.get('metadata', {}).get('inputSignature')
+            if signature:
+                signatures.append({'id': doc.id, 'title': story.get('title', ''), 'signature': signature})
+        return signatures
+            
     async def get_emotional_history(self, child_id: str, days: int = 7) -> List[Dict]:
         """Get emotion tracking history"""
         if not self.db:
@@ -175,4 +232,74 @@ class Memory:
             
         except Exception as e:
             print(f"[Memory] Error getting emotional history: {e}")
-            return []
\ No newline at end of file
+            return []
+            
+    async def store_alerts(self, alerts: List[Dict[str, Any]]) -> List[str]:
+        """Store several parent alerts in one batch write"""
+        if not self.db:
+            print("[Memory] Skipping store - Firestore not configured")
+            return []
+        alert_ids = [str(uuid.uuid4()) for _ in alerts]
+            
+        try:
+            batch = self.db.batch()
+            for alert_id, alert in zip(alert_ids, alerts):
+                batch.set(self.db.collection('alerts').document(alert_id), {
+                    **alert,
+                    'createdAt': datetime.now(),
+                    'updatedAt': datetime.now()
+                })
+            batch.commit()
+            print(f"[Memory] Stored {len(alerts)} alerts")
+            
+        except Exception as e:
+            print(f"[Memory] Error storing alerts: {e}")
+            
+        return alert_ids
+            
+    async def get_child_alerts(self, child_id: str, limit: int = 20) -> List[Dict]:
+        """Unread alerts for one child"""
+        if not self.db:
+            return []
+            
+        try:
+            alerts = (
+                self.db.collection('alerts')
+                .where(filter=self.FieldFilter('childId', '==', child_id))
+                .where(filter=self.FieldFilter('read', '==', False))
+                .limit(limit)
+                .get()
+            )
+            return [{**doc.to_dict(), 'id': doc.id} for doc in alerts]
+            
+        except Exception as e:
+            print(f"[Memory] Error getting alerts: {e}")
+            return []
+            
+    async def get_character_designs(self, child_id: str) -> List[Dict]:
+        """Get all stored character designs for a child (raises if they cannot be read)"""
+        if not self.db:
+            return []
+            
+        try:
+            designs = (
+                self.db.collection('character_designs')
+                .where(filter=self.FieldFilter('childId', '==', child_id))
+                .get()
+            )
+            return [doc.to_dict() for doc in designs]
+            
+        except Exception as e:
+            print(f"[Memory] Error getting character designs: {e}")
+            raise
+            
+    async def store_character_design(self, child_id: str, character_key: str,
+                                     style: str, design: Dict[str, Any]):
+        """Store a character design for a child"""
+        doc_id = f"{child_id}_{character_key}_{style}".replace('/', '_')
+        await self.store('character_designs', doc_id, {
+            **design,
+            'childId': child_id,
+            'characterKey': character_key,
+            'style': style
+        })
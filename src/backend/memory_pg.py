@@ -3,18 +3,42 @@ Memory management using PostgreSQL.
 Replaces Firestore with Cloud SQL for better relational data handling.
 """
 from typing import Dict, Any, List, Optional
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import asyncio
+import time
 import uuid
+import html
 import json
 
-from database import Database
+from database import Database, STATEMENTS, json_dumps
+from tools.images import thumbnail_url
+from tools.single_flight import single_flight
+from tools.metrics import metrics
+from tools.alert_stream import ALERT_CHANNEL
 from config import config
 
+# ts_headline markers, swapped for <mark> tags once the rest of the text is HTML-escaped
+_HIGHLIGHT_START, _HIGHLIGHT_STOP = '<mark>', '</mark>'
+
+def _highlighted(text: Optional[str]) -> str:
+    """HTML-escaped text with only the search highlight tags left as markup"""
+    parts = (text or '').split(_HIGHLIGHT_START)
+    escaped = [html.escape(parts[0])]
+    for part in parts[1:]:
+        match, _, rest = part.partition(_HIGHLIGHT_STOP)
+        escaped.append(f"<mark>{html.escape(match)}</mark>{html.escape(rest)}")
+    return ''.join(escaped)
+
 class MemoryPG:
     """
     Manages persistent memory using PostgreSQL.
     Stores child preferences, story history, and session data.
+    
+    Read methods take a consistency hint: 'eventual' (the default) may be
+    served by the read replica, 'strong' always reads the primary. Reads
+    about a child or story written by this process in the last
+    READ_YOUR_WRITES_WINDOW seconds go to the primary either way.
     """
     
     # Demo ID mappings
@@ -23,53 +47,91 @@ class MemoryPG:
         'demo_parent_456': '33333333-3333-3333-3333-333333333333'
     }
     
+    # Kid -> parent ids kept for alert writes (a kid's parent does not change)
+    PARENT_CACHE_SIZE = 10000
+    
     def __init__(self, db: Database):
         self.db = db
+        self._recent_writes: 'OrderedDict[str, float]' = OrderedDict()  # kid/story id -> write time
+        self._parents: 'OrderedDict[str, uuid.UUID]' = OrderedDict()  # kid id -> parent id
         print("[MemoryPG] Initialized with PostgreSQL backend")
             
     def _map_id(self, id_str: str) -> str:
         """Map demo IDs to real UUIDs"""
         return self.DEMO_MAPPINGS.get(id_str, id_str)
     
+    def _note_write(self, *ids: str):
+        """Remember ids just written so the next reads of them see the write"""
+        now = time.monotonic()
+        for id_str in ids:
+            self._recent_writes[id_str] = now
+            self._recent_writes.move_to_end(id_str)
+        
+        cutoff = now - config.READ_YOUR_WRITES_WINDOW
+        while self._recent_writes and next(iter(self._recent_writes.values())) < cutoff:
+            self._recent_writes.popitem(last=False)
+    
+    def _read_consistency(self, consistency: str, *ids: str) -> str:
+        """Upgrade an eventual read to the primary if any of the ids was written recently"""
+        if consistency != 'eventual':
+            return consistency
+        now = time.monotonic()
+        for id_str in ids:
+            written = self._recent_writes.get(id_str)
+            if written is not None and now - written < config.READ_YOUR_WRITES_WINDOW:
+                metrics.increment('memory.read_your_writes')
+                return 'strong'
+        return consistency
+    
     async def store_story(self, story_data: Dict[str, Any]) -> str:
         """Store a story in PostgreSQL"""
         try:
             story_id = story_data.get('id', str(uuid.uuid4()))
             kid_id = self._map_id(story_data.get('childId', 'demo_child_123'))
+            characters = story_data.get('characters', [])
+            themes = story_data.get('themes', [])
             
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire() as conn, conn.transaction():
                 # Insert story
-                await conn.execute("""
+                inserted = await conn.fetchval("""
                     INSERT INTO stories (id, kid_id, title, prompt, status, metadata)
                     VALUES ($1, $2, $3, $4, $5, $6)
                     ON CONFLICT (id) DO UPDATE SET
                         title = EXCLUDED.title,
                         metadata = EXCLUDED.metadata,
                         updated_at = NOW()
+                    RETURNING xmax = 0
                 """, 
                     uuid.UUID(story_id),
                     uuid.UUID(kid_id),
                     story_data.get('title', 'Untitled Story'),
                     story_data.get('metadata', {}).get('inputText', ''),
                     'completed',
-                    json.dumps(story_data.get('metadata', {}))
+                    {**story_data.get('metadata', {}), 'characters': characters, 'themes': themes}
                 )
                 
-                # Insert scenes
-                for scene in story_data.get('scenes', []):
+                # Count the story's characters and themes once, when it is first stored
+                if inserted and (characters or themes):
+                    await self._count_favorites(conn, kid_id, characters, themes)
+                
+                # Insert scenes in one statement, so the search vector trigger runs once
+                # (a repeated scene number keeps its last scene)
+                scenes = {scene.get('sceneNumber', 1): scene for scene in story_data.get('scenes', [])}
+                if scenes:
                     await conn.execute("""
                         INSERT INTO story_scenes (story_id, scene_number, text, image_prompt)
-                        VALUES ($1, $2, $3, $4)
+                        SELECT $1, scene.* FROM unnest($2::int[], $3::text[], $4::text[]) AS scene
                         ON CONFLICT (story_id, scene_number) DO UPDATE SET
                             text = EXCLUDED.text,
                             image_prompt = EXCLUDED.image_prompt
                     """,
                         uuid.UUID(story_id),
-                        scene.get('sceneNumber', 1),
-                        scene.get('text', ''),
-                        scene.get('imagePrompt', '')
+                        list(scenes),
+                        [scene.get('text', '') for scene in scenes.values()],
+                        [scene.get('imagePrompt', '') for scene in scenes.values()]
                     )
                 
+            self._note_write(kid_id, story_id)
             print(f"[MemoryPG] Stored story {story_id} for child {kid_id}")
             return story_id
             
@@ -77,28 +139,51 @@ class MemoryPG:
             print(f"[MemoryPG] Error storing story: {e}")
             raise
             
-    async def retrieve_story(self, story_id: str) -> Optional[Dict[str, Any]]:
+    async def _count_favorites(self, conn, kid_id: str, characters: List[str], themes: List[str]):
+        """
+        Add a story's characters and themes to the child's favourite counts.
+        Runs in a savepoint, so a failure (e.g. child_favorites not created
+        yet on a database migrate_schema.sql has not been run on) skips the
+        counts instead of failing the story store.
+        """
+        try:
+            async with conn.transaction():
+                await conn.execute("""
+                    INSERT INTO child_favorites (kid_id, kind, element, count)
+                    SELECT $1, kind, element, 1
+                    FROM unnest($2::text[], $3::text[]) AS e(kind, element)
+                    ON CONFLICT (kid_id, kind, element) DO UPDATE SET
+                        count = child_favorites.count + 1,
+                        last_seen = NOW()
+                """,
+                    uuid.UUID(kid_id),
+                    ['character'] * len(characters) + ['theme'] * len(themes),
+                    list(characters) + list(themes)
+                )
+        except Exception as e:
+            print(f"[MemoryPG] Error counting favorites: {e}")
+    
+    async def _favorite_rows(self, conn, query: str, *args) -> List[Any]:
+        """Favourite counts, or none if they cannot be read (see _count_favorites)"""
+        try:
+            return await conn.fetch(query, *args)
+        except Exception as e:
+            print(f"[MemoryPG] Error getting favorites: {e}")
+            return []
+    
+    @single_flight('memory.retrieve_story')
+    async def retrieve_story(self, story_id: str, consistency: str = 'eventual') -> Optional[Dict[str, Any]]:
         """Retrieve a story by ID"""
         try:
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire(self._read_consistency(consistency, story_id)) as conn:
                 # Get story
-                story_row = await conn.fetchrow("""
-                    SELECT s.*, k.name as child_name 
-                    FROM stories s
-                    JOIN kids k ON s.kid_id = k.id
-                    WHERE s.id = $1
-                """, uuid.UUID(story_id))
+                story_row = await conn.fetchrow(STATEMENTS['story_by_id'], uuid.UUID(story_id))
                 
                 if not story_row:
                     return None
                 
                 # Get scenes
-                scenes = await conn.fetch("""
-                    SELECT scene_number, text, image_prompt, image_url
-                    FROM story_scenes
-                    WHERE story_id = $1
-                    ORDER BY scene_number
-                """, uuid.UUID(story_id))
+                scenes = await conn.fetch(STATEMENTS['story_scenes'], uuid.UUID(story_id))
                 
                 # Build story object
                 story = {
@@ -110,7 +195,9 @@ class MemoryPG:
                             'sceneNumber': s['scene_number'],
                             'text': s['text'],
                             'imagePrompt': s['image_prompt'],
-                            'imageUrl': s['image_url']
+                            'imageUrl': s['image_url'],
+                            'thumbnailUrl': thumbnail_url(s['image_url']),
+                            'audioUrl': s['audio_url']
                         }
                         for s in scenes
                     ],
@@ -124,6 +211,174 @@ class MemoryPG:
         except Exception as e:
             print(f"[MemoryPG] Error retrieving story: {e}")
             return None
+    
+    async def search_stories(self, query: str, child_id: Optional[str] = None, parent_id: Optional[str] = None,
+                             limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Search the stories of one child, or of all a parent's children.
+        Matches the full text of titles, prompts and scenes (stories.search_vector)
+        plus fuzzy title matches, so misspelt titles are still found. Results
+        are ranked, with the matched words marked in the title and a snippet.
+        Only each child's SEARCH_CANDIDATES newest matches are ranked, which
+        bounds the cost of a word that appears in nearly every story.
+        """
+        started = time.monotonic()
+        async with self.db.acquire() as conn, conn.transaction():
+            if parent_id:
+                kid_ids = [row['id'] for row in await conn.fetch(
+                    "SELECT id FROM kids WHERE parent_id = $1", uuid.UUID(self._map_id(parent_id))
+                )]
+                if child_id:
+                    kid_ids = [kid_id for kid_id in kid_ids if str(kid_id) == self._map_id(child_id)]
+            else:
+                kid_ids = [uuid.UUID(self._map_id(child_id))]
+            
+            # Plan for the actual words: a rare word is found through the GIN
+            # index, a common one by walking the child's newest stories. A
+            # cached generic plan would pick one of them for every search.
+            await conn.execute("SET LOCAL plan_cache_mode = force_custom_plan")
+            rows = await conn.fetch("""
+                SELECT page.*,
+                       ts_headline('english', page.title, page.query,
+                                   'HighlightAll=true, StartSel=<mark>, StopSel=</mark>') AS title_highlight,
+                       ts_headline('english', page.prompt || ' ' || coalesce(
+                                       (SELECT string_agg(text, ' ' ORDER BY scene_number)
+                                        FROM story_scenes WHERE story_id = page.id), ''),
+                                   page.query,
+                                   'MaxFragments=2, MinWords=8, MaxWords=20, StartSel=<mark>, StopSel=</mark>') AS snippet
+                FROM (
+                    SELECT s.id, s.kid_id, k.name AS child_name, s.title, s.prompt, s.created_at, q.query,
+                           ts_rank(s.search_vector, q.query, 32) + word_similarity($2, s.title) AS rank
+                    FROM unnest($1::uuid[]) AS scope(kid_id)
+                    JOIN kids k ON k.id = scope.kid_id
+                    CROSS JOIN websearch_to_tsquery('english', $2) AS q(query)
+                    CROSS JOIN LATERAL (
+                        SELECT id, kid_id, title, prompt, created_at, search_vector
+                        FROM stories
+                        WHERE kid_id = scope.kid_id
+                        AND (search_vector @@ q.query OR $2 <% title)
+                        ORDER BY created_at DESC
+                        LIMIT $5
+                    ) s
+                    ORDER BY rank DESC, s.created_at DESC, s.id
+                    LIMIT $3 OFFSET $4
+                ) page
+                ORDER BY page.rank DESC, page.created_at DESC, page.id
+            """, kid_ids, query, limit + 1, offset, config.SEARCH_CANDIDATES)
+        metrics.observe('memory.story_search', time.monotonic() - started)
+        
+        page = rows[:limit]
+        return {
+            'query': query,
+            'results': [
+                {
+                    'id': str(row['id']),
+                    'childId': str(row['kid_id']),
+                    'childName': row['child_name'],
+                    'title': row['title'],
+                    'titleHighlight': _highlighted(row['title_highlight']),
+                    'snippet': _highlighted(row['snippet']),
+                    'rank': round(row['rank'], 4),
+                    'createdAt': row['created_at'].isoformat()
+                }
+                for row in page
+            ],
+            'next_offset': offset + limit if len(rows) > limit else None
+        }
+            
+    async def claim_story_request(self, key: str, child_id: str, ttl: float) -> Optional[Dict[str, Any]]:
+        """
+        Claim an idempotency key for a new story request.
+        Returns None when this caller should generate the story, otherwise
+        the existing request ({'status', 'response'}). Completed requests
+        older than ttl seconds, and pending ones older than the request
+        deadline (their worker died), can be claimed again.
+        """
+        async with self.db.acquire() as conn:
+            claimed = await conn.fetchval("""
+                INSERT INTO story_requests (idempotency_key, kid_id, status)
+                VALUES ($1, $2, 'pending')
+                ON CONFLICT (idempotency_key) DO UPDATE SET
+                    kid_id = EXCLUDED.kid_id,
+                    status = 'pending',
+                    response = NULL,
+                    created_at = NOW()
+                WHERE (story_requests.status = 'completed'
+                       AND story_requests.created_at < NOW() - make_interval(secs => $3))
+                   OR (story_requests.status = 'pending'
+                       AND story_requests.created_at < NOW() - make_interval(secs => $4))
+                RETURNING TRUE
+            """, key, uuid.UUID(self._map_id(child_id)), float(ttl), float(config.STORY_REQUEST_DEADLINE))
+            if claimed:
+                return None
+            return await self.get_story_request(key, conn=conn)
+
+    async def get_story_request(self, key: str, conn: Any = None) -> Optional[Dict[str, Any]]:
+        """Status and stored response of a story request, or None if there is none"""
+        if conn is None:
+            async with self.db.acquire() as conn:
+                return await self.get_story_request(key, conn=conn)
+
+        row = await conn.fetchrow("""
+            SELECT status, response FROM story_requests WHERE idempotency_key = $1
+        """, key)
+        return {'status': row['status'], 'response': row['response']} if row else None
+
+    async def complete_story_request(self, key: str, response: Dict[str, Any]):
+        """Store the response duplicates of this request will receive"""
+        async with self.db.acquire() as conn:
+            await conn.execute("""
+                UPDATE story_requests SET status = 'completed', response = $2, created_at = NOW()
+                WHERE idempotency_key = $1
+            """, key, response)
+
+    async def release_story_request(self, key: str):
+        """Drop a failed request's claim so a retry generates the story"""
+        async with self.db.acquire() as conn:
+            await conn.execute("""
+                DELETE FROM story_requests WHERE idempotency_key = $1 AND status = 'pending'
+            """, key)
+
+    async def update_scene_images(self, story_id: str, images: List[Dict[str, Any]]):
+        """Back-fill image URLs for a story's scenes once illustrations are ready"""
+        try:
+            async with self.db.acquire() as conn:
+                await conn.executemany("""
+                    UPDATE story_scenes
+                    SET image_url = $3
+                    WHERE story_id = $1 AND scene_number = $2
+                """, [
+                    (uuid.UUID(story_id), image['sceneNumber'], image['imageUrl'])
+                    for image in images
+                ])
+                
+            self._note_write(story_id)
+            print(f"[MemoryPG] Updated {len(images)} scene images for story {story_id}")
+            
+        except Exception as e:
+            print(f"[MemoryPG] Error updating scene images: {e}")
+            raise
+    
+    async def update_scene_audio(self, story_id: str, narration: List[Dict[str, Any]]):
+        """Back-fill narration URLs for a story's scenes once they are synthesised"""
+        narrated = [item for item in narration if item.get('audioUrl')]
+        try:
+            async with self.db.acquire() as conn:
+                await conn.executemany("""
+                    UPDATE story_scenes
+                    SET audio_url = $3
+                    WHERE story_id = $1 AND scene_number = $2
+                """, [
+                    (uuid.UUID(story_id), item['sceneNumber'], item['audioUrl'])
+                    for item in narrated
+                ])
+                
+            self._note_write(story_id)
+            print(f"[MemoryPG] Updated {len(narrated)} scene narrations for story {story_id}")
+            
+        except Exception as e:
+            print(f"[MemoryPG] Error updating scene audio: {e}")
+            raise
             
     async def store_session(self, session_data: Dict[str, Any]) -> str:
         """Store emotion session data"""
@@ -131,7 +386,7 @@ class MemoryPG:
             kid_id = self._map_id(session_data.get('childId', 'demo_child_123'))
             session_id = str(uuid.uuid4())
             
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire() as conn:
                 # Map mood to emotion_type enum and store emotion data
                 mood_map = {
                     'happy': 'happy',
@@ -158,10 +413,11 @@ class MemoryPG:
                     uuid.UUID(kid_id),
                     emotion,
                     intensity,
-                    json.dumps(session_data),  # Store full session as context
+                    json_dumps(session_data),  # Store full session as context
                     uuid.UUID(session_data.get('storyId')) if session_data.get('storyId') else None
                 )
                 
+            self._note_write(kid_id)
             print(f"[MemoryPG] Stored session {session_id}")
             return session_id
             
@@ -169,94 +425,203 @@ class MemoryPG:
             print(f"[MemoryPG] Error storing session: {e}")
             raise
             
-    async def store_alert(self, alert_data: Dict[str, Any]) -> str:
-        """Store parent alert"""
+    async def store_alert(self, alert_data: Dict[str, Any]) -> Optional[str]:
+        """Store parent alert (None if it was skipped)"""
+        alert_ids = await self.store_alerts([alert_data])
+        return alert_ids[0] if alert_ids else None
+    
+    async def store_alerts(self, alerts: List[Dict[str, Any]]) -> List[str]:
+        """
+        Store several parent alerts in one round trip.
+        Returns the ids of the alerts stored; alerts for kids without a
+        parent are skipped.
+        """
         try:
-            kid_id = self._map_id(alert_data.get('childId', 'demo_child_123'))
-            alert_id = str(uuid.uuid4())
+            kid_ids = [self._map_id(alert.get('childId', 'demo_child_123')) for alert in alerts]
+            alert_ids = []
             
-            # Get parent ID for the kid
-            async with self.db.pool.acquire() as conn:
-                parent_row = await conn.fetchrow("""
-                    SELECT parent_id FROM kids WHERE id = $1
-                """, uuid.UUID(kid_id))
+            async with self.db.acquire() as conn:
+                parents = await self._parent_ids(conn, kid_ids)
                 
-                if not parent_row:
-                    print(f"[MemoryPG] No parent found for kid {kid_id}")
-                    return alert_id
+                rows = []
+                for kid_id, alert in zip(kid_ids, alerts):
+                    if kid_id not in parents:
+                        print(f"[MemoryPG] No parent found for kid {kid_id}")
+                        continue
+                    rows.append((
+                        uuid.uuid4(),
+                        parents[kid_id],
+                        uuid.UUID(kid_id),
+                        alert.get('type', 'emotional_concern'),
+                        alert.get('severity', 'low'),
+                        alert.get('message', ''),
+                        {'concerns': alert.get('concerns', []), 'storyId': alert.get('storyId')}
+                    ))
                 
-                await conn.execute("""
-                    INSERT INTO alerts 
-                    (id, parent_id, kid_id, alert_type, severity, message, metadata, story_id)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-                """,
-                    uuid.UUID(alert_id),
-                    parent_row['parent_id'],
-                    uuid.UUID(kid_id),
-                    alert_data.get('type', 'emotional_concern'),
-                    alert_data.get('severity', 'low'),
-                    alert_data.get('message', ''),
-                    json.dumps({'concerns': alert_data.get('concerns', [])}),
-                    uuid.UUID(alert_data.get('storyId')) if alert_data.get('storyId') else None
-                )
+                if rows:
+                    # NOTIFY is delivered when the insert commits, to every API
+                    # worker streaming alerts (see tools/alert_stream.py)
+                    stored = await conn.fetch("""
+                        WITH inserted AS (
+                            INSERT INTO alerts
+                            (id, parent_id, kid_id, type, severity, message, metadata)
+                            SELECT id, parent_id, kid_id, type, severity::alert_severity, message, metadata
+                            FROM unnest($1::uuid[], $2::uuid[], $3::uuid[], $4::text[], $5::text[], $6::text[], $7::jsonb[])
+                                AS alert(id, parent_id, kid_id, type, severity, message, metadata)
+                            RETURNING *
+                        )
+                        SELECT i.id, pg_notify($8, json_build_object(
+                            'parentId', i.parent_id,
+                            'id', i.id,
+                            'childId', i.kid_id,
+                            'childName', k.name,
+                            'type', i.type,
+                            'severity', i.severity,
+                            'message', left(i.message, 2000),
+                            'concerns', COALESCE(i.metadata->'concerns', '[]'::jsonb),
+                            'storyId', i.metadata->>'storyId',
+                            'timestamp', i.created_at,
+                            'read', FALSE
+                        )::text)
+                        FROM inserted i
+                        LEFT JOIN kids k ON k.id = i.kid_id
+                    """, *map(list, zip(*rows)), ALERT_CHANNEL)
+                    alert_ids = [str(row['id']) for row in stored]
                 
-            print(f"[MemoryPG] Stored alert {alert_id}")
-            return alert_id
+            self._note_write(*set(kid_ids), *{str(parent_id) for parent_id in parents.values()})
+            metrics.increment('memory.alerts_stored', len(alert_ids))
+            print(f"[MemoryPG] Stored {len(alert_ids)} alerts")
+            return alert_ids
             
         except Exception as e:
-            print(f"[MemoryPG] Error storing alert: {e}")
+            print(f"[MemoryPG] Error storing alerts: {e}")
             raise
+    
+    async def _parent_ids(self, conn: Any, kid_ids: List[str]) -> Dict[str, uuid.UUID]:
+        """Parent of each kid, from the cache or one query for the missing ones"""
+        missing = {kid_id for kid_id in kid_ids if kid_id not in self._parents}
+        if missing:
+            rows = await conn.fetch("""
+                SELECT id, parent_id FROM kids WHERE id = ANY($1::uuid[])
+            """, [uuid.UUID(kid_id) for kid_id in missing])
+            for row in rows:
+                self._parents[str(row['id'])] = row['parent_id']
+            while len(self._parents) > self.PARENT_CACHE_SIZE:
+                self._parents.popitem(last=False)
+        else:
+            metrics.increment('memory.parent_cache_hits')
+        
+        return {kid_id: self._parents[kid_id] for kid_id in kid_ids if kid_id in self._parents}
+    
+    async def get_parent_alerts(self, parent_id: str, limit: int = 20, cursor: Optional[str] = None,
+                                child_id: Optional[str] = None,
+                                consistency: str = 'eventual') -> Dict[str, Any]:
+        """
+        Unread alerts for all of a parent's children, newest first.
+        Pages with a keyset cursor (the last alert's time and id), so each page
+        is a single range scan of the unread-alerts index, and later pages skip
+        the monthly partitions newer than the cursor. child_id narrows the
+        feed to one child.
+        """
+        real_parent_id = self._map_id(parent_id)
+        real_kid_id = self._map_id(child_id) if child_id else None
+        
+        before_time, before_id = None, None
+        if cursor:
+            before_time, _, before_id = cursor.partition('|')
+            before_time = datetime.fromisoformat(before_time)
+            before_id = uuid.UUID(before_id)
+        
+        async with self.db.acquire(self._read_consistency(consistency, real_parent_id, real_kid_id)) as conn:
+            rows = await conn.fetch("""
+                SELECT a.id, a.kid_id, k.name AS child_name, a.type, a.severity,
+                       a.message, a.metadata, a.created_at
+                FROM alerts a
+                JOIN kids k ON k.id = a.kid_id
+                WHERE a.parent_id = $1
+                AND a.is_read = FALSE
+                AND ($2::uuid IS NULL OR a.kid_id = $2)
+                AND ($3::timestamptz IS NULL OR (a.created_at, a.id) < ($3, $4::uuid))
+                AND ($3::timestamptz IS NULL OR a.created_at <= $3)
+                ORDER BY a.created_at DESC, a.id DESC
+                LIMIT $5
+            """,
+                uuid.UUID(real_parent_id),
+                uuid.UUID(real_kid_id) if real_kid_id else None,
+                before_time,
+                before_id,
+                limit + 1
+            )
+        
+        page = rows[:limit]
+        return {
+            'alerts': [
+                {
+                    'id': str(row['id']),
+                    'childId': str(row['kid_id']),
+                    'childName': row['child_name'],
+                    'type': row['type'],
+                    'severity': row['severity'],
+                    'message': row['message'],
+                    'concerns': (row['metadata'] or {}).get('concerns', []),
+                    'storyId': (row['metadata'] or {}).get('storyId'),
+                    'timestamp': row['created_at'].isoformat(),
+                    'read': False
+                }
+                for row in page
+            ],
+            'next_cursor': (
+                f"{page[-1]['created_at'].isoformat()}|{page[-1]['id']}" if len(rows) > limit else None
+            )
+        }
+    
+    async def get_parent_id(self, child_id: str) -> Optional[str]:
+        """The child's parent id (cached), or None for an unknown child"""
+        real_kid_id = self._map_id(child_id)
+        parent_id = self._parents.get(real_kid_id)
+        if parent_id is None:
+            async with self.db.acquire() as conn:
+                parent_id = (await self._parent_ids(conn, [real_kid_id])).get(real_kid_id)
+        return str(parent_id) if parent_id else None
+    
+    async def get_child_alerts(self, child_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Unread alerts for one child, through the parent's alert index"""
+        real_kid_id = self._map_id(child_id)
+        parent_id = await self.get_parent_id(real_kid_id)
+        if parent_id is None:
+            return []
+        feed = await self.get_parent_alerts(parent_id, limit=limit, child_id=real_kid_id)
+        return feed['alerts']
+    
+    async def mark_alerts_read(self, parent_id: str, alert_ids: List[str]) -> int:
+        """Mark a parent's alerts as read, returning how many changed"""
+        real_parent_id = self._map_id(parent_id)
+        async with self.db.acquire() as conn:
+            result = await conn.execute("""
+                UPDATE alerts SET is_read = TRUE
+                WHERE parent_id = $1 AND id = ANY($2::uuid[]) AND is_read = FALSE
+            """, uuid.UUID(real_parent_id), [uuid.UUID(alert_id) for alert_id in alert_ids])
+        
+        self._note_write(real_parent_id)
+        return int(result.split()[-1])
             
-    async def get_child_context(self, child_id: str) -> Dict[str, Any]:
+    @single_flight('memory.child_context')
+    async def get_child_context(self, child_id: str, consistency: str = 'eventual') -> Dict[str, Any]:
         """Get comprehensive context for a child"""
         try:
             real_kid_id = self._map_id(child_id)
             
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire(self._read_consistency(consistency, real_kid_id)) as conn:
                 # Get child info
-                child_row = await conn.fetchrow("""
-                    SELECT * FROM kids WHERE id = $1
-                """, uuid.UUID(real_kid_id))
+                child_row = await conn.fetchrow(STATEMENTS['kid_by_id'], uuid.UUID(real_kid_id))
                 
                 if not child_row:
-                    # Return default context
-                    return {
-                        'child_id': child_id,
-                        'preferences': {
-                            'age': 5,
-                            'favoriteCharacters': ['unicorn', 'dragon', 'fairy'],
-                            'favoriteThemes': ['adventure', 'friendship', 'magic']
-                        },
-                        'recent_stories': []
-                    }
-                
-                # Get recent stories
-                recent_stories = await conn.fetch("""
-                    SELECT id, title, created_at 
-                    FROM stories 
-                    WHERE kid_id = $1 
-                    ORDER BY created_at DESC 
-                    LIMIT 5
-                """, uuid.UUID(real_kid_id))
-                
-                context = {
-                    'child_id': child_id,
-                    'preferences': child_row['preferences'] or {
-                        'age': child_row['age'],
-                        'favoriteCharacters': ['unicorn', 'dragon', 'fairy'],
-                        'favoriteThemes': ['adventure', 'friendship', 'magic']
-                    },
-                    'recent_stories': [
-                        {
-                            'id': str(s['id']),
-                            'title': s['title'],
-                            'createdAt': s['created_at'].isoformat()
-                        }
-                        for s in recent_stories
-                    ]
-                }
+                    return self._child_context(child_id, None, [])
                 
-                return context
+                # Get recent stories and favourite characters/themes
+                recent_stories = await conn.fetch(STATEMENTS['recent_stories'], uuid.UUID(real_kid_id))
+                favorites = await self._favorite_rows(conn, STATEMENTS['child_favorites'], uuid.UUID(real_kid_id))
+                return self._child_context(child_id, child_row, recent_stories, favorites)
                 
         except Exception as e:
             print(f"[MemoryPG] Error getting child context: {e}")
@@ -265,19 +630,125 @@ class MemoryPG:
                 'preferences': {},
                 'recent_stories': []
             }
+    
+    async def get_child_contexts(self, child_ids: List[str],
+                                 consistency: str = 'eventual') -> List[Dict[str, Any]]:
+        """get_child_context for each of many children, with one query for the kids and one for their stories"""
+        real_ids = {child_id: self._map_id(child_id) for child_id in child_ids}
+        try:
+            kid_uuids = list({uuid.UUID(real_id) for real_id in real_ids.values()})
+        except ValueError as e:
+            print(f"[MemoryPG] Error getting child contexts: {e}")
+            return [await self.get_child_context(child_id) for child_id in child_ids]
+        
+        async with self.db.acquire(self._read_consistency(consistency, *real_ids.values())) as conn:
+            kid_rows = await conn.fetch("""
+                SELECT * FROM kids WHERE id = ANY($1::uuid[])
+            """, kid_uuids)
+            favorite_rows = await self._favorite_rows(conn, """
+                SELECT kid_id, kind, element, count
+                FROM (
+                    SELECT kid_id, kind, element, count,
+                           row_number() OVER (PARTITION BY kid_id, kind ORDER BY count DESC, last_seen DESC) AS position
+                    FROM child_favorites
+                    WHERE kid_id = ANY($1::uuid[])
+                ) ranked
+                WHERE position <= 3
+                ORDER BY kid_id, kind, position
+            """, kid_uuids)
+            story_rows = await conn.fetch("""
+                SELECT id, kid_id, title, created_at
+                FROM (
+                    SELECT id, kid_id, title, created_at,
+                           row_number() OVER (PARTITION BY kid_id ORDER BY created_at DESC) AS position
+                    FROM stories
+                    WHERE kid_id = ANY($1::uuid[])
+                ) recent
+                WHERE position <= 5
+                ORDER BY kid_id, created_at DESC
+            """, kid_uuids)
+        
+        kids = {str(row['id']): row for row in kid_rows}
+        stories: Dict[str, list] = {}
+        for row in story_rows:
+            stories.setdefault(str(row['kid_id']), []).append(row)
+        favorites: Dict[str, list] = {}
+        for row in favorite_rows:
+            favorites.setdefault(str(row['kid_id']), []).append(row)
+        
+        metrics.increment('memory.child_contexts_batched', len(child_ids))
+        return [
+            self._child_context(child_id, kids.get(real_ids[child_id]), stories.get(real_ids[child_id], []),
+                                favorites.get(real_ids[child_id], []))
+            for child_id in child_ids
+        ]
+    
+    def _child_context(self, child_id: str, child_row: Any, recent_stories: List[Any],
+                       favorite_rows: List[Any] = ()) -> Dict[str, Any]:
+        """Context dict of a child from its kids row (None for an unknown child), recent stories and favourites"""
+        if not child_row:
+            # Return default context
+            return {
+                'child_id': child_id,
+                'preferences': {
+                    'age': 5,
+                    'favoriteCharacters': ['unicorn', 'dragon', 'fairy'],
+                    'favoriteThemes': ['adventure', 'friendship', 'magic']
+                },
+                'recent_stories': []
+            }
+        
+        favorite_elements = {'characters': [], 'themes': []}
+        for row in favorite_rows:
+            favorite_elements['characters' if row['kind'] == 'character' else 'themes'].append(
+                (row['element'], row['count'])
+            )
+        
+        preferences = dict(child_row['preferences'] or {
+            'age': child_row['age'],
+            'favoriteCharacters': ['unicorn', 'dragon', 'fairy'],
+            'favoriteThemes': ['adventure', 'friendship', 'magic']
+        })
+        # Personalise from the child's story history unless favourites were set explicitly
+        for key, kind in (('favoriteCharacters', 'characters'), ('favoriteThemes', 'themes')):
+            if favorite_elements[kind] and not (child_row['preferences'] or {}).get(key):
+                preferences[key] = [name for name, _ in favorite_elements[kind]]
+        
+        return {
+            'child_id': child_id,
+            'preferences': preferences,
+            'favorite_elements': favorite_elements,
+            'recent_stories': [
+                {
+                    'id': str(s['id']),
+                    'title': s['title'],
+                    'createdAt': s['created_at'].isoformat()
+                }
+                for s in recent_stories
+            ]
+        }
             
-    async def get_emotional_history(self, child_id: str, days: int = 7) -> List[Dict]:
+    async def get_input_signatures(self, child_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Input signatures of the child's newest stories, for near-duplicate detection"""
+        async with self.db.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT id, title, metadata->'inputSignature' AS signature
+                FROM stories
+                WHERE kid_id = $1 AND metadata ? 'inputSignature'
+                ORDER BY created_at DESC
+                LIMIT $2
+            """, uuid.UUID(self._map_id(child_id)), limit)
+        return [{'id': str(row['id']), 'title': row['title'], 'signature': row['signature']} for row in rows]
+            
+    @single_flight('memory.emotional_history')
+    async def get_emotional_history(self, child_id: str, days: int = 7,
+                                    consistency: str = 'eventual') -> List[Dict]:
         """Get emotion tracking history"""
         try:
             real_kid_id = self._map_id(child_id)
             
-            async with self.db.pool.acquire() as conn:
-                sessions = await conn.fetch("""
-                    SELECT * FROM emotion_logs 
-                    WHERE kid_id = $1 
-                    AND created_at > NOW() - INTERVAL '{} days'
-                    ORDER BY created_at DESC
-                """.format(days), uuid.UUID(real_kid_id))
+            async with self.db.acquire(self._read_consistency(consistency, real_kid_id)) as conn:
+                sessions = await conn.fetch(STATEMENTS['emotional_history'], uuid.UUID(real_kid_id), days)
                 
                 return [
                     {
@@ -293,6 +764,61 @@ class MemoryPG:
             print(f"[MemoryPG] Error getting emotional history: {e}")
             return []
 
+    async def get_character_designs(self, child_id: str, consistency: str = 'eventual') -> List[Dict[str, Any]]:
+        """Get all stored character designs for a child (raises if they cannot be read)"""
+        try:
+            real_kid_id = self._map_id(child_id)
+            
+            async with self.db.acquire(self._read_consistency(consistency, real_kid_id)) as conn:
+                rows = await conn.fetch("""
+                    SELECT character_key, style, character, prompt, avatar_url
+                    FROM character_designs
+                    WHERE kid_id = $1
+                """, uuid.UUID(real_kid_id))
+                
+                return [
+                    {
+                        'character': r['character'],
+                        'characterKey': r['character_key'],
+                        'style': r['style'],
+                        'prompt': r['prompt'],
+                        'avatarUrl': r['avatar_url']
+                    }
+                    for r in rows
+                ]
+                
+        except Exception as e:
+            print(f"[MemoryPG] Error getting character designs: {e}")
+            raise
+            
+    async def store_character_design(self, child_id: str, character_key: str,
+                                     style: str, design: Dict[str, Any]):
+        """Store a character design; the first design for a character is kept"""
+        try:
+            real_kid_id = self._map_id(child_id)
+            
+            async with self.db.acquire() as conn:
+                await conn.execute("""
+                    INSERT INTO character_designs
+                    (kid_id, character_key, style, character, prompt, avatar_url)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    ON CONFLICT (kid_id, character_key, style) DO NOTHING
+                """,
+                    uuid.UUID(real_kid_id),
+                    character_key,
+                    style,
+                    design.get('character', character_key),
+                    design.get('prompt', ''),
+                    design.get('avatarUrl')
+                )
+                
+            self._note_write(real_kid_id)
+            print(f"[MemoryPG] Stored character design '{character_key}' for child {real_kid_id}")
+            
+        except Exception as e:
+            print(f"[MemoryPG] Error storing character design: {e}")
+            raise
+
     # Compatibility methods for existing code
     async def store(self, collection: str, doc_id: str, data: Dict[str, Any]):
         """Compatibility method for Firestore-style storage"""
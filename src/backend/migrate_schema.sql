@@ -0,0 +1,127 @@
+-- Brings a database created from an earlier cloud_sql_schema.sql up to date.
+-- cloud_sql_schema.sql (and /database/init) only works on an empty
+-- database; this script only adds what is missing, so it is safe to run
+-- again. Run partition_tables.sql separately to partition emotion_logs and
+-- alerts.
+--
+-- psql -h <host> -U postgres -d storygrow -f migrate_schema.sql
+
+BEGIN;
+
+-- Character designs, reused across stories for consistent illustrations
+CREATE TABLE IF NOT EXISTS public.character_designs (
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    character_key TEXT NOT NULL,
+    style TEXT NOT NULL,
+    character TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    avatar_url TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (kid_id, character_key, style)
+);
+
+-- Story creation requests by idempotency key
+CREATE TABLE IF NOT EXISTS public.story_requests (
+    idempotency_key TEXT PRIMARY KEY,
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'pending',  -- 'pending' or 'completed'
+    response JSONB,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- How often each character and theme appeared in a child's stories
+CREATE TABLE IF NOT EXISTS public.child_favorites (
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,  -- 'character' or 'theme'
+    element TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    last_seen TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (kid_id, kind, element)
+);
+
+-- Story search: full text over titles, prompts and scenes, fuzzy titles
+CREATE EXTENSION IF NOT EXISTS "pg_trgm";
+
+ALTER TABLE public.stories ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;
+
+CREATE OR REPLACE FUNCTION public.story_search_vector(story UUID, story_title TEXT, story_prompt TEXT)
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('english', coalesce(story_title, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(story_prompt, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(
+               (SELECT string_agg(text, ' ' ORDER BY scene_number)
+                FROM public.story_scenes WHERE story_id = story), ''
+           )), 'C');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.update_story_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector = public.story_search_vector(NEW.id, NEW.title, NEW.prompt);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Runs once per statement, so a story whose scenes are written together
+-- is recomputed once rather than once per scene
+CREATE OR REPLACE FUNCTION public.update_scene_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE public.stories
+        SET search_vector = public.story_search_vector(id, title, prompt)
+        WHERE id IN (SELECT story_id FROM new_scenes);
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE public.stories
+        SET search_vector = public.story_search_vector(id, title, prompt)
+        WHERE id IN (SELECT story_id FROM old_scenes);
+    ELSE
+        UPDATE public.stories
+        SET search_vector = public.story_search_vector(id, title, prompt)
+        WHERE id IN (
+            SELECT new_scenes.story_id
+            FROM new_scenes JOIN old_scenes ON old_scenes.id = new_scenes.id
+            WHERE old_scenes.text IS DISTINCT FROM new_scenes.text
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_stories_search_vector ON public.stories;
+CREATE TRIGGER update_stories_search_vector BEFORE INSERT OR UPDATE OF title, prompt ON public.stories
+    FOR EACH ROW EXECUTE FUNCTION update_story_search_vector();
+
+-- Replaced by the statement-level insert and delete triggers
+DROP TRIGGER IF EXISTS update_story_scenes_search_vector ON public.story_scenes;
+
+DROP TRIGGER IF EXISTS update_story_scenes_insert_search_vector ON public.story_scenes;
+CREATE TRIGGER update_story_scenes_insert_search_vector AFTER INSERT ON public.story_scenes
+    REFERENCING NEW TABLE AS new_scenes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_scene_search_vector();
+
+DROP TRIGGER IF EXISTS update_story_scenes_delete_search_vector ON public.story_scenes;
+CREATE TRIGGER update_story_scenes_delete_search_vector AFTER DELETE ON public.story_scenes
+    REFERENCING OLD TABLE AS old_scenes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_scene_search_vector();
+
+DROP TRIGGER IF EXISTS update_story_scenes_text_search_vector ON public.story_scenes;
+CREATE TRIGGER update_story_scenes_text_search_vector AFTER UPDATE ON public.story_scenes
+    REFERENCING OLD TABLE AS old_scenes NEW TABLE AS new_scenes
+    FOR EACH STATEMENT EXECUTE FUNCTION update_scene_search_vector();
+
+-- Stories written before the triggers existed
+UPDATE public.stories
+SET search_vector = public.story_search_vector(id, title, prompt)
+WHERE search_vector IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_stories_search ON public.stories USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_stories_title_trgm ON public.stories USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_stories_kid_created ON public.stories(kid_id, created_at DESC);
+
+-- Unread alert feed per parent
+CREATE INDEX IF NOT EXISTS idx_alerts_parent_unread ON public.alerts(parent_id, created_at DESC, id DESC) WHERE is_read = FALSE;
+
+COMMIT;
+
+ANALYZE public.stories;
@@ -0,0 +1,93 @@
+-- One-off migration of emotion_logs and alerts to monthly partitions
+-- (databases created from cloud_sql_schema.sql before they were partitioned).
+-- Copies every row into a partitioned table with one partition per month
+-- that has data, then swaps the tables. Writes to both tables wait until it
+-- commits. Afterwards the app (tools/partitions.py) keeps partitions created
+-- ahead of time.
+--
+-- psql -h <host> -U postgres -d storygrow -f partition_tables.sql
+
+BEGIN;
+SET LOCAL timezone = 'UTC';
+
+LOCK TABLE public.emotion_logs, public.alerts IN EXCLUSIVE MODE;
+
+-- Free the old tables' index and constraint names
+ALTER TABLE public.emotion_logs RENAME TO emotion_logs_unpartitioned;
+ALTER TABLE public.emotion_logs_unpartitioned RENAME CONSTRAINT emotion_logs_pkey TO emotion_logs_unpartitioned_pkey;
+DROP INDEX IF EXISTS public.idx_emotion_logs_kid_id;
+DROP INDEX IF EXISTS public.idx_emotion_logs_created_at;
+
+ALTER TABLE public.alerts RENAME TO alerts_unpartitioned;
+ALTER TABLE public.alerts_unpartitioned RENAME CONSTRAINT alerts_pkey TO alerts_unpartitioned_pkey;
+DROP INDEX IF EXISTS public.idx_alerts_parent_id;
+DROP INDEX IF EXISTS public.idx_alerts_is_read;
+DROP INDEX IF EXISTS public.idx_alerts_parent_unread;
+
+CREATE TABLE public.emotion_logs (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    emotion emotion_type NOT NULL,
+    intensity INTEGER CHECK (intensity >= 1 AND intensity <= 5),
+    context TEXT,
+    story_id UUID REFERENCES public.stories(id) ON DELETE SET NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE public.emotion_logs_default PARTITION OF public.emotion_logs DEFAULT;
+
+CREATE TABLE public.alerts (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    parent_id UUID NOT NULL REFERENCES public.parents(id) ON DELETE CASCADE,
+    kid_id UUID NOT NULL REFERENCES public.kids(id) ON DELETE CASCADE,
+    type TEXT NOT NULL,
+    severity alert_severity NOT NULL,
+    message TEXT NOT NULL,
+    is_read BOOLEAN DEFAULT FALSE,
+    metadata JSONB DEFAULT '{}'::jsonb,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE public.alerts_default PARTITION OF public.alerts DEFAULT;
+
+-- One partition per month with rows, plus the current month, named like
+-- emotion_logs_2024_05 (the names tools/partitions.py expects)
+DO $$
+DECLARE
+    parent TEXT;
+    month TIMESTAMPTZ;
+BEGIN
+    FOREACH parent IN ARRAY ARRAY['emotion_logs', 'alerts'] LOOP
+        FOR month IN EXECUTE format(
+            'SELECT DISTINCT date_trunc(''month'', created_at AT TIME ZONE ''UTC'') AT TIME ZONE ''UTC''
+             FROM public.%I WHERE created_at IS NOT NULL
+             UNION SELECT date_trunc(''month'', NOW() AT TIME ZONE ''UTC'') AT TIME ZONE ''UTC''',
+            parent || '_unpartitioned')
+        LOOP
+            EXECUTE format(
+                'CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+                parent || to_char(month AT TIME ZONE 'UTC', '_YYYY_MM'), parent,
+                month, month + INTERVAL '1 month');
+        END LOOP;
+    END LOOP;
+END $$;
+
+INSERT INTO public.emotion_logs (id, kid_id, emotion, intensity, context, story_id, created_at)
+SELECT id, kid_id, emotion, intensity, context, story_id, COALESCE(created_at, NOW())
+FROM public.emotion_logs_unpartitioned;
+
+INSERT INTO public.alerts (id, parent_id, kid_id, type, severity, message, is_read, metadata, created_at)
+SELECT id, parent_id, kid_id, type, severity, message, is_read, metadata, COALESCE(created_at, NOW())
+FROM public.alerts_unpartitioned;
+
+CREATE INDEX idx_emotion_logs_kid_created ON public.emotion_logs(kid_id, created_at DESC);
+CREATE INDEX idx_alerts_parent_id ON public.alerts(parent_id);
+CREATE INDEX idx_alerts_parent_unread ON public.alerts(parent_id, created_at DESC, id DESC) WHERE is_read = FALSE;
+
+DROP TABLE public.emotion_logs_unpartitioned;
+DROP TABLE public.alerts_unpartitioned;
+
+COMMIT;
+
+ANALYZE public.emotion_logs;
+ANALYZE public.alerts;
@@ -20,6 +20,10 @@ class Task:
     params: Dict[str, Any]
     priority: int
     depends_on: Optional[List[str]] = None
+    speculate_on: Optional[str] = None  # Dependency that may be replaced by a provisional result
+    background: bool = False  # Run after the response is sent (e.g. illustrations)
+    replaces: Optional[str] = None  # Batch task: the per-request 'agent.action' its results stand in for
+    batch_indices: Optional[List[int]] = None  # Batch task: request each result belongs to
 
 class Planner:
     """
@@ -28,7 +32,7 @@ class Planner:
     """
     
     def __init__(self):
-        self.gemini = GeminiClient()
+        self.gemini = GeminiClient('planner')
         self.task_counter = 0
         
     def _generate_task_id(self) -> str:
@@ -97,10 +101,12 @@ class Planner:
                 'child_id': user_input['child_id'],
                 'preferences': {},  # Will be filled by memory task
                 'educational_focus': user_input.get('educational_focus', []),
-                'include_elements': user_input.get('include_elements', [])
+                'include_elements': user_input.get('include_elements', []),
+                'similar_story': user_input.get('similar_story')
             },
             priority=3,
-            depends_on=[emotion_task.task_id, memory_task.task_id]
+            depends_on=[emotion_task.task_id, memory_task.task_id],
+            speculate_on=emotion_task.task_id if config.SPECULATIVE_STORY_GENERATION else None
         )
         tasks.append(story_task)
         
@@ -111,10 +117,28 @@ class Planner:
             action='create_scene_images',
             params={'story_id': None},  # Will be filled after story generation
             priority=4,
-            depends_on=[story_task.task_id]
+            depends_on=[story_task.task_id],
+            background=True
         )
         tasks.append(illustrate_task)
         
+        # Task 6: Narrate scenes (alongside the illustrations)
+        if config.NARRATION_ENABLED and user_input.get('narrate', True):
+            narrate_task = Task(
+                task_id=self._generate_task_id(),
+                agent='narrator',
+                action='narrate_scenes',
+                params={
+                    'story_id': None,  # Will be filled after story generation
+                    'voice': user_input.get('narration_voice'),
+                    'speed': user_input.get('narration_speed')
+                },
+                priority=4,
+                depends_on=[story_task.task_id],
+                background=True
+            )
+            tasks.append(narrate_task)
+        
         # Log the plan
         print(f"[Planner] Created {len(tasks)} tasks for story generation")
         for task in tasks:
@@ -122,6 +146,48 @@ class Planner:
             
         return tasks
     
+    async def plan_batch(self, user_inputs: List[Dict[str, Any]]) -> List[Task]:
+        """
+        Plan the work a batch of story requests can share: one emotion
+        analysis covering every text input and one context load covering
+        every child. Executor.execute_shared() splits their results per
+        request, where they stand in for the matching tasks of each
+        request's own plan.
+        """
+        tasks = []
+        
+        text_indices = [i for i, user_input in enumerate(user_inputs) if not user_input.get('audio_url')]
+        if text_indices:
+            tasks.append(Task(
+                task_id=self._generate_task_id(),
+                agent='emotion_detector',
+                action='analyze_emotions',
+                params={'items': [
+                    {
+                        'text': user_inputs[i].get('text_input', ''),
+                        'mood': user_inputs[i].get('session_mood', 'neutral'),
+                        'audio_features': user_inputs[i].get('audio_features', {})
+                    }
+                    for i in text_indices
+                ]},
+                priority=2,
+                replaces='emotion_detector.analyze_emotion',
+                batch_indices=text_indices
+            ))
+        
+        tasks.append(Task(
+            task_id=self._generate_task_id(),
+            agent='memory',
+            action='get_child_contexts',
+            params={'child_ids': [user_input['child_id'] for user_input in user_inputs]},
+            priority=2,
+            replaces='memory.get_child_context',
+            batch_indices=list(range(len(user_inputs)))
+        ))
+        
+        print(f"[Planner] Created {len(tasks)} shared tasks for {len(user_inputs)} stories")
+        return tasks
+    
     async def plan_quest(self, quest_input: Dict[str, Any]) -> List[Task]:
         """Plan tasks for quest/chore gamification"""
         # Implementation for quest planning
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control of story generation (tools/admission.py)
+Run: python -m pytest -q test_admission.py
+"""
+import asyncio
+import json
+
+import pytest
+
+from config import config
+from tools.admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+async def hold_slot(controller: AdmissionController, release: asyncio.Event):
+    async with controller.admit('holder'):
+        await release.wait()
+
+
+async def queued_in_order(controller: AdmissionController, requests) -> list:
+    """Queue (name, family, lane) requests behind a held slot; the order they run in"""
+    order, release = [], asyncio.Event()
+    holder = asyncio.ensure_future(hold_slot(controller, release))
+    await asyncio.sleep(0)
+
+    async def request(name, family, lane):
+        async with controller.admit(family, lane=lane):
+            order.append(name)
+
+    waiting = []
+    for name, family, lane in requests:
+        waiting.append(asyncio.ensure_future(request(name, family, lane)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *waiting)
+    return order
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate=2.0, burst=4)
+    bucket.tokens = 0
+    assert bucket.wait_time() == pytest.approx(0.5, abs=0.01)
+
+    bucket.updated -= 1.0  # a second passes
+    assert bucket.wait_time() == 0.0
+    assert bucket.tokens == pytest.approx(2.0, abs=0.01)
+
+    bucket.updated -= 60.0
+    bucket.refill()
+    assert bucket.tokens == 4  # never above the burst
+
+
+def test_child_rate_limit_sheds_with_retry_after(monkeypatch):
+    monkeypatch.setattr(config, 'CHILD_STORIES_PER_MINUTE', 4)
+    monkeypatch.setattr(config, 'CHILD_STORY_BURST', 2)
+
+    async def run():
+        controller = AdmissionController()
+        for _ in range(2):
+            async with controller.admit('family', 'kid'):
+                pass
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit('family', 'kid'):
+                pass
+        assert rejected.value.reason == 'rate_limited'
+        assert rejected.value.retry_after == 15  # one story every 15 seconds
+        # The family's other child is still admitted: the rejection took no family token
+        async with controller.admit('family', 'sibling'):
+            pass
+        return controller._buckets['family:family'].tokens
+
+    assert asyncio.run(run()) == pytest.approx(config.FAMILY_STORY_BURST - 3, abs=0.01)
+
+
+def test_lanes_are_served_in_priority_order(monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_MAX_CONCURRENT', 1)
+    order = asyncio.run(queued_in_order(AdmissionController(), [
+        ('background', 'a', 'background'),
+        ('batch', 'b', 'batch'),
+        ('interactive', 'c', 'interactive'),
+    ]))
+    assert order == ['interactive', 'batch', 'background']
+
+
+def test_families_take_turns_within_a_lane(monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_MAX_CONCURRENT', 1)
+    order = asyncio.run(queued_in_order(AdmissionController(), [
+        ('busy-1', 'busy', 'batch'),
+        ('busy-2', 'busy', 'batch'),
+        ('busy-3', 'busy', 'batch'),
+        ('quiet-1', 'quiet', 'batch'),
+    ]))
+    assert order == ['busy-1', 'quiet-1', 'busy-2', 'busy-3']
+
+
+def test_queue_timeout_sheds_and_refunds_tokens(monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_MAX_CONCURRENT', 1)
+    monkeypatch.setattr(config, 'ADMISSION_QUEUE_TIMEOUT', 0.05)
+
+    async def run():
+        controller, release = AdmissionController(), asyncio.Event()
+        holder = asyncio.ensure_future(hold_slot(controller, release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit('family', 'kid'):
+                pass
+        release.set()
+        await holder
+        assert rejected.value.reason == 'queue_timeout'
+        assert controller._queued['interactive'] == 0 and controller.in_flight == 0
+        return controller._buckets['family:family'].tokens
+
+    assert asyncio.run(run()) == pytest.approx(config.FAMILY_STORY_BURST, abs=0.01)
+
+
+def test_full_family_queue_is_shed(monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_MAX_CONCURRENT', 1)
+    monkeypatch.setattr(config, 'ADMISSION_FAMILY_QUEUE', 1)
+
+    async def request(controller, family):
+        async with controller.admit(family):
+            pass
+
+    async def run():
+        controller, release = AdmissionController(), asyncio.Event()
+        holder = asyncio.ensure_future(hold_slot(controller, release))
+        await asyncio.sleep(0)
+        queued = [asyncio.ensure_future(request(controller, family)) for family in ('family', 'other')]
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await request(controller, 'family')
+        release.set()
+        await asyncio.gather(holder, *queued)
+        return rejected.value
+
+    assert asyncio.run(run()).reason == 'family_queue_full'
+
+
+def test_batch_is_charged_once_to_the_batch_budget(monkeypatch):
+    monkeypatch.setattr(config, 'BATCH_STORIES_PER_MINUTE', 25)
+    monkeypatch.setattr(config, 'BATCH_STORY_BURST', 50)
+    controller = AdmissionController()
+
+    controller.admit_batch({'teacher': 25})
+    controller.admit_batch({'teacher': 25})
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit_batch({'teacher': 25, 'parent': 1})
+    assert rejected.value.reason == 'batch_rate_limited'
+    # All or nothing: the other family was not charged
+    controller.admit_batch({'parent': 50})
+
+
+def test_batch_stories_skip_the_interactive_limits(monkeypatch):
+    monkeypatch.setattr(config, 'ADMISSION_MAX_CONCURRENT', 2)
+    monkeypatch.setattr(config, 'ADMISSION_FAMILY_QUEUE', 1)
+    monkeypatch.setattr(config, 'ADMISSION_QUEUE_TIMEOUT', 0.05)
+
+    async def run():
+        controller = AdmissionController()
+
+        async def story():
+            async with controller.admit('teacher', 'kid', 'batch'):
+                await asyncio.sleep(0.02)
+
+        # 25 stories of one family and child, waiting longer than the queue timeout
+        await asyncio.gather(*(story() for _ in range(25)))
+        assert controller.in_flight == 0
+        # ... and they did not spend the family's interactive tokens
+        async with controller.admit('teacher', 'kid'):
+            pass
+    asyncio.run(run())
+
+
+@pytest.fixture
+def demo_app(monkeypatch, tmp_path):
+    """api_server in demo mode: no database, mock LLM, work inline, fresh admission state"""
+    import api_server
+    from database import db
+
+    async def no_database():
+        return False
+
+    monkeypatch.setattr(db, 'connect', no_database)
+    monkeypatch.setattr(api_server.cpu_pool, 'workers', 0)
+    monkeypatch.setattr(api_server, 'admission', AdmissionController())
+    monkeypatch.setattr(config, 'STARTUP_WARMUP', False)
+    monkeypatch.setattr(config, 'NARRATION_ENABLED', False)
+    monkeypatch.setattr(config, 'IMAGE_STORE_DIR', str(tmp_path))
+    return api_server.app
+
+
+def test_full_size_batch_from_one_family_is_accepted(demo_app):
+    from fastapi.testclient import TestClient
+
+    size = 25
+    with TestClient(demo_app) as client:
+        response = client.post('/api/story/batch', json={'stories': [
+            {'child_id': 'batch_test_child', 'text_input': f"a dragon called number {i} flew to the moon"}
+            for i in range(size)
+        ]})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert lines[-1] == {'done': True, 'completed': size, 'total': size}
+    assert sorted(line['index'] for line in lines[:-1]) == list(range(size))
+
+
+def test_rejected_story_answers_429_with_retry_after(demo_app, monkeypatch):
+    from fastapi.testclient import TestClient
+    # Without a database a child is its own family
+    monkeypatch.setattr(config, 'FAMILY_STORIES_PER_MINUTE', 2)
+    monkeypatch.setattr(config, 'FAMILY_STORY_BURST', 1)
+
+    with TestClient(demo_app) as client:
+        def create(text):
+            return client.post('/api/story/create', json={
+                'child_id': 'rate_test_child', 'text_input': text, 'allow_reuse': False
+            })
+
+        assert create('a turtle learned to swim').status_code == 200
+        response = create('a kite flew over the hills')
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert response.json()['reason'] == 'rate_limited'
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Tests for the session cache and bearer-token middleware (auth.py)
+Run: python -m pytest -q test_auth.py
+"""
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import auth as auth_module
+from auth import AuthMiddleware, SessionAuth, Principal, STREAM_PATHS
+from config import config
+from tools.metrics import metrics
+
+PARENT_ROW = {'user_id': 'u-1', 'role': 'parent', 'parent_id': 'p-1', 'kid_ids': ['k-1', 'k-2']}
+
+
+class FakeDatabase:
+    """Answers SESSION_QUERY from a dict of token -> row, counting queries"""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.queries = 0
+        self.pool = object()
+
+    @asynccontextmanager
+    async def acquire(self, consistency: str = 'strong'):
+        yield self
+
+    async def fetchrow(self, query, token):
+        self.queries += 1
+        await asyncio.sleep(0.01)
+        row = self.sessions.get(token)
+        return row if row and row['expires_at'] > datetime.now(timezone.utc) else None
+
+    async def execute(self, query, user_id, token, ttl):
+        # INSERT INTO sessions for a stream token
+        self.sessions[token] = session(expires_in=ttl, user_id=user_id)
+
+
+def session(expires_in: float = 3600, **row):
+    return {**PARENT_ROW, **row, 'expires_at': datetime.now(timezone.utc) + timedelta(seconds=expires_in)}
+
+
+def resolver(sessions) -> SessionAuth:
+    sessions_auth = SessionAuth()
+    sessions_auth._db = FakeDatabase(sessions)  # no sweeper: tests call sweep() directly
+    return sessions_auth
+
+
+def test_valid_token_is_cached():
+    sessions_auth = resolver({'good': session()})
+    hits = metrics.counter('auth.cache_hits')
+
+    async def run():
+        first = await sessions_auth.resolve('good')
+        second = await sessions_auth.resolve('good')
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert first.parent_id == 'p-1' and first.kid_ids == {'k-1', 'k-2'}
+    assert first.can_access_child('k-1') and not first.can_access_child('k-9')
+    assert sessions_auth._db.queries == 1
+    assert metrics.counter('auth.cache_hits') == hits + 1
+
+
+def test_concurrent_lookups_share_one_query():
+    sessions_auth = resolver({'good': session()})
+
+    async def run():
+        return await asyncio.gather(*(sessions_auth.resolve('good') for _ in range(5)))
+
+    assert len({id(principal) for principal in asyncio.run(run())}) == 1
+    assert sessions_auth._db.queries == 1
+
+
+def test_invalid_token_is_negatively_cached():
+    sessions_auth = resolver({})
+    rejected = metrics.counter('auth.rejected')
+
+    async def run():
+        return [await sessions_auth.resolve('bad') for _ in range(3)]
+
+    assert asyncio.run(run()) == [None, None, None]
+    assert sessions_auth._db.queries == 1
+    assert metrics.counter('auth.rejected') == rejected + 1
+
+
+def test_cache_entries_expire(monkeypatch):
+    monkeypatch.setattr(config, 'AUTH_CACHE_TTL', 0.05)
+    monkeypatch.setattr(config, 'AUTH_NEGATIVE_TTL', 0.05)
+    sessions = {'good': session()}
+    sessions_auth = resolver(sessions)
+
+    async def run():
+        assert await sessions_auth.resolve('good') is not None
+        assert await sessions_auth.resolve('bad') is None
+        await asyncio.sleep(0.1)
+        # The session was revoked meanwhile: the next lookup sees it
+        del sessions['good']
+        assert await sessions_auth.resolve('good') is None
+        assert await sessions_auth.resolve('bad') is None
+
+    asyncio.run(run())
+    assert sessions_auth._db.queries == 4
+
+
+def test_entry_never_outlives_the_session(monkeypatch):
+    monkeypatch.setattr(config, 'AUTH_CACHE_TTL', 3600)
+    sessions_auth = resolver({'ending': session(expires_in=0.05)})
+
+    async def run():
+        await sessions_auth.resolve('ending')
+        await asyncio.sleep(0.1)
+        await sessions_auth.resolve('ending')
+
+    asyncio.run(run())
+    assert sessions_auth._db.queries == 2
+
+
+def test_revoked_session_is_trusted_until_its_entry_expires():
+    sessions = {'good': session()}
+    sessions_auth = resolver(sessions)
+
+    async def run():
+        await sessions_auth.resolve('good')
+        del sessions['good']
+        return await sessions_auth.resolve('good')
+
+    # AUTH_CACHE_TTL bounds how long a logout takes to apply
+    assert asyncio.run(run()) is not None
+    assert sessions_auth._db.queries == 1
+
+
+def test_sweep_evicts_expired_entries(monkeypatch):
+    monkeypatch.setattr(config, 'AUTH_NEGATIVE_TTL', 0.01)
+    sessions_auth = resolver({'good': session()})
+
+    async def run():
+        await sessions_auth.resolve('good')
+        await sessions_auth.resolve('bad')
+        sessions_auth._db.pool = None  # skip deleting expired sessions
+        await asyncio.sleep(0.02)
+        return await sessions_auth.sweep()
+
+    assert asyncio.run(run()) == {'evicted': 1, 'deleted': 0}
+    assert list(sessions_auth._cache) == ['good']
+
+
+# ----------------------------------------------------------------------
+# AuthMiddleware
+# ----------------------------------------------------------------------
+
+async def whoami(request):
+    principal = request.state.principal
+    return JSONResponse({'user': principal.user_id if principal else None})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(auth_module, 'auth', resolver({'good': session()}))
+    stream_path, = STREAM_PATHS
+    app = Starlette(routes=[Route('/api/whoami', whoami), Route('/media/whoami', whoami), Route(stream_path, whoami)])
+    app.add_middleware(AuthMiddleware)
+    return TestClient(app)
+
+
+def test_middleware_sets_the_principal(client):
+    response = client.get('/api/whoami', headers={'Authorization': 'Bearer good'})
+    assert response.status_code == 200
+    assert response.json() == {'user': 'u-1'}
+
+
+def test_middleware_rejects_bad_tokens(client):
+    response = client.get('/api/whoami', headers={'Authorization': 'Bearer bad'})
+    assert response.status_code == 401
+    assert response.headers['WWW-Authenticate'] == 'Bearer'
+    # Even on public routes
+    assert client.get('/media/whoami', headers={'Authorization': 'Bearer bad'}).status_code == 401
+
+
+def test_anonymous_access_follows_auth_required(client, monkeypatch):
+    assert client.get('/api/whoami').json() == {'user': None}
+
+    monkeypatch.setattr(config, 'AUTH_REQUIRED', True)
+    assert client.get('/api/whoami').status_code == 401
+    assert client.get('/media/whoami').json() == {'user': None}
+
+
+def test_tokens_need_the_database(client):
+    auth_module.auth._db.pool = None
+    assert client.get('/api/whoami', headers={'Authorization': 'Bearer good'}).status_code == 503
+
+
+def test_stream_token_opens_only_event_streams(client, monkeypatch):
+    monkeypatch.setattr(config, 'AUTH_REQUIRED', True)
+    stream_path, = STREAM_PATHS
+    principal = Principal(user_id='u-1', role='parent', parent_id='p-1', kid_ids=frozenset())
+    token = asyncio.run(auth_module.auth.issue_stream_token(principal))
+    assert token.startswith('stream.')
+
+    # EventSource sends it as a query parameter
+    assert client.get(f"{stream_path}?access_token={token}").json() == {'user': 'u-1'}
+    assert client.get(f"{stream_path}?access_token=bad").status_code == 401
+    assert client.get(stream_path).status_code == 401
+
+    # Other routes ignore the query parameter, and refuse stream tokens in the header
+    assert client.get(f"/api/whoami?access_token={token}").status_code == 401
+    response = client.get('/api/whoami', headers={'Authorization': f"Bearer {token}"})
+    assert response.status_code == 401
+    assert response.json() == {'detail': 'Stream tokens only open event streams'}
+
+
+def test_stream_token_expires(monkeypatch):
+    monkeypatch.setattr(config, 'AUTH_STREAM_TOKEN_TTL', 0.05)
+    sessions_auth = resolver({})
+    principal = Principal(user_id='u-1', role='parent', parent_id='p-1', kid_ids=frozenset())
+
+    async def run():
+        token = await sessions_auth.issue_stream_token(principal)
+        assert await sessions_auth.resolve(token) is not None
+        await asyncio.sleep(0.1)
+        return await sessions_auth.resolve(token)
+
+    # Cached only until the token's own expiry
+    assert asyncio.run(run()) is None
+    assert sessions_auth._db.queries == 2
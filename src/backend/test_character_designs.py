@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-child character design cache (tools/character_designs.py)
+Run: python -m pytest -q test_character_designs.py
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from memory_pg import MemoryPG
+from tools.character_designs import CharacterDesignCache, normalise_character
+from agents.illustrator import IllustratorAgent
+
+DRAGON = {'character': 'Dragon', 'characterKey': 'dragon', 'style': 'cartoon', 'prompt': 'a green dragon'}
+
+
+class FlakyBackend:
+    """Fails the first load, then serves the stored designs"""
+
+    def __init__(self, failures: int = 1):
+        self.failures = failures
+        self.loads = 0
+        self.stored = [DRAGON]
+
+    async def get_character_designs(self, child_id):
+        self.loads += 1
+        if self.loads <= self.failures:
+            raise ConnectionError('database unavailable')
+        return self.stored
+
+    async def store_character_design(self, child_id, key, style, design):
+        self.stored.append({**design, 'characterKey': key, 'style': style})
+
+
+def test_normalise_character():
+    assert normalise_character('The Unicorns!') == 'unicorn'
+    assert normalise_character('my Puppies') == 'puppy'
+    assert normalise_character('a Princess') == 'princess'
+
+
+def test_failed_load_is_retried():
+    async def run():
+        backend = FlakyBackend()
+        cache = CharacterDesignCache(backend)
+        assert await cache.get('kid', 'dragon', 'cartoon') is None
+        assert await cache.get('kid', 'Dragon', 'cartoon') == DRAGON
+        assert await cache.get('kid', 'dragons', 'cartoon') == DRAGON
+        assert backend.loads == 2
+    asyncio.run(run())
+
+
+def test_concurrent_callers_share_one_load():
+    async def run():
+        backend = FlakyBackend(failures=0)
+        cache = CharacterDesignCache(backend)
+        results = await asyncio.gather(*(cache.get('kid', 'dragon', 'cartoon') for _ in range(5)))
+        assert results == [DRAGON] * 5
+        assert backend.loads == 1
+    asyncio.run(run())
+
+
+def test_first_design_wins():
+    async def run():
+        backend = FlakyBackend(failures=0)
+        cache = CharacterDesignCache(backend)
+        await cache.put('kid', 'Dragon', 'cartoon', {**DRAGON, 'prompt': 'a red dragon'})
+        assert (await cache.get('kid', 'dragon', 'cartoon'))['prompt'] == 'a green dragon'
+        assert len(backend.stored) == 1
+    asyncio.run(run())
+
+
+def test_mentioned_in_filters_on_style():
+    async def run():
+        backend = FlakyBackend(failures=0)
+        backend.stored = [DRAGON, {**DRAGON, 'style': 'watercolor', 'prompt': 'a soft dragon'}]
+        cache = CharacterDesignCache(backend)
+        found = await cache.mentioned_in('kid', 'Two dragons flew home.', 'watercolor')
+        assert [design['prompt'] for design in found] == ['a soft dragon']
+        assert await cache.mentioned_in('kid', 'A cat slept.', 'cartoon') == []
+    asyncio.run(run())
+
+
+def test_memory_pg_load_error_reaches_the_cache():
+    class BrokenDatabase:
+        @asynccontextmanager
+        async def acquire(self, consistency='eventual'):
+            raise ConnectionError('database unavailable')
+            yield
+
+    async def run():
+        memory = MemoryPG(BrokenDatabase())
+        with pytest.raises(ConnectionError):
+            await memory.get_character_designs('demo_child_123')
+        # ... so the cache does not remember an empty design set
+        cache = CharacterDesignCache(memory)
+        assert await cache.get('demo_child_123', 'dragon', 'cartoon') is None
+        assert 'demo_child_123' not in cache._designs
+    asyncio.run(run())
+
+
+def test_avatar_placeholder_url_is_encoded():
+    async def run():
+        avatar = await IllustratorAgent().generate_character_avatar('Fox & Owl #1', {})
+        assert avatar['avatarUrl'].endswith('?text=Fox+%26+Owl+%231')
+    asyncio.run(run())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Tests for the circuit breaker (tools/circuit_breaker.py) and the storyteller's offline fallback
+Run: python -m pytest -q test_circuit_breaker.py
+"""
+import asyncio
+import time
+
+import pytest
+
+from agents.storyteller import StorytellerAgent
+from tools import gemini_tools
+from tools.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tools.gemini_tools import GeminiClient
+
+COOLDOWN = 0.05
+
+
+def breaker(**settings) -> CircuitBreaker:
+    return CircuitBreaker('test', **{'window': 10, 'min_calls': 4, 'failure_rate': 0.5,
+                                     'slow_call_seconds': 1.0, 'cooldown': COOLDOWN, **settings})
+
+
+def tripped() -> CircuitBreaker:
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record_failure()
+    return circuit
+
+
+def test_stays_closed_below_min_calls_and_failure_rate():
+    circuit = breaker()
+    for _ in range(3):
+        circuit.record_failure()
+    assert circuit.state == CircuitBreaker.CLOSED  # too few calls to judge
+
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record_success(0.1)
+    for _ in range(3):
+        circuit.record_failure()
+    assert circuit.state == CircuitBreaker.CLOSED  # 3 of 7 bad
+    assert circuit.allow_request()
+
+
+def test_opens_on_failures_and_rejects_calls():
+    circuit = tripped()
+    assert circuit.state == CircuitBreaker.OPEN
+    assert circuit.is_open()
+    assert not circuit.allow_request()
+
+
+def test_slow_calls_count_as_bad():
+    circuit = breaker()
+    for _ in range(4):
+        circuit.record_success(2.0)
+    assert circuit.state == CircuitBreaker.OPEN
+
+
+def test_half_open_probe_success_closes():
+    circuit = tripped()
+    time.sleep(COOLDOWN * 2)
+    assert not circuit.is_open()
+
+    # One probe goes through; others wait for its outcome
+    assert circuit.allow_request()
+    assert circuit.state == CircuitBreaker.HALF_OPEN
+    assert not circuit.allow_request()
+
+    circuit.record_success(0.1)
+    assert circuit.state == CircuitBreaker.CLOSED
+    assert circuit.status() == {'state': 'closed', 'recent_calls': 0, 'bad_call_rate': 0.0}
+    assert circuit.allow_request()
+
+
+def test_half_open_probe_failure_opens_again():
+    circuit = tripped()
+    time.sleep(COOLDOWN * 2)
+    assert circuit.allow_request()
+    circuit.record_failure()
+    assert circuit.state == CircuitBreaker.OPEN
+    assert not circuit.allow_request()
+
+
+def test_lost_probe_is_replaced_after_cooldown():
+    circuit = tripped()
+    time.sleep(COOLDOWN * 2)
+    assert circuit.allow_request()
+    time.sleep(COOLDOWN * 2)
+    assert circuit.allow_request()
+    assert circuit.state == CircuitBreaker.HALF_OPEN
+
+
+@pytest.fixture
+def open_gemini(monkeypatch):
+    """A Gemini client whose shared circuit is open"""
+    monkeypatch.setattr(gemini_tools, 'gemini_breaker', tripped())
+    gemini = GeminiClient('storyteller')
+    gemini.mock_mode = False
+    return gemini
+
+
+def test_open_circuit_rejects_without_calling_the_model(open_gemini):
+    async def model(prompt, **kwargs):
+        raise AssertionError('model called while the circuit is open')
+    open_gemini._call_model = model
+
+    assert open_gemini.circuit_open
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(open_gemini.generate('Tell a story'))
+
+
+def test_storyteller_writes_offline_while_circuit_is_open(open_gemini):
+    async def generate(prompt, **kwargs):
+        raise AssertionError('Gemini called while the circuit is open')
+    open_gemini.generate = generate
+
+    storyteller = StorytellerAgent()
+    storyteller.gemini = open_gemini
+    story = asyncio.run(storyteller.generate_story(
+        'I played with my dog in the garden', 'kid', {'age': 5}, ['sharing'], ['dog']
+    ))
+
+    assert story['metadata']['generatedOffline']
+    assert story['scenes'] and all(scene['text'] for scene in story['scenes'])
+
+
+def test_storyteller_falls_back_when_gemini_fails(monkeypatch):
+    monkeypatch.setattr(gemini_tools, 'gemini_breaker', breaker())
+    storyteller = StorytellerAgent()
+    storyteller.gemini.mock_mode = False
+
+    async def generate(prompt, **kwargs):
+        raise ConnectionError('reset')
+    storyteller.gemini.generate = generate
+
+    story = asyncio.run(storyteller.generate_story('A rocket to the moon', 'kid', {}, [], []))
+    assert story['metadata']['generatedOffline']
+    assert story['scenes']
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Tests for the CPU-bound worker pool (tools/cpu_pool.py)
+Run: python -m pytest -q test_cpu_pool.py
+"""
+import asyncio
+import json
+
+import pytest
+
+from agents.emotion_detector import EmotionDetectorAgent
+from tools.cpu_pool import CPUPool, encode_json
+
+
+def test_runs_inline_until_started():
+    async def run():
+        pool = CPUPool(workers=1)
+        assert await pool.run(encode_json, {'a': 1}) == b'{"a": 1}'
+    asyncio.run(run())
+
+
+def test_runs_functions_and_staticmethods_in_workers():
+    async def run():
+        pool = CPUPool(workers=1)
+        await pool.start()
+        try:
+            assert pool.started
+            assert json.loads(await pool.run(encode_json, {'scores': [1, 2]})) == {'scores': [1, 2]}
+            concerns = await pool.run(EmotionDetectorAgent._check_concerns, 'kids at school were mean to me')
+            assert concerns
+        finally:
+            pool.shutdown()
+    asyncio.run(run())
+
+
+def test_rejects_bound_methods():
+    class Agent:
+        def work(self):
+            return 1
+
+    async def run():
+        with pytest.raises(TypeError):
+            await CPUPool(workers=0).run(Agent().work)
+    asyncio.run(run())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Tests for the emotion trend analytics (tools/emotion_analytics.py)
+Run: python -m pytest -q test_emotion_analytics.py
+"""
+from datetime import datetime, timedelta, timezone
+import random
+
+import numpy as np
+import pytest
+
+from config import config
+from tools.emotion_analytics import EMOTIONS, EmotionSeries, ewma, trailing_zscores
+
+# A Monday
+START = datetime(2024, 5, 6, 9, 0, tzinfo=timezone.utc)
+
+
+def ewma_loop(values: np.ndarray, alpha: float) -> np.ndarray:
+    """The plain recursive definition ewma() must agree with"""
+    out = np.empty_like(values, dtype=float)
+    for row in range(len(values)):
+        out[row] = values[row] if row == 0 else alpha * values[row] + (1 - alpha) * out[row - 1]
+    return out
+
+
+def session(when, mood='neutral', **scores):
+    return {'timestamp': when, 'mood': mood, 'emotions': {'emotions': scores}}
+
+
+def steady_history(count: int, spike_at: int = None):
+    """Daily sessions with slightly noisy scores, and one sad spike if spike_at is given"""
+    rng = random.Random(7)
+    history = []
+    for day in range(count):
+        scores = {emotion: 0.2 + rng.uniform(-0.02, 0.02) for emotion in EMOTIONS}
+        if day == spike_at:
+            scores['sadness'] = 0.95
+        history.append(session(START + timedelta(days=day), **scores))
+    return history
+
+
+# ----------------------------------------------------------------------
+# ewma
+# ----------------------------------------------------------------------
+
+@pytest.mark.parametrize('rows', [1, 5, 511, 512, 513, 1100])
+def test_ewma_matches_recursive_loop(rows):
+    # Sizes around the 512-row chunk boundary, where one chunk seeds the next
+    values = np.random.default_rng(rows).random((rows, 3))
+    alpha = 2.0 / (config.EMOTION_EWMA_SPAN + 1)
+    np.testing.assert_allclose(ewma(values, alpha), ewma_loop(values, alpha), rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize('alpha', [0.01, 0.75, 0.9, 0.999])
+def test_ewma_stays_finite_for_large_alpha(alpha):
+    values = np.random.default_rng(1).random((1100, 2))
+    result = ewma(values, alpha)
+    assert np.isfinite(result).all()
+    np.testing.assert_allclose(result, ewma_loop(values, alpha), rtol=1e-9, atol=1e-12)
+
+
+def test_ewma_span_of_one_is_unsmoothed(monkeypatch):
+    values = np.random.default_rng(2).random((600, 2))
+    np.testing.assert_array_equal(ewma(values, 1.0), values)
+
+    monkeypatch.setattr(config, 'EMOTION_EWMA_SPAN', 1.0)
+    history = [session(START + timedelta(days=day), mood='happy' if day % 2 else 'sad') for day in range(10)]
+    assert EmotionSeries.from_history(history).mood_trend() == 'positive'
+
+
+def test_ewma_of_empty_array():
+    assert ewma(np.zeros((0, 3)), 0.25).shape == (0, 3)
+
+
+# ----------------------------------------------------------------------
+# trailing_zscores and anomalies
+# ----------------------------------------------------------------------
+
+def test_trailing_zscores_flag_only_the_spike():
+    series = EmotionSeries.from_history(steady_history(40, spike_at=25))
+    z = trailing_zscores(series.scores, config.EMOTION_BASELINE_SESSIONS, config.EMOTION_ANOMALY_MIN_SESSIONS)
+    sadness = EMOTIONS.index('sadness')
+
+    # Too little history to judge the first sessions
+    assert np.isnan(z[:config.EMOTION_ANOMALY_MIN_SESSIONS]).all()
+    assert z[25, sadness] > config.EMOTION_ANOMALY_Z
+
+    flagged = np.abs(np.nan_to_num(z)) >= config.EMOTION_ANOMALY_Z
+    assert list(zip(*np.nonzero(flagged))) == [(25, sadness)]
+
+
+def test_anomalies_report_the_spike():
+    anomalies = EmotionSeries.from_history(steady_history(40, spike_at=25)).anomalies()
+    assert len(anomalies) == 1
+    assert anomalies[0]['emotion'] == 'sadness'
+    assert anomalies[0]['value'] == 0.95
+    assert anomalies[0]['date'] == (START + timedelta(days=25)).isoformat()
+    assert not anomalies[0]['latest']
+
+
+def test_spike_in_latest_session_raises_an_alert():
+    series = EmotionSeries.from_history(steady_history(40, spike_at=39))
+    assert series.anomalies()[0]['latest']
+    assert any(alert['type'] == 'emotional_change' for alert in series.insights()['alerts'])
+
+
+def test_anomalies_need_enough_history():
+    history = steady_history(config.EMOTION_ANOMALY_MIN_SESSIONS, spike_at=config.EMOTION_ANOMALY_MIN_SESSIONS - 1)
+    assert EmotionSeries.from_history(history).anomalies() == []
+
+
+# ----------------------------------------------------------------------
+# weekday_patterns and mood_trend
+# ----------------------------------------------------------------------
+
+def test_empty_history():
+    series = EmotionSeries.from_history([])
+    assert len(series) == 0
+    assert series.weekday_patterns() == {}
+    assert series.mood_trend() == 'neutral'
+    assert series.chart_data() == []
+    assert series.insights()['trends'] == {}
+
+
+def test_missing_scores():
+    history = [
+        session(START, mood='happy', happiness=0.8),
+        session(START + timedelta(days=1), mood='sad', happiness=0.2, sadness=0.6),
+        {'timestamp': START + timedelta(days=2), 'mood': None, 'emotions': None},
+        session(START + timedelta(days=7), mood='excited', sadness=0.1),
+    ]
+    series = EmotionSeries.from_history(history)
+    patterns = series.weekday_patterns()
+
+    assert set(patterns) == {'monday', 'tuesday', 'wednesday'}
+    # Only emotions recorded at least once are reported
+    assert set(patterns['monday']) == {'sessions', 'positive_share', 'happiness', 'sadness'}
+    assert patterns['monday']['sessions'] == 2
+    assert patterns['monday']['positive_share'] == 1.0
+    # A missing score counts as the emotion's mean (happiness 0.5, sadness 0.35)
+    assert patterns['monday']['happiness'] == pytest.approx((0.8 + 0.5) / 2)
+    assert patterns['wednesday']['sadness'] == pytest.approx(0.35)
+    assert series.mood_trend() in ('positive', 'mixed', 'concerning')
+
+
+def test_mixed_datetime_and_iso_timestamps():
+    history = [
+        session((START + timedelta(days=2)).isoformat(), mood='happy', happiness=0.9),  # Wednesday
+        session(START, mood='sad', happiness=0.1),  # Monday
+        session((START + timedelta(days=1)).isoformat(), mood='sad', happiness=0.2),  # Tuesday
+        session(START + timedelta(days=2, hours=5), mood='happy', happiness=0.7),  # Wednesday
+    ]
+    series = EmotionSeries.from_history(history)
+
+    # Sorted oldest first whatever the timestamp type
+    assert series.moods == ['sad', 'sad', 'happy', 'happy']
+    patterns = series.weekday_patterns()
+    assert {day: pattern['sessions'] for day, pattern in patterns.items()} == {
+        'monday': 1, 'tuesday': 1, 'wednesday': 2
+    }
+    assert patterns['wednesday']['happiness'] == pytest.approx(0.8)
+    assert patterns['wednesday']['positive_share'] == 1.0
+
+
+def test_mood_trend_follows_recent_sessions():
+    sad_then_happy = [session(START + timedelta(days=day), mood='sad' if day < 10 else 'happy') for day in range(20)]
+    happy_then_sad = [session(START + timedelta(days=day), mood='happy' if day < 10 else 'sad') for day in range(20)]
+    assert EmotionSeries.from_history(sad_then_happy).mood_trend() == 'positive'
+    assert EmotionSeries.from_history(happy_then_sad).mood_trend() == 'concerning'
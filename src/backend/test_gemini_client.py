@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for GeminiClient retries, hedging and request deadlines (tools/gemini_tools.py)
+Run: python -m pytest -q test_gemini_client.py
+"""
+import asyncio
+import itertools
+import time
+
+import pytest
+
+from tools import gemini_tools
+from tools.circuit_breaker import CircuitBreaker
+from tools.gemini_tools import GeminiClient, LLMCallPolicy, set_request_deadline
+from tools.metrics import metrics
+
+_prompts = itertools.count()
+
+
+class FakeModel:
+    """Stands in for GeminiClient._call_model: each call plays the next scripted step"""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.calls = 0
+
+    async def __call__(self, prompt: str, **kwargs) -> str:
+        step = self.steps[min(self.calls, len(self.steps) - 1)]
+        self.calls += 1
+        delay, outcome = step
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def fresh_breaker(monkeypatch):
+    monkeypatch.setattr(gemini_tools, 'gemini_breaker', CircuitBreaker('gemini-test'))
+
+
+def client(model: FakeModel, **policy) -> GeminiClient:
+    gemini = GeminiClient('test', policy=LLMCallPolicy(**policy))
+    gemini.mock_mode = False
+    gemini._call_model = model
+    return gemini
+
+
+def prompt() -> str:
+    # Distinct prompts, so calls from different tests never share a flight
+    return f"test prompt {next(_prompts)}"
+
+
+def test_transient_error_is_retried_with_jittered_backoff(monkeypatch):
+    delays = []
+
+    def uniform(low, high):
+        delays.append((low, high))
+        return 0.0
+    monkeypatch.setattr(gemini_tools.random, 'uniform', uniform)
+
+    model = FakeModel((0, ConnectionError('reset')), (0, ConnectionError('reset')), (0, 'story'))
+    retries = metrics.counter('llm.retries')
+    result = asyncio.run(client(model, max_retries=2, backoff_base=0.5, backoff_max=8).generate(prompt()))
+
+    assert result == 'story'
+    assert model.calls == 3
+    # Full jitter over an exponentially growing ceiling
+    assert delays == [(0, 0.5), (0, 1.0)]
+    assert metrics.counter('llm.retries') == retries + 2
+
+
+def test_retries_stop_after_max_retries():
+    model = FakeModel((0, ConnectionError('reset')))
+    with pytest.raises(ConnectionError):
+        asyncio.run(client(model, max_retries=1, backoff_base=0.01).generate(prompt()))
+    assert model.calls == 2
+
+
+def test_non_retryable_error_is_raised_at_once():
+    model = FakeModel((0, ValueError('bad request')), (0, 'story'))
+    with pytest.raises(ValueError):
+        asyncio.run(client(model, max_retries=3, backoff_base=0.01).generate(prompt()))
+    assert model.calls == 1
+
+
+def test_slow_first_attempt_is_hedged():
+    model = FakeModel((1.0, 'slow story'), (0.01, 'hedged story'))
+    fired, won = metrics.counter('llm.hedges_fired'), metrics.counter('llm.hedges_won')
+
+    started = time.monotonic()
+    result = asyncio.run(client(model, hedge=True, hedge_min_delay=0.05, timeout=5).generate(prompt()))
+
+    assert result == 'hedged story'
+    assert model.calls == 2
+    assert time.monotonic() - started < 0.5
+    assert metrics.counter('llm.hedges_fired') == fired + 1
+    assert metrics.counter('llm.hedges_won') == won + 1
+
+
+def test_fast_first_attempt_is_not_hedged():
+    model = FakeModel((0.01, 'story'))
+    assert asyncio.run(client(model, hedge=True, hedge_min_delay=0.5).generate(prompt())) == 'story'
+    assert model.calls == 1
+
+
+def test_request_deadline_cuts_off_slow_attempts():
+    model = FakeModel((1.0, 'story'))
+
+    async def run():
+        set_request_deadline(0.1)
+        await client(model, timeout=5, max_retries=3, backoff_base=0.01).generate(prompt())
+
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+    assert time.monotonic() - started < 0.5
+
+
+def test_exhausted_deadline_skips_the_model():
+    model = FakeModel((0, 'story'))
+
+    async def run():
+        set_request_deadline(0)
+        await client(model).generate(prompt())
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+    assert model.calls == 0
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for narration audio: the content-addressed cache (tools/narration.py)
+and Range requests for /media/audio
+Run: python -m pytest -q test_narration.py
+"""
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api_server
+from tools.metrics import metrics
+from tools.narration import AudioStore, NarrationPipeline, byte_range, split_sentences
+
+SCENE = "The dragon woke up. It was hungry! Where was breakfast?"
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('bytes=0-99', (0, 99)),
+    ('bytes=10-19', (10, 19)),
+    ('bytes=90-200', (90, 99)),    # clamped to the file
+    ('bytes=40-', (40, 99)),       # open-ended
+    ('bytes=-10', (90, 99)),       # suffix: the last 10 bytes
+    ('bytes=-500', (0, 99)),       # suffix longer than the file
+    ('bytes=0-10,20-30', None),    # several ranges: send the whole file
+    ('bytes=20-10', None),         # reversed
+    ('items=0-10', None),
+    ('bytes=a-b', None),
+    ('bytes=-', None),
+])
+def test_byte_range(header, expected):
+    assert byte_range(header, 100) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=100-', 'bytes=150-200', 'bytes=-0'])
+def test_unsatisfiable_byte_range(header):
+    with pytest.raises(ValueError):
+        byte_range(header, 100)
+
+
+# ----------------------------------------------------------------------
+# /media/audio
+# ----------------------------------------------------------------------
+
+AUDIO = bytes(range(256)) * 4
+FILENAME = f"{'a' * 64}.wav"
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    store = AudioStore(root=str(tmp_path), base_url='')
+    store.write(FILENAME, AUDIO)
+    monkeypatch.setattr(api_server, 'audio_store', store)
+    return TestClient(api_server.app)
+
+
+def test_whole_file_without_range(client):
+    response = client.get(f"/media/audio/{FILENAME}")
+    assert response.status_code == 200
+    assert response.content == AUDIO
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['content-type'] == 'audio/wav'
+
+
+@pytest.mark.parametrize('header, first, last', [
+    ('bytes=100-199', 100, 199),
+    ('bytes=1000-', 1000, 1023),
+    ('bytes=-24', 1000, 1023),
+])
+def test_range_gets_partial_content(client, header, first, last):
+    response = client.get(f"/media/audio/{FILENAME}", headers={'Range': header})
+    assert response.status_code == 206
+    assert response.content == AUDIO[first:last + 1]
+    assert response.headers['Content-Range'] == f"bytes {first}-{last}/{len(AUDIO)}"
+    assert response.headers['Content-Length'] == str(last - first + 1)
+
+
+def test_unsatisfiable_range_answers_416(client):
+    response = client.get(f"/media/audio/{FILENAME}", headers={'Range': 'bytes=5000-'})
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == f"bytes */{len(AUDIO)}"
+
+
+def test_if_range_for_another_copy_gets_the_whole_file(client):
+    etag = client.get(f"/media/audio/{FILENAME}").headers['ETag']
+    headers = {'Range': 'bytes=0-9'}
+    assert client.get(f"/media/audio/{FILENAME}", headers={**headers, 'If-Range': etag}).status_code == 206
+    response = client.get(f"/media/audio/{FILENAME}", headers={**headers, 'If-Range': '"other"'})
+    assert response.status_code == 200 and response.content == AUDIO
+
+
+@pytest.mark.parametrize('filename', [f"{'b' * 64}.wav", 'notes.txt'])
+def test_unknown_audio_is_404(client, filename):
+    assert client.get(f"/media/audio/{filename}").status_code == 404
+
+
+# ----------------------------------------------------------------------
+# Content-addressed cache
+# ----------------------------------------------------------------------
+
+class CountingSynthesiser:
+    """Audio that spells out what was spoken, counting each synthesis"""
+
+    name = 'counting'
+    extension = 'wav'
+
+    def __init__(self):
+        self.spoken = []
+
+    async def synthesise(self, text, voice, speed):
+        self.spoken.append(text)
+        await asyncio.sleep(0.01)
+        return f"[{voice}@{speed}:{text}]".encode()
+
+    async def join(self, parts):
+        return b''.join(parts)
+
+
+def pipeline(tmp_path) -> NarrationPipeline:
+    return NarrationPipeline(CountingSynthesiser(), AudioStore(root=str(tmp_path), base_url=''))
+
+
+def test_scene_is_stored_by_content(tmp_path):
+    narration = pipeline(tmp_path)
+    url = asyncio.run(narration.narrate(SCENE, 'voice-a', 1.0))
+
+    filename = url.rsplit('/', 1)[-1]
+    assert filename == f"{AudioStore.key('counting', 'voice-a', 1.0, SCENE)}.wav"
+    assert narration.synthesiser.spoken == split_sentences(SCENE)
+    assert narration.store.read(filename) == b''.join(
+        f"[voice-a@1.0:{sentence}]".encode() for sentence in split_sentences(SCENE))
+
+
+def test_replayed_scene_is_a_cache_hit(tmp_path):
+    narration = pipeline(tmp_path)
+    scene_hits = metrics.counter('narration.scene_hits')
+
+    async def run():
+        first = await narration.narrate(SCENE, 'voice-a', 1.0)
+        # Whitespace does not change what is spoken
+        return first, await narration.narrate(SCENE.replace(' ', '  '), 'voice-a', 1.0)
+
+    first, replay = asyncio.run(run())
+    assert first == replay
+    assert len(narration.synthesiser.spoken) == 3
+    assert metrics.counter('narration.scene_hits') == scene_hits + 1
+
+
+def test_new_scene_reuses_sentences_heard_before(tmp_path):
+    narration = pipeline(tmp_path)
+    sentence_hits = metrics.counter('narration.sentence_hits')
+
+    async def run():
+        await narration.narrate(SCENE, 'voice-a', 1.0)
+        await narration.narrate("The dragon woke up. It flew away.", 'voice-a', 1.0)
+
+    asyncio.run(run())
+    assert narration.synthesiser.spoken[3:] == ['It flew away.']
+    assert metrics.counter('narration.sentence_hits') == sentence_hits + 1
+
+
+def test_voice_and_speed_are_part_of_the_key(tmp_path):
+    narration = pipeline(tmp_path)
+
+    async def run():
+        return {await narration.narrate(SCENE, voice, speed)
+                for voice, speed in (('voice-a', 1.0), ('voice-b', 1.0), ('voice-a', 0.9))}
+
+    assert len(asyncio.run(run())) == 3
+    assert len(narration.synthesiser.spoken) == 9
+    assert len(os.listdir(tmp_path)) == 12  # 9 sentences and 3 scenes
+
+
+def test_concurrent_requests_share_one_synthesis(tmp_path):
+    narration = pipeline(tmp_path)
+
+    async def run():
+        return await asyncio.gather(*(narration.narrate(SCENE, 'voice-a', 1.0) for _ in range(4)))
+
+    assert len(set(asyncio.run(run()))) == 1
+    assert len(narration.synthesiser.spoken) == 3
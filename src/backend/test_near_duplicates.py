@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for near-duplicate story inputs (tools/near_duplicates.py) and how
+story creation reuses or varies the earlier story
+Run: python -m pytest -q test_near_duplicates.py
+"""
+from types import SimpleNamespace
+import asyncio
+import itertools
+import string
+
+import pytest
+
+import api_server
+from agents.storyteller import StorytellerAgent
+from api_server import StoryRequest, StoryResponse
+from config import config
+from tools.near_duplicates import (NearDuplicateIndex, input_signature, normalise_input,
+                                   similarity, MIN_WORDS)
+
+ORIGINAL = "we built a sandcastle at the beach with my sister and a big red bucket then waves knocked it over and we laughed"
+RETOLD = "we built sandcastles on the beach with my sister and big red buckets then the waves knocked them over and we all laughed"
+VARIED = "we built a sandcastle at the beach with my brother and a big red bucket then waves knocked it over and we laughed"
+UNRELATED = "my dog chased a squirrel up a tall tree in the park"
+
+
+class FakeMemory:
+    """Stored stories with input signatures, plus whatever else gets stored"""
+
+    def __init__(self, *stories):
+        self.signatures = [
+            {'id': story_id, 'title': title, 'signature': input_signature(text)}
+            for story_id, title, text in stories
+        ]
+        self.loads = 0
+        self.stored = []
+
+    async def get_input_signatures(self, child_id, limit):
+        self.loads += 1
+        return self.signatures[:limit]
+
+    async def store(self, collection, doc_id, data):
+        self.stored.append((collection, data))
+
+
+def index_of(memory: FakeMemory) -> NearDuplicateIndex:
+    index = NearDuplicateIndex()
+    index.start(memory)
+    return index
+
+
+def test_inputs_are_normalised_to_content_words():
+    assert normalise_input("We saw the PUPPIES and two cats!") == {'puppy', 'two', 'cat'}
+    assert normalise_input(ORIGINAL) == normalise_input(RETOLD)
+    assert input_signature("we went to the park") is None  # fewer than MIN_WORDS content words
+    assert MIN_WORDS == 3
+
+
+def test_signatures_estimate_jaccard_similarity():
+    words = [''.join(letters) for letters in itertools.product(string.ascii_lowercase, repeat=2)][:150]
+    first, second = ' '.join(words[:100]), ' '.join(words[50:150])  # Jaccard 50/150
+    assert similarity(input_signature(first), input_signature(first)) == 1.0
+    assert similarity(input_signature(first), input_signature(second)) == pytest.approx(1 / 3, abs=0.15)
+
+
+def test_find_applies_the_vary_threshold():
+    memory = FakeMemory(('story-1', 'The Sandcastle', ORIGINAL))
+
+    async def run():
+        index = index_of(memory)
+        return [await index.find('kid', input_signature(text)) for text in (RETOLD, VARIED, UNRELATED)]
+
+    retold, varied, unrelated = asyncio.run(run())
+    assert retold.story_id == 'story-1' and retold.similarity == 1.0
+    assert config.NEAR_DUPLICATE_VARY_THRESHOLD <= varied.similarity < config.NEAR_DUPLICATE_REUSE_THRESHOLD
+    assert unrelated is None
+    assert memory.loads == 1  # the child's index is loaded once
+
+
+def test_new_stories_join_a_loaded_index():
+    async def run():
+        index = index_of(FakeMemory())
+        assert await index.find('kid', input_signature(ORIGINAL)) is None
+        index.add('kid', 'story-2', input_signature(ORIGINAL), 'The Sandcastle')
+        index.add('other-kid', 'story-3', input_signature(UNRELATED), 'The Squirrel')  # not loaded: ignored
+        return await index.find('kid', input_signature(RETOLD))
+
+    assert asyncio.run(run()).story_id == 'story-2'
+
+
+def test_failed_load_is_retried():
+    memory = FakeMemory(('story-1', 'The Sandcastle', ORIGINAL))
+    real_load = memory.get_input_signatures
+
+    async def failing_load(child_id, limit):
+        memory.get_input_signatures = real_load
+        raise ConnectionError('database down')
+    memory.get_input_signatures = failing_load
+
+    async def run():
+        index = index_of(memory)
+        first = await index.find('kid', input_signature(RETOLD))
+        return first, await index.find('kid', input_signature(RETOLD))
+
+    first, second = asyncio.run(run())
+    assert first is None and second.story_id == 'story-1'
+
+
+# ----------------------------------------------------------------------
+# Story creation
+# ----------------------------------------------------------------------
+
+class FakeEmotionDetector:
+    async def analyze_emotion(self, text, mood='neutral'):
+        return {'emotions': {'happiness': 0.8}, 'alerts': []}
+
+
+@pytest.fixture
+def earlier_story(monkeypatch):
+    """A child with one earlier story; new stories are 'generated' without the agents"""
+    memory = FakeMemory(('story-1', 'The Sandcastle', ORIGINAL))
+    monkeypatch.setattr(api_server, 'memory', memory)
+    monkeypatch.setattr(api_server, 'near_duplicates', index_of(memory))
+    monkeypatch.setattr(api_server, 'executor', SimpleNamespace(agents={'emotion_detector': FakeEmotionDetector()}))
+
+    generated = []
+
+    async def generate_story(request, family, preloaded=None, similar=None):
+        generated.append(similar)
+        return StoryResponse(story_id='story-2', status='complete', preview='A New Story')
+    monkeypatch.setattr(api_server, '_generate_story', generate_story)
+    return SimpleNamespace(memory=memory, generated=generated)
+
+
+def create(text: str, **fields) -> StoryResponse:
+    request = StoryRequest(child_id='kid', text_input=text, **fields)
+    return asyncio.run(api_server._admitted_story(request, 'family', 'interactive'))
+
+
+def test_retold_input_reuses_the_earlier_story(earlier_story):
+    response = create(RETOLD)
+    assert (response.story_id, response.status, response.preview) == ('story-1', 'reused', 'The Sandcastle')
+    assert earlier_story.generated == []
+    # The session is still tracked against the reused story
+    (collection, session), = earlier_story.memory.stored
+    assert collection == 'sessions' and session['storyId'] == 'story-1'
+
+
+def test_reuse_can_be_declined(earlier_story):
+    assert create(RETOLD, allow_reuse=False).story_id == 'story-2'
+    assert earlier_story.generated[0].story_id == 'story-1'
+
+
+def test_similar_input_gets_a_varied_story(earlier_story):
+    assert create(VARIED).story_id == 'story-2'
+    similar, = earlier_story.generated
+    assert (similar.story_id, similar.title) == ('story-1', 'The Sandcastle')
+
+
+def test_unrelated_input_gets_a_fresh_story(earlier_story):
+    create(UNRELATED)
+    assert earlier_story.generated == [None]
+
+
+def test_storyteller_varies_from_the_similar_story():
+    storyteller = StorytellerAgent()
+    similar = {'id': 'story-1', 'title': 'The Sandcastle'}
+    prompt = storyteller._build_story_prompt(VARIED, {}, [], [], None, similar)
+    assert 'already has a story called "The Sandcastle"' in prompt
+
+    story = asyncio.run(storyteller.generate_story(VARIED, 'kid', {}, [], [], similar_story=similar))
+    assert story['metadata']['variedFrom'] == 'story-1'
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for prompt templates and input budgets (tools/prompts.py)
+Run: python -m pytest -q test_prompts.py
+"""
+import pytest
+
+from config import config
+from tools.prompts import PromptRegistry, PromptTemplate, estimate_tokens, fit_to_budget, input_budget, prompts
+
+DAY = ("We went to the zoo. I saw a big lion. The lion was sleeping. Then we ate ice cream. "
+       "My brother dropped his cone. We laughed a lot. Then we went home and I was tired.")
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcd' * 10) == 11
+
+
+def test_text_within_budget_is_unchanged():
+    assert fit_to_budget(DAY, 1000) == DAY
+    assert fit_to_budget('', 1) == ''
+
+
+def test_truncation_keeps_the_start_and_the_ending():
+    assert estimate_tokens(DAY) > 40
+    fitted = fit_to_budget(DAY, 40)
+    assert estimate_tokens(fitted) <= 40 + 2
+    assert fitted.startswith('We went to the zoo.')
+    assert fitted.endswith(' ... Then we went home and I was tired.')
+    assert len(fitted) < len(DAY)
+
+
+def test_one_long_sentence_is_cut_on_a_word():
+    text = ' '.join(['dragon'] * 200)
+    fitted = fit_to_budget(text, 10)
+    assert fitted.endswith('dragon...')
+    assert len(fitted) <= 10 * 4 + 3
+
+
+def test_input_budgets_come_from_config():
+    assert input_budget('storyteller') == config.PROMPT_INPUT_BUDGETS['storyteller']
+    assert input_budget('no-such-agent') == config.PROMPT_INPUT_BUDGETS['default']
+
+
+def test_template_strips_indentation_and_fills_fields():
+    template = PromptTemplate('test.story', """
+        Write a story for a {age}-year-old.
+
+        {char_string}
+
+        Story input: "{input_text}"
+    """)
+    assert template.fields == {'age', 'char_string', 'input_text'}
+    assert template.render(age=5, char_string='Include a dragon.', input_text='we flew') == (
+        'Write a story for a 5-year-old.\n\nInclude a dragon.\n\nStory input: "we flew"'
+    )
+    # An empty optional section leaves no run of blank lines
+    assert template.render(age=5, char_string='', input_text='we flew') == (
+        'Write a story for a 5-year-old.\n\nStory input: "we flew"'
+    )
+
+
+def test_template_requires_every_field():
+    template = PromptTemplate('test.missing', 'Hello {name}, age {age}')
+    with pytest.raises(KeyError):
+        template.render(name='Sam')
+
+
+def test_registry():
+    registry = PromptRegistry()
+    template = registry.register('test.one', 'One {x}')
+    assert registry.get('test.one') is template
+    assert registry.names() == ['test.one']
+
+
+def test_agent_prompts_are_registered_and_render():
+    import agents.emotion_detector  # noqa: F401 - registers its prompt
+    template = prompts.get('emotion_detector.text')
+    rendered = template.render(text='I miss grandma')
+    assert 'Statement: "I miss grandma"' in rendered
+    assert '{' not in rendered
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Tests for request coalescing (tools/single_flight.py) and shared LLM calls (llm_flights)
+Run: python -m pytest -q test_single_flight.py
+"""
+import asyncio
+import itertools
+
+import pytest
+
+from tools import gemini_tools
+from tools.circuit_breaker import CircuitBreaker
+from tools.gemini_tools import GeminiClient, LLMCallPolicy, set_request_deadline
+from tools.single_flight import SingleFlight, single_flight
+
+_prompts = itertools.count()
+
+
+class SlowCall:
+    """Counts calls; each one takes delay seconds and then returns or raises"""
+
+    def __init__(self, delay: float = 0.05, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self, *args, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return {'calls': self.calls}
+
+
+def test_concurrent_identical_calls_share_one_call():
+    async def run():
+        flights, call = SingleFlight('test'), SlowCall()
+        results = await asyncio.gather(*(flights.do('key', call) for _ in range(5)))
+        assert call.calls == 1
+        assert all(result is results[0] for result in results)
+        assert not flights.in_flight('key')
+
+        # Finished calls are not cached
+        await flights.do('key', call)
+        assert call.calls == 2
+    asyncio.run(run())
+
+
+def test_different_keys_do_not_share():
+    async def run():
+        flights, call = SingleFlight('test'), SlowCall()
+        await asyncio.gather(flights.do('a', call), flights.do('b', call))
+        assert call.calls == 2
+    asyncio.run(run())
+
+
+def test_error_reaches_every_waiter():
+    async def run():
+        flights, call = SingleFlight('test'), SlowCall(error=ConnectionError('reset'))
+        results = await asyncio.gather(*(flights.do('key', call) for _ in range(4)), return_exceptions=True)
+        assert call.calls == 1
+        assert all(isinstance(result, ConnectionError) for result in results)
+    asyncio.run(run())
+
+
+def test_call_is_cancelled_only_when_every_waiter_leaves():
+    async def run():
+        flights, call = SingleFlight('test'), SlowCall(delay=0.2)
+        leaving = asyncio.ensure_future(flights.do('key', call))
+        staying = asyncio.ensure_future(flights.do('key', call))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        assert await staying == {'calls': 1}
+        assert call.cancelled == 0
+
+        both = [asyncio.ensure_future(flights.do('key', call)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in both:
+            waiter.cancel()
+        await asyncio.sleep(0.01)
+        assert call.cancelled == 1
+    asyncio.run(run())
+
+
+def test_single_flight_decorator_is_per_instance():
+    class Loader:
+        def __init__(self):
+            self.loads = 0
+
+        @single_flight('test.loader')
+        async def load(self, name):
+            self.loads += 1
+            await asyncio.sleep(0.02)
+            return name
+
+    async def run():
+        first, second = Loader(), Loader()
+        await asyncio.gather(first.load('a'), first.load('a'), second.load('a'), first.load('b'))
+        assert (first.loads, second.loads) == (2, 1)
+    asyncio.run(run())
+
+
+# ----------------------------------------------------------------------
+# llm_flights
+# ----------------------------------------------------------------------
+
+@pytest.fixture
+def gemini(monkeypatch):
+    monkeypatch.setattr(gemini_tools, 'gemini_breaker', CircuitBreaker('gemini-test'))
+    client = GeminiClient('test', policy=LLMCallPolicy(timeout=5, max_retries=2, backoff_base=0.01))
+    client.mock_mode = False
+    return client
+
+
+def test_identical_prompts_share_one_model_call(gemini):
+    model = SlowCall()
+    gemini._call_model = model
+    prompt = f"shared prompt {next(_prompts)}"
+
+    async def run():
+        return await asyncio.gather(*(gemini.generate(prompt) for _ in range(3)),
+                                    gemini.generate(prompt, temperature=0.1))
+
+    asyncio.run(run())
+    assert model.calls == 2  # the different temperature is its own call
+
+
+def test_shared_model_error_reaches_every_caller(gemini):
+    model = SlowCall(error=ValueError('bad request'))
+    gemini._call_model = model
+    prompt = f"shared prompt {next(_prompts)}"
+
+    async def run():
+        return await asyncio.gather(*(gemini.generate(prompt) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in asyncio.run(run()))
+    assert model.calls == 1
+
+
+@pytest.mark.parametrize('later_deadline', [2.0, None])
+def test_shared_call_runs_until_the_latest_deadline(gemini, later_deadline):
+    model = SlowCall(delay=0.3)
+    gemini._call_model = model
+    prompt = f"shared prompt {next(_prompts)}"
+
+    async def caller(deadline, joins_after=0.0):
+        await asyncio.sleep(joins_after)
+        if deadline is not None:
+            set_request_deadline(deadline)
+        return await gemini.generate(prompt)
+
+    async def run():
+        return await asyncio.gather(caller(0.1), caller(later_deadline, joins_after=0.02),
+                                    return_exceptions=True)
+
+    early, late = asyncio.run(run())
+    # The first caller gives up at its own deadline; the shared call goes on for the second
+    assert isinstance(early, asyncio.TimeoutError)
+    assert late == {'calls': 1}
+    assert model.calls == 1 and model.cancelled == 0
+    assert prompt not in {key[0] for key in gemini_tools._flight_deadlines}
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Tests for speculative story generation from the quick emotion pass (executor.py)
+Run: python -m pytest -q test_speculation.py
+"""
+import asyncio
+
+from agents.emotion_detector import EmotionDetectorAgent
+from agents.storyteller import StorytellerAgent
+from executor import Executor
+from planner import Task
+from tools.metrics import metrics
+
+# 'miss' gives the keyword pass a little sadness - not enough for the 'sad' bucket
+TEXT = "we went to the park today and I miss grandma"
+
+
+class FakeGemini:
+    """Answers the emotion prompt after a delay, like a model call"""
+
+    mock_mode = False
+    circuit_open = False
+
+    def __init__(self, response: str = '', error: Exception = None, delay: float = 0.2):
+        self.response = response
+        self.error = error
+        self.delay = delay
+
+    async def generate(self, prompt: str, **kwargs) -> str:
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.response
+
+
+class SlowStoryteller:
+    """Records each story run, and whether it was cancelled"""
+
+    speculation_key = StorytellerAgent.speculation_key
+    emotion_bucket = staticmethod(StorytellerAgent.emotion_bucket)
+
+    def __init__(self):
+        self.runs = []
+
+    async def generate_story(self, input_text: str, emotion_context=None, **kwargs):
+        run = {'bucket': self.emotion_bucket(emotion_context), 'cancelled': False}
+        self.runs.append(run)
+        try:
+            await asyncio.sleep(0.5)
+        except asyncio.CancelledError:
+            run['cancelled'] = True
+            raise
+        return {'id': f"story-{len(self.runs)}", 'bucket': run['bucket']}
+
+
+def detector(gemini: FakeGemini) -> EmotionDetectorAgent:
+    agent = EmotionDetectorAgent()
+    agent.gemini = gemini
+    return agent
+
+
+def run_story(gemini: FakeGemini):
+    executor = Executor(memory=object())
+    storyteller = SlowStoryteller()
+    executor.agents['emotion_detector'] = detector(gemini)
+    executor.agents['storyteller'] = storyteller
+    tasks = [
+        Task('emotion', 'emotion_detector', 'analyze_emotion', {'text': TEXT, 'mood': 'neutral'}, priority=2),
+        Task('story', 'storyteller', 'generate_story', {'input_text': TEXT}, priority=3,
+             depends_on=['emotion'], speculate_on='emotion'),
+    ]
+    results = asyncio.run(executor.execute(tasks))
+    return results, storyteller.runs
+
+
+def test_quick_pass_is_the_keyword_pass():
+    quick = EmotionDetectorAgent().quick_analyze_emotion(TEXT)
+    assert quick['provisional']
+    assert StorytellerAgent.emotion_bucket(quick['emotions']) is None
+
+
+def test_gemini_scores_are_averaged_with_keyword_scores():
+    agent = detector(FakeGemini("happiness: 0.1\nsadness: 0.95\nfear: 0\nanger: 0\nsurprise: 0\nneutral: 0.1", delay=0))
+    result = asyncio.run(agent.analyze_emotion(TEXT))
+    assert result['emotions']['sadness'] > 0.5
+    assert StorytellerAgent.emotion_bucket(result['emotions']) == 'sad'
+
+
+def test_gemini_failure_falls_back_to_keyword_scores():
+    quick = EmotionDetectorAgent().quick_analyze_emotion(TEXT)
+    result = asyncio.run(detector(FakeGemini(error=TimeoutError('slow'), delay=0)).analyze_emotion(TEXT))
+    assert result['emotions'] == quick['emotions']
+
+
+def test_parse_scores():
+    assert EmotionDetectorAgent._parse_scores('{"Sadness": 0.7, "fear": 1.4, "joy": 0.9}') == {'sadness': 0.7, 'fear': 1.0}
+    assert EmotionDetectorAgent._parse_scores("I can't tell") == {}
+
+
+def test_mismatch_cancels_the_speculative_story():
+    cancelled_before = metrics.counter('llm.calls_cancelled')
+    results, runs = run_story(FakeGemini("happiness: 0.1\nsadness: 0.95"))
+
+    # Started from the keyword pass, then re-issued from Gemini's reading
+    assert [run['bucket'] for run in runs] == [None, 'sad']
+    assert runs[0]['cancelled'] and not runs[1]['cancelled']
+    assert results['story'] == {'id': 'story-2', 'bucket': 'sad'}
+    assert metrics.counter('llm.calls_cancelled') == cancelled_before + 1
+
+
+def test_agreement_keeps_the_speculative_story():
+    kept_before = metrics.counter('executor.speculation.kept')
+    results, runs = run_story(FakeGemini("happiness: 0.6\nsadness: 0.2"))
+
+    assert runs == [{'bucket': None, 'cancelled': False}]
+    assert results['story'] == {'id': 'story-1', 'bucket': None}
+    assert metrics.counter('executor.speculation.kept') == kept_before + 1
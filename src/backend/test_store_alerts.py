@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for storing parent alerts (MemoryPG.store_alerts in memory_pg.py)
+Run: python -m pytest -q test_store_alerts.py
+"""
+from contextlib import asynccontextmanager
+import asyncio
+import uuid
+
+from memory_pg import MemoryPG
+
+KID = str(uuid.uuid4())
+PARENT = uuid.uuid4()
+
+
+class FakeConnection:
+    """Knows one kid and its parent; the alert insert returns what the database kept"""
+
+    def __init__(self, keep=None):
+        self.keep = keep  # how many inserted alerts the database keeps (None: all)
+        self.inserted = None
+
+    async def fetch(self, query, *args):
+        if 'FROM kids' in query:
+            return [{'id': KID, 'parent_id': PARENT}] if uuid.UUID(KID) in args[0] else []
+        ids, kid_ids = args[0], args[2]
+        self.inserted = list(zip(ids, kid_ids))
+        return [{'id': alert_id} for alert_id in ids[:self.keep]]
+
+
+class FakeDatabase:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self, consistency: str = 'strong'):
+        yield self.conn
+
+
+def store(conn, alerts):
+    return asyncio.run(MemoryPG(FakeDatabase(conn)).store_alerts(alerts))
+
+
+def test_returns_the_ids_of_stored_alerts():
+    conn = FakeConnection()
+    ids = store(conn, [{'childId': KID, 'message': 'one'}, {'childId': KID, 'message': 'two'}])
+    assert ids == [str(alert_id) for alert_id, _ in conn.inserted]
+    assert len(set(ids)) == 2
+
+
+def test_alerts_without_a_parent_are_skipped():
+    conn = FakeConnection()
+    ids = store(conn, [{'childId': str(uuid.uuid4())}, {'childId': KID}])
+    assert [kid_id for _, kid_id in conn.inserted] == [uuid.UUID(KID)]
+    assert ids == [str(conn.inserted[0][0])]
+
+
+def test_only_ids_returned_by_the_insert_are_reported():
+    conn = FakeConnection(keep=1)
+    ids = store(conn, [{'childId': KID}, {'childId': KID}])
+    assert ids == [str(conn.inserted[0][0])]
+
+
+def test_nothing_to_store():
+    conn = FakeConnection()
+    assert store(conn, [{'childId': str(uuid.uuid4())}]) == []
+    assert conn.inserted is None
+    assert asyncio.run(MemoryPG(FakeDatabase(conn)).store_alert({'childId': str(uuid.uuid4())})) is None
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Tests for idempotent story creation (api_server._create_story_once and the
+story_requests claims in memory_pg.py)
+Run: python -m pytest -q test_story_requests.py
+"""
+import asyncio
+import time
+
+import pytest
+
+import api_server
+from api_server import StoryRequest, StoryResponse, _create_story_once, _story_request_key
+from config import config
+
+
+class FakeStoryRequests:
+    """The story_requests table of MemoryPG, kept in a dict"""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def claim_story_request(self, key, child_id, ttl):
+        row = self.rows.get(key)
+        age = time.monotonic() - row['created_at'] if row else 0
+        if (row is None or (row['status'] == 'completed' and age > ttl)
+                or (row['status'] == 'pending' and age > config.STORY_REQUEST_DEADLINE)):
+            self.rows[key] = {'status': 'pending', 'response': None, 'created_at': time.monotonic()}
+            return None
+        return await self.get_story_request(key)
+
+    async def get_story_request(self, key, conn=None):
+        row = self.rows.get(key)
+        return {'status': row['status'], 'response': row['response']} if row else None
+
+    async def complete_story_request(self, key, response):
+        self.rows[key].update(status='completed', response=response, created_at=time.monotonic())
+
+    async def release_story_request(self, key):
+        if self.rows.get(key, {}).get('status') == 'pending':
+            del self.rows[key]
+
+
+class FakeGeneration:
+    """Stands in for _admitted_story: each call plays the next scripted outcome"""
+
+    def __init__(self, *outcomes, delay: float = 0.05):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, request, family, lane, preloaded=None):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return StoryResponse(story_id=outcome, status='completed', preview='A story', processing_time=0.1)
+
+
+@pytest.fixture
+def requests_table(monkeypatch):
+    table = FakeStoryRequests()
+    monkeypatch.setattr(api_server, 'memory', table)
+    return table
+
+
+def generation(monkeypatch, *outcomes, **kwargs) -> FakeGeneration:
+    fake = FakeGeneration(*outcomes, **kwargs)
+    monkeypatch.setattr(api_server, '_admitted_story', fake)
+    return fake
+
+
+REQUEST = StoryRequest(child_id='demo_child_1', text_input='We built a sandcastle')
+
+
+def create(key: str = 'client:abc'):
+    return _create_story_once(REQUEST, key, config.IDEMPOTENCY_KEY_TTL, 'family')
+
+
+def test_replayed_key_returns_the_first_story(monkeypatch, requests_table):
+    generate = generation(monkeypatch, 'story-1', 'story-2')
+
+    async def run():
+        return await create(), await create()
+
+    first, replay = asyncio.run(run())
+    assert first.story_id == replay.story_id == 'story-1'
+    assert generate.calls == 1
+    assert requests_table.rows['client:abc']['status'] == 'completed'
+
+
+def test_concurrent_duplicate_waits_for_the_first_request(monkeypatch, requests_table):
+    generate = generation(monkeypatch, 'story-1', 'story-2', delay=0.3)
+
+    async def run():
+        # Two workers: the second finds the key claimed and waits for its response
+        return await asyncio.gather(create(), create())
+
+    first, duplicate = asyncio.run(run())
+    assert first.story_id == duplicate.story_id == 'story-1'
+    assert generate.calls == 1
+
+
+def test_failed_request_releases_its_claim(monkeypatch, requests_table):
+    generate = generation(monkeypatch, RuntimeError('model down'), 'story-2')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(create())
+    assert 'client:abc' not in requests_table.rows
+
+    # The client's retry generates the story
+    assert asyncio.run(create()).story_id == 'story-2'
+    assert generate.calls == 2
+
+
+def test_unknown_story_is_not_stored(monkeypatch, requests_table):
+    generation(monkeypatch, 'unknown')
+    asyncio.run(create())
+    assert 'client:abc' not in requests_table.rows
+
+
+def test_waiting_duplicate_takes_over_when_the_first_fails(monkeypatch, requests_table):
+    generate = generation(monkeypatch, RuntimeError('model down'), 'story-2', delay=0.1)
+
+    async def run():
+        return await asyncio.gather(create(), create(), return_exceptions=True)
+
+    failed, duplicate = asyncio.run(run())
+    assert isinstance(failed, RuntimeError)
+    assert duplicate.story_id == 'story-2'
+    assert generate.calls == 2
+    assert requests_table.rows['client:abc']['status'] == 'completed'
+
+
+def test_duplicate_gives_up_at_the_request_deadline(monkeypatch, requests_table):
+    monkeypatch.setattr(config, 'STORY_REQUEST_DEADLINE', 0.2)
+    requests_table.rows['client:abc'] = {'status': 'pending', 'response': None, 'created_at': time.monotonic()}
+    generate = generation(monkeypatch, 'story-1')
+
+    with pytest.raises(api_server.HTTPException) as conflict:
+        asyncio.run(create())
+    assert conflict.value.status_code == 409
+    assert generate.calls == 0
+
+
+def test_request_keys_are_scoped_to_the_child():
+    other_child = StoryRequest(child_id='demo_child_2', text_input='We built a sandcastle')
+    key, ttl = _story_request_key(REQUEST, 'retry-1')
+    assert ttl == config.IDEMPOTENCY_KEY_TTL
+    assert _story_request_key(REQUEST, 'retry-1')[0] == key
+    assert _story_request_key(other_child, 'retry-1')[0] != key
+
+    # Without a client key, identical input is a retry within the dedup window
+    input_key, input_ttl = _story_request_key(REQUEST, None)
+    assert input_key.startswith('input:') and input_ttl == config.STORY_DEDUP_WINDOW
+    assert _story_request_key(other_child, None)[0] != input_key
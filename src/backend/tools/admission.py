@@ -0,0 +1,241 @@
+"""Admission control and fair scheduling of story generation"""
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import itertools
+import math
+import time
+
+from config import config
+from tools.metrics import metrics
+
+# Lanes in priority order: a waiting request in an earlier lane always
+# gets the next free slot before any request in a later one
+LANES = ('interactive', 'batch', 'background')
+
+# Most token buckets kept; the least recently used are dropped (refilled) first
+_MAX_BUCKETS = 100000
+
+
+class AdmissionRejected(Exception):
+    """Request shed by admission control; retry after retry_after seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Too many story requests ({reason})")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most burst"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float = 1.0) -> float:
+        """Seconds until cost tokens are available (0 if they are now)"""
+        self.refill()
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+
+class _Waiter:
+    __slots__ = ('future', 'family', 'lane')
+
+    def __init__(self, family: str, lane: str):
+        self.future = asyncio.get_running_loop().create_future()
+        self.family = family
+        self.lane = lane
+
+
+class AdmissionController:
+    """
+    Limits story generations running at once on this worker and decides
+    who goes next when they are all busy.
+
+    - Token buckets per child and per family (parent) shed requests beyond
+      their rate straight away with a Retry-After, before they queue.
+      A batch is charged once, for all its stories, to each family's
+      batch budget (admit_batch); its stories then take no tokens.
+    - Requests wait for one of ADMISSION_MAX_CONCURRENT slots in priority
+      lanes: interactive kid requests, then batch, then background
+      illustration.
+    - Within a lane, families are served by start-time fair queuing:
+      each family's next request is tagged after its previous one, so a
+      household with ten queued stories alternates with everyone else
+      instead of going first ten times.
+    - Full queues and queue waits past ADMISSION_QUEUE_TIMEOUT are shed.
+      Batch and background work is never shed once queued; its batch or
+      story was already admitted.
+
+    Buckets and queues are per worker process.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self._queues: Dict[str, List[Tuple[float, int, _Waiter]]] = {lane: [] for lane in LANES}
+        self._queued: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._family_queued: Dict[Tuple[str, str], int] = {}  # (lane, family) -> waiting requests
+        self._virtual_time: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._family_tags: Dict[Tuple[str, str], float] = {}
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._sequence = itertools.count()
+        self._service_time = 10.0  # moving average of seconds a slot is held
+
+    @asynccontextmanager
+    async def admit(self, family: str, child_id: Optional[str] = None, lane: str = 'interactive',
+                    weight: float = 1.0):
+        """Hold a generation slot for the block, or raise AdmissionRejected"""
+        buckets = self._take_tokens(family, child_id) if lane == 'interactive' else []
+
+        start = time.monotonic()
+        if self.in_flight < config.ADMISSION_MAX_CONCURRENT and not self._waiting_ahead(lane):
+            self.in_flight += 1
+        else:
+            try:
+                await self._enqueue(family, lane, weight)
+            except BaseException:
+                # Never ran, so it does not count against the rate limits
+                for bucket in buckets:
+                    bucket.tokens = min(bucket.burst, bucket.tokens + 1)
+                raise
+        metrics.observe('admission.queue_wait', time.monotonic() - start)
+        metrics.increment(f"admission.admitted.{lane}")
+        self._record_gauges()
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._service_time = 0.9 * self._service_time + 0.1 * (time.monotonic() - started)
+            self._release()
+
+    def admit_batch(self, stories_by_family: Dict[str, int]):
+        """
+        Charge a batch's stories to each family's batch budget, or raise
+        AdmissionRejected and charge nothing. The stories then queue in the
+        batch lane. A batch bigger than the budget's burst empties it.
+        """
+        charges = [
+            (self._bucket(f"batch:{family}", config.BATCH_STORIES_PER_MINUTE, config.BATCH_STORY_BURST), count)
+            for family, count in stories_by_family.items()
+        ]
+        charges = [(bucket, min(count, bucket.burst)) for bucket, count in charges]
+        wait = max((bucket.wait_time(cost) for bucket, cost in charges), default=0.0)
+        if wait > 0:
+            self._shed('batch_rate_limited', wait)
+        for bucket, cost in charges:
+            bucket.tokens -= cost
+        metrics.increment('admission.admitted_batches')
+
+    def _take_tokens(self, family: str, child_id: Optional[str]) -> List[TokenBucket]:
+        buckets = [self._bucket(f"family:{family}", config.FAMILY_STORIES_PER_MINUTE, config.FAMILY_STORY_BURST)]
+        if child_id and child_id != family:
+            buckets.append(self._bucket(f"child:{child_id}", config.CHILD_STORIES_PER_MINUTE, config.CHILD_STORY_BURST))
+
+        # Take from every bucket or none, so a rejected request costs nothing
+        wait = max(bucket.wait_time() for bucket in buckets)
+        if wait > 0:
+            self._shed('rate_limited', wait)
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return buckets
+
+    def _bucket(self, key: str, per_minute: float, burst: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(per_minute / 60, burst)
+            if len(self._buckets) > _MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _waiting_ahead(self, lane: str) -> bool:
+        """Whether anyone queued would be served before a new request in this lane"""
+        return any(self._queued[ahead] for ahead in LANES[:LANES.index(lane) + 1])
+
+    async def _enqueue(self, family: str, lane: str, weight: float):
+        if lane == 'interactive':
+            queued = self._queued[lane]
+            if queued >= config.ADMISSION_MAX_QUEUE:
+                self._shed('queue_full', self._service_time * (queued + 1) / config.ADMISSION_MAX_CONCURRENT)
+            if self._family_queued.get((lane, family), 0) >= config.ADMISSION_FAMILY_QUEUE:
+                self._shed('family_queue_full', self._service_time)
+
+        # Start-time fair queuing: a family's next request starts after its last one
+        tag_key = (lane, family)
+        start_tag = max(self._virtual_time[lane], self._family_tags.get(tag_key, 0.0))
+        self._family_tags[tag_key] = start_tag + 1 / weight
+
+        waiter = _Waiter(family, lane)
+        heapq.heappush(self._queues[lane], (start_tag, next(self._sequence), waiter))
+        self._queued[lane] += 1
+        self._family_queued[tag_key] = self._family_queued.get(tag_key, 0) + 1
+        self._record_gauges()
+
+        timeout = config.ADMISSION_QUEUE_TIMEOUT if lane == 'interactive' else None
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot just as we gave up - pass it on
+                self._release()
+            else:
+                waiter.future.cancel()
+                self._dequeued(waiter)
+            self._record_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                self._shed('queue_timeout', self._service_time)
+            raise
+
+    def _dequeued(self, waiter: _Waiter):
+        self._queued[waiter.lane] -= 1
+        key = (waiter.lane, waiter.family)
+        remaining = self._family_queued.get(key, 1) - 1
+        if remaining:
+            self._family_queued[key] = remaining
+        else:
+            self._family_queued.pop(key, None)
+            # An idle family starts level with everyone on its next request
+            self._family_tags.pop(key, None)
+
+    def _release(self):
+        """Hand the freed slot to the next waiter, or give it back"""
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue:
+                start_tag, _, waiter = heapq.heappop(queue)
+                if waiter.future.done():
+                    continue  # gave up waiting
+                self._virtual_time[lane] = start_tag
+                self._dequeued(waiter)
+                waiter.future.set_result(None)
+                self._record_gauges()
+                return
+        self.in_flight -= 1
+        self._record_gauges()
+
+    def _shed(self, reason: str, retry_after: float):
+        metrics.increment(f"admission.shed.{reason}")
+        raise AdmissionRejected(reason, retry_after)
+
+    def _record_gauges(self):
+        metrics.gauge('admission.in_flight', self.in_flight)
+        for lane in LANES:
+            metrics.gauge(f"admission.queue_depth.{lane}", self._queued[lane])
+
+
+# Singleton instance
+admission = AdmissionController()
@@ -0,0 +1,128 @@
+"""Push delivery of parent alerts to connected dashboards"""
+from typing import Any, Dict, Optional, Set
+from contextlib import asynccontextmanager
+import asyncio
+import json
+
+from config import config
+from tools.metrics import metrics
+
+# NOTIFY channel MemoryPG.store_alerts() publishes new alerts on
+ALERT_CHANNEL = 'parent_alerts'
+
+# Seconds between attempts to re-open a lost LISTEN connection
+_RECONNECT_DELAYS = (0.5, 1, 2, 5, 10)
+
+
+class AlertHub:
+    """
+    Hands new alerts to the parent dashboards connected to this worker.
+    Alerts are published with NOTIFY in the same transaction that stores
+    them, and every API worker LISTENs on one primary connection, so a
+    dashboard streaming from any worker receives alerts stored by any other.
+    Each subscriber has a bounded queue; a dashboard that stops reading
+    loses its oldest undelivered alerts, which stay in the unread feed.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._db = None
+        self._conn = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None
+
+    async def start(self, db) -> bool:
+        """LISTEN for alerts on the primary database"""
+        self._db = db
+        self._closing = False
+        try:
+            await self._listen()
+            return True
+        except Exception as e:
+            print(f"[AlertHub] Could not listen for alerts: {e}")
+            return False
+
+    async def stop(self):
+        """Stop listening and end every open stream"""
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await self._db.unlisten(conn, ALERT_CHANNEL, self._on_notify)
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._put(queue, None)
+
+    @asynccontextmanager
+    async def subscribe(self, parent_id: str):
+        """Queue of the parent's new alerts; None means the server is shutting down"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=config.ALERT_STREAM_QUEUE_SIZE)
+        self._subscribers.setdefault(parent_id, set()).add(queue)
+        self._record_subscribers()
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(parent_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[parent_id]
+            self._record_subscribers()
+
+    def publish(self, parent_id: str, alert: Dict[str, Any]):
+        """Deliver an alert to this worker's subscribers for the parent"""
+        for queue in self._subscribers.get(parent_id, ()):
+            self._put(queue, alert)
+            metrics.increment('alerts.stream.delivered')
+
+    def _put(self, queue: asyncio.Queue, item: Any):
+        if queue.full():
+            queue.get_nowait()
+            metrics.increment('alerts.stream.dropped')
+        queue.put_nowait(item)
+
+    def _on_notify(self, conn, pid: int, channel: str, payload: str):
+        try:
+            alert = json.loads(payload)
+            parent_id = alert.pop('parentId')
+        except (ValueError, KeyError) as e:
+            print(f"[AlertHub] Ignoring malformed notification: {e}")
+            return
+        metrics.increment('alerts.stream.notifications')
+        self.publish(parent_id, alert)
+
+    def _on_lost(self, conn):
+        if self._closing or conn is not self._conn:
+            return
+        print("[AlertHub] Lost the LISTEN connection, reconnecting")
+        metrics.increment('alerts.stream.reconnects')
+        self._conn = None
+        self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _listen(self):
+        self._conn = await self._db.listen(ALERT_CHANNEL, self._on_notify, on_lost=self._on_lost)
+        print(f"[AlertHub] Listening for alerts on '{ALERT_CHANNEL}'")
+
+    async def _reconnect(self):
+        attempt = 0
+        while not self._closing:
+            await asyncio.sleep(_RECONNECT_DELAYS[min(attempt, len(_RECONNECT_DELAYS) - 1)])
+            try:
+                await self._listen()
+                return
+            except Exception as e:
+                attempt += 1
+                print(f"[AlertHub] Reconnect attempt {attempt} failed: {e}")
+
+    def _record_subscribers(self):
+        metrics.gauge('alerts.stream.subscribers', sum(len(queues) for queues in self._subscribers.values()))
+
+
+# Singleton instance
+alert_hub = AlertHub()
@@ -0,0 +1,108 @@
+"""Per-child cache of character designs for consistent illustrations"""
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import re
+
+from tools.metrics import metrics
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+_ARTICLES = ('a ', 'an ', 'the ', 'my ')
+
+
+def normalise_character(name: str) -> str:
+    """Canonical key for a character name ('The Unicorns!' -> 'unicorn')"""
+    key = _NON_WORD.sub(' ', (name or '').lower()).strip()
+    for article in _ARTICLES:
+        if key.startswith(article):
+            key = key[len(article):]
+    if key.endswith('ies') and len(key) > 4:
+        key = key[:-3] + 'y'
+    elif key.endswith('s') and not key.endswith('ss') and len(key) > 3:
+        key = key[:-1]
+    return key
+
+
+class CharacterDesignCache:
+    """
+    Character designs keyed by (child, normalised character, style).
+    Designs are loaded from the memory backend once per child and kept in
+    a bounded in-process map; new designs are written through to the backend.
+    The first design stored for a key wins, so a character looks the same in
+    every story.
+    """
+
+    def __init__(self, backend: Any = None, max_children: int = 1000):
+        self.backend = backend
+        self.max_children = max_children
+        self._designs: 'OrderedDict[str, Dict[Tuple[str, str], Dict[str, Any]]]' = OrderedDict()
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    async def get(self, child_id: str, character: str, style: str) -> Optional[Dict[str, Any]]:
+        """Cached design for a character, or None"""
+        designs = await self._designs_for(child_id)
+        design = designs.get((normalise_character(character), style))
+        metrics.increment('character_designs.hits' if design else 'character_designs.misses')
+        return design
+
+    async def put(self, child_id: str, character: str, style: str, design: Dict[str, Any]):
+        """Store a new design in the cache and the backend"""
+        key = normalise_character(character)
+        designs = await self._designs_for(child_id)
+        if (key, style) in designs:
+            return
+        designs[(key, style)] = design
+
+        store = getattr(self.backend, 'store_character_design', None)
+        if store:
+            try:
+                await store(child_id, key, style, design)
+            except Exception as e:
+                print(f"[CharacterDesigns] Error persisting design for {key}: {e}")
+
+    async def mentioned_in(self, child_id: str, text: str, style: str) -> List[Dict[str, Any]]:
+        """Designs in a style for characters the child already has that appear in the text"""
+        designs = await self._designs_for(child_id)
+        if not designs:
+            return []
+        words = f" {_NON_WORD.sub(' ', text.lower())} "
+        return [
+            design for (key, design_style), design in designs.items()
+            if design_style == style and (f" {key} " in words or f" {key}s " in words)
+        ]
+
+    async def _designs_for(self, child_id: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """
+        Designs for one child, loading them from the backend on first use.
+        A failed load is not cached, so the next call tries again.
+        """
+        if child_id in self._designs:
+            self._designs.move_to_end(child_id)
+            return self._designs[child_id]
+
+        # Share one backend load between concurrent callers
+        if child_id not in self._loading:
+            self._loading[child_id] = asyncio.ensure_future(self._load(child_id))
+        try:
+            designs = await asyncio.shield(self._loading[child_id])
+        finally:
+            self._loading.pop(child_id, None)
+        if designs is None:
+            return {}
+
+        self._designs.setdefault(child_id, designs)
+        while len(self._designs) > self.max_children:
+            self._designs.popitem(last=False)
+        return self._designs[child_id]
+
+    async def _load(self, child_id: str) -> Optional[Dict[Tuple[str, str], Dict[str, Any]]]:
+        """The child's designs from the backend, or None if they could not be read"""
+        load = getattr(self.backend, 'get_character_designs', None)
+        if not load:
+            return {}
+        try:
+            rows = await load(child_id)
+        except Exception as e:
+            print(f"[CharacterDesigns] Error loading designs for child {child_id}: {e}")
+            return None
+        return {(row['characterKey'], row['style']): row for row in rows}
@@ -0,0 +1,133 @@
+"""Circuit breaker for calls to unreliable upstream services"""
+from typing import Dict, Any
+from collections import deque
+import threading
+import time
+
+from config import config
+from tools.metrics import metrics
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream service whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Tracks recent call outcomes and latency for one upstream service.
+
+    closed    - calls go through; opens when the failure or slow-call rate
+                over the recent window crosses the threshold
+    open      - calls are rejected until the cooldown has passed
+    half_open - a single probe call is let through; success closes the
+                circuit, failure opens it again
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str,
+                 window: int = None,
+                 min_calls: int = None,
+                 failure_rate: float = None,
+                 slow_call_seconds: float = None,
+                 cooldown: float = None):
+        self.name = name
+        self.window = window or config.CIRCUIT_WINDOW
+        self.min_calls = min_calls or config.CIRCUIT_MIN_CALLS
+        self.failure_rate = failure_rate or config.CIRCUIT_FAILURE_RATE
+        self.slow_call_seconds = slow_call_seconds or config.CIRCUIT_SLOW_CALL_SECONDS
+        self.cooldown = cooldown or config.CIRCUIT_COOLDOWN
+
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=self.window)  # True for a bad (failed or slow) call
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def is_open(self) -> bool:
+        """True when a call right now would be rejected (does not claim the probe)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.OPEN:
+                return now - self._opened_at < self.cooldown
+            if self._state == self.HALF_OPEN:
+                return now - self._probe_started < self.cooldown
+            return False
+
+    def allow_request(self) -> bool:
+        """Check whether a call may go ahead, claiming the half-open probe if due"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.OPEN and now - self._opened_at < self.cooldown:
+                metrics.increment(f"circuit.{self.name}.rejected")
+                return False
+
+            # Cooldown over, or the previous probe never reported back
+            if self._state == self.HALF_OPEN and now - self._probe_started < self.cooldown:
+                metrics.increment(f"circuit.{self.name}.rejected")
+                return False
+
+            self._state = self.HALF_OPEN
+            self._probe_started = now
+            return True
+
+    def record_success(self, latency: float):
+        """Record a completed call; slow calls count against the circuit"""
+        slow = latency >= self.slow_call_seconds
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if slow:
+                    self._open()
+                else:
+                    self._close()
+                return
+            self._outcomes.append(slow)
+            self._evaluate()
+
+    def record_failure(self):
+        """Record a failed call"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(True)
+            self._evaluate()
+
+    def status(self) -> Dict[str, Any]:
+        """Breaker state for health checks"""
+        with self._lock:
+            bad = sum(self._outcomes)
+            return {
+                'state': self._state,
+                'recent_calls': len(self._outcomes),
+                'bad_call_rate': round(bad / len(self._outcomes), 3) if self._outcomes else 0.0
+            }
+
+    def _evaluate(self):
+        if len(self._outcomes) < self.min_calls:
+            return
+        if sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        metrics.increment(f"circuit.{self.name}.opened")
+        metrics.gauge(f"circuit.{self.name}.open", 1)
+        print(f"[CircuitBreaker] {self.name} circuit opened")
+
+    def _close(self):
+        self._state = self.CLOSED
+        self._outcomes.clear()
+        metrics.gauge(f"circuit.{self.name}.open", 0)
+        print(f"[CircuitBreaker] {self.name} circuit closed")
@@ -0,0 +1,135 @@
+"""Managed process pool for CPU-bound work off the API event loop"""
+from typing import Any, Callable, Optional
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import importlib
+import inspect
+import json
+import multiprocessing
+import os
+import time
+
+from config import config
+from tools.metrics import metrics
+
+
+# Imported by each worker as it starts, so the first real task does not pay for them
+WARM_MODULES = ('numpy', 'PIL.Image')
+
+
+def cpu_bound(func: Callable = None, *, inline_below: int = 0):
+    """
+    Mark a pure function or staticmethod as CPU-bound.
+    cpu_pool.run() sends it to a worker process, except when the combined
+    size of its str/bytes/list arguments is below inline_below, where the
+    round trip would cost more than the work itself. Only module-level
+    functions and staticmethods can be sent (they are pickled by name; a
+    bound method would pickle its whole object).
+    """
+    def mark(f: Callable) -> Callable:
+        f.cpu_bound = True
+        f.inline_below = inline_below
+        return f
+
+    return mark(func) if func else mark
+
+
+def _input_size(args, kwargs) -> int:
+    return sum(
+        len(value) for value in (*args, *kwargs.values())
+        if isinstance(value, (str, bytes, list, tuple))
+    )
+
+
+def _timed_call(func: Callable, args: tuple, kwargs: dict, submitted: float):
+    """Runs in the worker: returns the result with queue wait and run time"""
+    started = time.time()
+    result = func(*args, **kwargs)
+    return result, started - submitted, time.time() - started
+
+
+def _warm_up(delay: float) -> int:
+    """Import the heavy modules workers need, then pause so every worker gets one"""
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+@cpu_bound
+def encode_json(payload: Any) -> bytes:
+    """JSON-encode a large response payload"""
+    return json.dumps(payload, default=_json_default).encode('utf-8')
+
+
+class CPUPool:
+    """
+    Process pool started with the API and shut down with it.
+    Until start() is called (scripts, demo mode) work runs inline.
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = config.CPU_POOL_WORKERS if workers is None else workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queued = 0
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    async def start(self):
+        """Start the worker processes and warm each one up"""
+        if self.started or self.workers <= 0:
+            return
+
+        context = multiprocessing.get_context(config.CPU_POOL_START_METHOD)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, _warm_up, 0.05) for _ in range(self.workers)
+        ))
+        metrics.gauge('cpu_pool.workers', len(set(pids)))
+        print(f"[CPUPool] Started {len(set(pids))} workers in {time.monotonic() - start:.2f}s")
+
+    def shutdown(self):
+        """Stop the workers, dropping queued work"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            print("[CPUPool] Shut down")
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a pure function in a worker process and await its result"""
+        if inspect.ismethod(func):
+            raise TypeError(f"cpu_pool.run needs a module-level function or staticmethod, not {func.__qualname__}")
+        if not self.started or _input_size(args, kwargs) < getattr(func, 'inline_below', 0):
+            metrics.increment('cpu_pool.inline')
+            return func(*args, **kwargs)
+
+        name = getattr(func, '__qualname__', 'task')
+        self._queued += 1
+        metrics.gauge('cpu_pool.queue_depth', self._queued)
+        try:
+            result, waited, ran = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed_call, func, args, kwargs, time.time()
+            )
+        finally:
+            self._queued -= 1
+            metrics.gauge('cpu_pool.queue_depth', self._queued)
+
+        metrics.increment('cpu_pool.tasks')
+        metrics.observe('cpu_pool.queue_wait', waited)
+        metrics.observe(f"cpu_pool.{name}", ran)
+        return result
+
+
+# Singleton instance
+cpu_pool = CPUPool()
@@ -0,0 +1,316 @@
+"""Emotion trend analytics over a child's session history (NumPy)"""
+from typing import Any, Dict, List
+from datetime import datetime, timezone
+import time
+
+import numpy as np
+
+from config import config
+
+# Emotion scores kept per session, in column order
+EMOTIONS = ('happiness', 'sadness', 'fear', 'anger', 'surprise', 'neutral')
+NEGATIVE_EMOTIONS = ('sadness', 'fear', 'anger')
+POSITIVE_MOODS = {'happy', 'excited'}
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# Smallest standard deviation a z-score divides by, so a child whose scores
+# barely move is not flagged for a small wobble
+_MIN_STD = 0.05
+
+# Change in an EWMA over one trend window that counts as rising or falling
+_TREND_STEP = 0.05
+
+# EWMA is computed in closed form over chunks of up to this many rows;
+# (1 - alpha) ** -chunk must stay finite, so chunks shrink as alpha grows
+# until (1 - alpha) ** -chunk is at most e ** _EWMA_MAX_EXPONENT
+_EWMA_CHUNK = 512
+_EWMA_MAX_EXPONENT = 600.0
+
+
+def _scores(session: Dict[str, Any]) -> Dict[str, float]:
+    """Emotion scores of a session, stored either as the analysis or just its scores"""
+    emotions = session.get('emotions') or {}
+    if isinstance(emotions.get('emotions'), dict):
+        emotions = emotions['emotions']
+    return emotions
+
+
+def _epoch(timestamp: Any) -> float:
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp).timestamp()
+    return time.time()
+
+
+def ewma(values: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponentially weighted moving average down the rows of a 2-D array,
+    seeded with the first row. Each chunk is solved in closed form
+    (a cumulative sum of rescaled values) starting from the previous
+    chunk's last average, so no Python loop runs per session.
+    """
+    if alpha >= 1.0:
+        # No smoothing: each average is just that row
+        return values.astype(float)
+    out = np.empty_like(values, dtype=float)
+    decay = 1.0 - alpha
+    length = max(1, min(_EWMA_CHUNK, int(_EWMA_MAX_EXPONENT / -np.log(decay))))
+    previous = values[:1].astype(float)
+    for start in range(0, len(values), length):
+        chunk = values[start:start + length]
+        steps = np.arange(1, len(chunk) + 1)[:, None]
+        scale = decay ** -steps
+        out[start:start + len(chunk)] = decay ** steps * (previous + np.cumsum(alpha * chunk * scale, axis=0))
+        previous = out[start + len(chunk) - 1:start + len(chunk)]
+    return out
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Mean of each row and up to window - 1 rows before it (NaNs skipped)"""
+    present = ~np.isnan(values)
+    sums = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(np.where(present, values, 0.0), axis=0)])
+    counts = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(present, axis=0)])
+    end = np.arange(1, len(values) + 1)
+    begin = np.maximum(0, end - window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[end] - sums[begin]) / (counts[end] - counts[begin])
+
+
+def trailing_zscores(values: np.ndarray, window: int, min_sessions: int) -> np.ndarray:
+    """
+    z-score of each row against the window rows before it (not itself).
+    NaN where fewer than min_sessions earlier rows exist.
+    """
+    padded = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+    squares = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values ** 2, axis=0)])
+    end = np.arange(len(values))
+    begin = np.maximum(0, end - window)
+    counts = (end - begin)[:, None].astype(float)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (padded[end] - padded[begin]) / counts
+        variance = (squares[end] - squares[begin]) / counts - mean ** 2
+        std = np.maximum(np.sqrt(np.maximum(variance, 0.0)), _MIN_STD)
+        z = (values - mean) / std
+    z[counts[:, 0] < min_sessions] = np.nan
+    return z
+
+
+class EmotionSeries:
+    """
+    A child's emotion history as arrays, oldest session first: session
+    times, UTC weekdays, a (sessions x EMOTIONS) score matrix and whether each
+    session's mood was positive. Built once per request from
+    get_emotional_history(); every statistic is then a vectorised pass
+    over the arrays.
+    """
+
+    def __init__(self, times: np.ndarray, weekdays: np.ndarray, scores: np.ndarray,
+                 positive: np.ndarray, moods: List[str]):
+        self.times = times
+        self.weekdays = weekdays
+        self.scores = scores  # NaN where a session has no score for an emotion
+        self.positive = positive
+        self.moods = moods
+
+    @classmethod
+    def from_history(cls, history: List[Dict[str, Any]]) -> 'EmotionSeries':
+        """Arrays from session dicts ('timestamp', 'mood', 'emotions'), in any order"""
+        count = len(history)
+        times = np.fromiter((_epoch(session.get('timestamp')) for session in history), dtype=float, count=count)
+        # None (a missing score) becomes NaN
+        scores = np.array([list(map(_scores(session).get, EMOTIONS)) for session in history],
+                          dtype=float).reshape(count, len(EMOTIONS))
+        moods = [session.get('mood') or 'neutral' for session in history]
+
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        moods = [moods[i] for i in order]
+        positive = np.fromiter((mood in POSITIVE_MOODS for mood in moods), dtype=bool, count=count)
+        # Days since the epoch (a Thursday) -> weekday in UTC, Monday = 0
+        weekdays = (np.floor(times / 86400).astype(np.int64) + 3) % 7
+        return cls(times, weekdays, scores[order], positive, moods)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def averages(self) -> Dict[str, float]:
+        """Mean score of each emotion recorded at least once"""
+        present = ~np.isnan(self.scores)
+        totals = np.where(present, self.scores, 0.0).sum(axis=0)
+        counts = present.sum(axis=0)
+        return {
+            emotion: float(totals[column] / counts[column])
+            for column, emotion in enumerate(EMOTIONS) if counts[column]
+        }
+
+    def _filled(self) -> np.ndarray:
+        """Scores with missing values replaced by the emotion's mean (0 if never recorded)"""
+        present = ~np.isnan(self.scores)
+        counts = present.sum(axis=0)
+        means = np.divide(np.where(present, self.scores, 0.0).sum(axis=0), counts,
+                          out=np.zeros(len(EMOTIONS)), where=counts > 0)
+        return np.where(present, self.scores, means)
+
+    def trends(self) -> Dict[str, Dict[str, Any]]:
+        """Latest rolling mean and EWMA of each emotion, and which way the EWMA is heading"""
+        if not len(self):
+            return {}
+        window = config.EMOTION_TREND_WINDOW
+        rolling = rolling_mean(self.scores, window)[-1]
+        smoothed = ewma(self._filled(), 2.0 / (config.EMOTION_EWMA_SPAN + 1))
+        before = smoothed[max(0, len(self) - 1 - window)]
+        change = smoothed[-1] - before
+
+        recorded = ~np.isnan(self.scores).all(axis=0)
+        return {
+            emotion: {
+                'rolling_mean': round(float(rolling[column]), 4) if not np.isnan(rolling[column]) else None,
+                'ewma': round(float(smoothed[-1, column]), 4),
+                'direction': ('rising' if change[column] >= _TREND_STEP
+                              else 'falling' if change[column] <= -_TREND_STEP else 'steady')
+            }
+            for column, emotion in enumerate(EMOTIONS) if recorded[column]
+        }
+
+    def anomalies(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Sessions where an emotion was EMOTION_ANOMALY_Z deviations from the child's recent baseline, newest first"""
+        if len(self) <= config.EMOTION_ANOMALY_MIN_SESSIONS:
+            return []
+        z = trailing_zscores(self._filled(), config.EMOTION_BASELINE_SESSIONS, config.EMOTION_ANOMALY_MIN_SESSIONS)
+        flagged = (np.abs(np.nan_to_num(z)) >= config.EMOTION_ANOMALY_Z) & ~np.isnan(self.scores)
+        rows, columns = np.nonzero(flagged)
+        newest = np.argsort(-rows, kind='stable')[:limit]
+        return [
+            {
+                'date': datetime.fromtimestamp(self.times[rows[i]], timezone.utc).isoformat(),
+                'emotion': EMOTIONS[columns[i]],
+                'value': round(float(self.scores[rows[i], columns[i]]), 4),
+                'z_score': round(float(z[rows[i], columns[i]]), 2),
+                'latest': bool(rows[i] == len(self) - 1)
+            }
+            for i in newest
+        ]
+
+    def weekday_patterns(self) -> Dict[str, Dict[str, Any]]:
+        """Mean emotion scores and session count by day of the week (days with sessions only)"""
+        filled = self._filled()
+        sessions = np.bincount(self.weekdays, minlength=7)
+        totals = np.stack([np.bincount(self.weekdays, weights=filled[:, column], minlength=7)
+                           for column in range(len(EMOTIONS))], axis=1)
+        positive = np.bincount(self.weekdays, weights=self.positive, minlength=7)
+        recorded = ~np.isnan(self.scores).all(axis=0)
+        return {
+            WEEKDAYS[day]: {
+                'sessions': int(sessions[day]),
+                'positive_share': round(float(positive[day] / sessions[day]), 4),
+                **{emotion: round(float(totals[day, column] / sessions[day]), 4)
+                   for column, emotion in enumerate(EMOTIONS) if recorded[column]}
+            }
+            for day in range(7) if sessions[day]
+        }
+
+    def mood_trend(self) -> str:
+        """'positive', 'mixed' or 'concerning' from the EWMA of positive moods ('neutral' without sessions)"""
+        if not len(self):
+            return "neutral"
+        share = ewma(self.positive[:, None].astype(float), 2.0 / (config.EMOTION_EWMA_SPAN + 1))[-1, 0]
+        if share >= 0.7:
+            return "positive"
+        if share <= 0.3:
+            return "concerning"
+        return "mixed"
+
+    def chart_data(self, points: int = 14) -> List[Dict[str, Any]]:
+        """The last sessions' scores for the mood chart, with the smoothed happiness trend"""
+        if not len(self):
+            return []
+        filled = self._filled()
+        happiness = EMOTIONS.index('happiness')
+        trend = ewma(filled[:, happiness:happiness + 1], 2.0 / (config.EMOTION_EWMA_SPAN + 1))[:, 0]
+        start = max(0, len(self) - points)
+        return [
+            {
+                'date': datetime.fromtimestamp(self.times[row], timezone.utc).isoformat(),
+                'happiness': float(filled[row, happiness]),
+                'sadness': float(filled[row, EMOTIONS.index('sadness')]),
+                'fear': float(filled[row, EMOTIONS.index('fear')]),
+                'anger': float(filled[row, EMOTIONS.index('anger')]),
+                'happiness_trend': round(float(trend[row]), 4),
+                'overall_mood': self.moods[row]
+            }
+            for row in range(start, len(self))
+        ]
+
+    def insights(self) -> Dict[str, Any]:
+        """Summary, trends, anomalies, weekday patterns, alerts and recommendations for parents"""
+        insights = {
+            'emotional_summary': {},
+            'trends': {},
+            'anomalies': [],
+            'weekday_patterns': {},
+            'alerts': [],
+            'recommendations': []
+        }
+        if not len(self):
+            return insights
+
+        averages = self.averages()
+        insights['emotional_summary'] = averages
+        insights['trends'] = self.trends()
+        insights['anomalies'] = self.anomalies()
+        insights['weekday_patterns'] = self.weekday_patterns()
+
+        if averages.get('happiness', 0) < 0.4:
+            insights['recommendations'].append({
+                'type': 'emotional_support',
+                'message': 'Consider activities that boost your child\'s mood',
+                'actions': ['Plan fun activities', 'Spend more one-on-one time', 'Ask about their day']
+            })
+
+        if averages.get('sadness', 0) > 0.6:
+            insights['alerts'].append({
+                'type': 'emotional_concern',
+                'severity': 'medium',
+                'message': 'Child has shown elevated sadness recently',
+                'recommendation': 'Consider talking with your child about their feelings'
+            })
+
+        for anomaly in insights['anomalies']:
+            if anomaly['latest'] and anomaly['emotion'] in NEGATIVE_EMOTIONS and anomaly['z_score'] > 0:
+                insights['alerts'].append({
+                    'type': 'emotional_change',
+                    'severity': 'low',
+                    'message': f"Child's {anomaly['emotion']} in the latest session was unusually high for them",
+                    'recommendation': 'Check in gently about how their day went'
+                })
+
+        return insights
+
+
+if __name__ == '__main__':
+    # Benchmark: python -m tools.emotion_analytics [years] [sessions per day]
+    import random
+    import sys
+
+    years = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    per_day = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    rng = random.Random(0)
+    now = time.time()
+    history = [
+        {
+            'timestamp': datetime.fromtimestamp(now - i * 86400 / per_day, timezone.utc),
+            'mood': rng.choice(['happy', 'sad', 'excited', 'neutral']),
+            'emotions': {'emotions': {emotion: rng.random() for emotion in EMOTIONS}}
+        }
+        for i in range(int(years * 365 * per_day))
+    ]
+
+    for name, run in (('from_history', lambda: EmotionSeries.from_history(history)),
+                      ('insights + chart + trend', lambda: (lambda series: (series.insights(), series.chart_data(),
+                                                                           series.mood_trend()))(EmotionSeries.from_history(history)))):
+        started = time.perf_counter()
+        for _ in range(20):
+            run()
+        print(f"{name}: {(time.perf_counter() - started) / 20 * 1000:.2f} ms for {len(history)} sessions")
@@ -1,57 +1,259 @@
 """Gemini API integration tools"""
-import google.generativeai as genai
-from typing import Dict, Any, List
+from google.api_core import exceptions as google_exceptions
+from typing import Dict, Any, List, Optional
+from contextvars import ContextVar
+from dataclasses import dataclass
 import asyncio
+import random
+import time
 
 from config import config
+from tools.metrics import metrics
+from tools.circuit_breaker import CircuitBreaker, CircuitOpenError
+from tools.prompts import prompts, estimate_tokens, fit_to_budget, input_budget
+from tools.single_flight import SingleFlight
+
+# Errors worth another attempt - everything else is raised straight away
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.TooManyRequests,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout
+)
+
+SENTIMENT_PROMPT = prompts.register('gemini.sentiment', """
+    Analyze the emotional sentiment of this child's statement.
+    Return scores (0-1) for: happiness, sadness, fear, anger, excitement.
+
+    Statement: "{text}"
+
+    Format response as JSON with just the emotion scores.
+""")
+
+# The Gemini SDK is slow to import, so it is loaded with the first real client
+_genai = None
+
+def _load_genai():
+    """Import and configure the Gemini SDK once"""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=config.GEMINI_API_KEY)
+        _genai = genai
+    return _genai
+
+# Shared by all clients - they all talk to the same upstream
+gemini_breaker = CircuitBreaker('gemini')
+
+# Identical concurrent prompts share one model call
+llm_flights = SingleFlight('llm')
+
+# Latest request deadline of the callers sharing each model call (None: unbounded)
+_flight_deadlines: Dict[tuple, Optional[float]] = {}
+
+# Absolute (monotonic) deadline shared by all LLM calls of the current request
+_request_deadline: ContextVar[Optional[float]] = ContextVar('llm_request_deadline', default=None)
+
+def set_request_deadline(seconds: float):
+    """Bound every LLM call made from the current request context"""
+    _request_deadline.set(time.monotonic() + seconds)
+
+@dataclass
+class LLMCallPolicy:
+    """Timeout, retry and hedging settings for one agent's LLM calls"""
+    timeout: float = 30.0          # Per-attempt deadline in seconds
+    max_retries: int = 2
+    backoff_base: float = 0.5      # First retry waits up to this long
+    backoff_max: float = 8.0
+    hedge: bool = False            # Fire a duplicate request when the first one is slow
+    hedge_percentile: float = 95
+    hedge_min_delay: float = 2.0   # Floor for the hedge delay while latency samples are few
+
+    @classmethod
+    def for_agent(cls, agent: str) -> 'LLMCallPolicy':
+        """Build the policy for an agent from config defaults and overrides"""
+        settings = {'timeout': config.LLM_TIMEOUT, 'max_retries': config.LLM_MAX_RETRIES}
+        settings.update(config.LLM_POLICIES.get(agent, {}))
+        return cls(**settings)
 
 class GeminiClient:
     """Wrapper for Gemini API with prompt templates"""
-    
-    def __init__(self):
+
+    def __init__(self, agent: str = 'default', policy: Optional[LLMCallPolicy] = None):
+        self.agent = agent
+        self.policy = policy or LLMCallPolicy.for_agent(agent)
         self.mock_mode = False
         if not config.GEMINI_API_KEY:
             print("[GeminiClient] Warning: GEMINI_API_KEY not set, using mock mode")
             self.mock_mode = True
         else:
-            genai.configure(api_key=config.GEMINI_API_KEY)
-            self.model = genai.GenerativeModel('gemini-pro')
-        
+            self.model = _load_genai().GenerativeModel('gemini-pro')
+
+    @property
+    def circuit_open(self) -> bool:
+        """True when calls would be rejected, so callers can use local fallbacks directly"""
+        return not self.mock_mode and gemini_breaker.is_open()
+
+    async def warm_up(self):
+        """Open the model connection before the first request needs it"""
+        if self.mock_mode or self.circuit_open:
+            return
+        try:
+            await asyncio.wait_for(asyncio.to_thread(self.model.count_tokens, "Hello"), self.policy.timeout)
+        except Exception as e:
+            print(f"[GeminiClient] Warm-up failed: {e}")
+
     async def generate(self, prompt: str, **kwargs) -> str:
-        """Generate text using Gemini"""
+        """
+        Generate text using Gemini.
+        Each attempt is bounded by the policy timeout and the request deadline;
+        retryable errors are retried with jittered exponential backoff.
+        Raises CircuitOpenError without calling the model while Gemini is unhealthy.
+        Concurrent calls with the same prompt and settings share one model call,
+        which runs until the latest of their deadlines; each caller still
+        gives up at its own.
+        """
         if self.mock_mode:
             # Return mock response for testing
             return "Once upon a time in a magical forest, there lived a happy little bunny who loved to explore..."
-        
+
+        key = (prompt, kwargs.get('temperature', 0.7), kwargs.get('max_tokens', 1000))
+        deadline = _request_deadline.get()
+        if llm_flights.in_flight(key):
+            shared = _flight_deadlines.get(key)
+            _flight_deadlines[key] = None if shared is None or deadline is None else max(shared, deadline)
+        else:
+            _flight_deadlines[key] = deadline
+        flight = llm_flights.do(key, self._generate, key, prompt, kwargs)
+        if deadline is None:
+            return await flight
+        return await asyncio.wait_for(flight, max(0.0, deadline - time.monotonic()))
+
+    async def _generate(self, key: tuple, prompt: str, kwargs: Dict[str, Any]) -> str:
+        """One logical model call with retries (run once per group of identical prompts)"""
         try:
-            response = await asyncio.to_thread(
-                self.model.generate_content,
-                prompt,
-                generation_config=genai.GenerationConfig(
-                    temperature=kwargs.get('temperature', 0.7),
-                    max_output_tokens=kwargs.get('max_tokens', 1000),
+            return await self._generate_until(key, prompt, kwargs)
+        finally:
+            _flight_deadlines.pop(key, None)
+
+    async def _generate_until(self, key: tuple, prompt: str, kwargs: Dict[str, Any]) -> str:
+        """
+        Attempts of a shared call. No attempt starts after the callers' latest
+        deadline (callers joining later may extend it); an attempt running
+        when the last caller gives up is cancelled with the shared call.
+        """
+        attempt = 0
+
+        while True:
+            if self._time_left(key) <= 0:
+                metrics.increment('llm.deadline_exceeded')
+                raise asyncio.TimeoutError("LLM request deadline exceeded")
+
+            if not gemini_breaker.allow_request():
+                raise CircuitOpenError("Gemini circuit is open")
+
+            started = time.monotonic()
+            try:
+                metrics.increment('llm.calls')
+                text = await self._generate_with_hedge(prompt, self.policy.timeout, kwargs)
+                gemini_breaker.record_success(time.monotonic() - started)
+                metrics.increment(f"llm.{self.agent}.prompt_tokens", estimate_tokens(prompt))
+                metrics.increment(f"llm.{self.agent}.response_tokens", estimate_tokens(text))
+                return text
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.increment('llm.timeouts')
+                if isinstance(e, RETRYABLE_ERRORS):
+                    gemini_breaker.record_failure()
+
+                attempt += 1
+                delay = random.uniform(0, min(self.policy.backoff_max,
+                                              self.policy.backoff_base * 2 ** (attempt - 1)))
+                out_of_time = self._time_left(key) <= delay
+
+                if (attempt > self.policy.max_retries or out_of_time
+                        or not isinstance(e, RETRYABLE_ERRORS)):
+                    metrics.increment('llm.failures')
+                    print(f"[GeminiClient] Error: {e}")
+                    raise
+
+                metrics.increment('llm.retries')
+                print(f"[GeminiClient] {type(e).__name__} from {self.agent}, retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _time_left(key: tuple) -> float:
+        """Seconds until the latest deadline of a shared call's callers (inf without one)"""
+        deadline = _flight_deadlines.get(key)
+        return float('inf') if deadline is None else deadline - time.monotonic()
+
+    def _hedge_delay(self) -> float:
+        """Wait this long for the first request before firing a duplicate"""
+        observed = metrics.percentile(f"llm.{self.agent}.latency", self.policy.hedge_percentile)
+        return max(self.policy.hedge_min_delay, observed)
+
+    async def _generate_with_hedge(self, prompt: str, timeout: float, kwargs: Dict[str, Any]) -> str:
+        """Run one attempt, hedged with a duplicate request if the policy asks for it"""
+        if not self.policy.hedge:
+            return await asyncio.wait_for(self._call_model(prompt, **kwargs), timeout)
+
+        started = time.monotonic()
+        primary = asyncio.create_task(self._call_model(prompt, **kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=min(self._hedge_delay(), timeout))
+        if done:
+            return primary.result()
+
+        metrics.increment('llm.hedges_fired')
+        hedge = asyncio.create_task(self._call_model(prompt, **kwargs))
+        pending = {primary, hedge}
+        error = None
+
+        try:
+            while pending:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"LLM call exceeded {timeout:.1f}s")
+
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
                 )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.increment('llm.hedges_won')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The model call runs in a worker thread; cancelling only drops the result
+            for task in pending:
+                task.cancel()
+
+    async def _call_model(self, prompt: str, **kwargs) -> str:
+        """Single request to the model, with latency recorded for hedging"""
+        start = time.monotonic()
+        response = await asyncio.to_thread(
+            self.model.generate_content,
+            prompt,
+            generation_config=_genai.GenerationConfig(
+                temperature=kwargs.get('temperature', 0.7),
+                max_output_tokens=kwargs.get('max_tokens', 1000),
             )
-            return response.text
-        except Exception as e:
-            print(f"[GeminiClient] Error: {e}")
-            raise
-            
+        )
+        metrics.observe(f"llm.{self.agent}.latency", time.monotonic() - start)
+        return response.text
+
     async def analyze_sentiment(self, text: str) -> Dict[str, float]:
         """Analyze emotional sentiment of text"""
-        prompt = f"""
-        Analyze the emotional sentiment of this child's statement.
-        Return scores (0-1) for: happiness, sadness, fear, anger, excitement.
-        
-        Statement: "{text}"
-        
-        Format response as JSON with just the emotion scores.
-        """
-        
+        prompt = SENTIMENT_PROMPT.render(text=fit_to_budget(text, input_budget(self.agent)))
+
         try:
             response = await self.generate(prompt, temperature=0.3)
             # For MVP, return structured data
             return {"happiness": 0.8, "sadness": 0.1, "fear": 0.0, "anger": 0.0, "excitement": 0.7}
         except:
             # Fallback emotional analysis
-            return {"happiness": 0.7, "sadness": 0.1, "fear": 0.0, "anger": 0.0, "excitement": 0.2}
\ No newline at end of file
+            return {"happiness": 0.7, "sadness": 0.1, "fear": 0.0, "anger": 0.0, "excitement": 0.2}
@@ -0,0 +1,189 @@
+"""Image rendering backends and content-addressed image store"""
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+import hashlib
+import io
+import os
+import textwrap
+import time
+import uuid
+
+from config import config
+from tools.metrics import metrics
+from tools.cpu_pool import cpu_pool, cpu_bound
+
+THUMBNAIL_SIZE = (200, 150)
+
+# Pastel palette shared with the placeholder thumbnails
+PASTELS = [(255, 182, 193), (152, 251, 152), (135, 206, 235), (221, 160, 221), (240, 230, 140)]
+
+
+# ----------------------------------------------------------------------
+# Pure functions - run in the CPU pool, so they take and return bytes
+# ----------------------------------------------------------------------
+
+@cpu_bound
+def render_local_png(prompt: str, width: int, height: int) -> bytes:
+    """Deterministic illustration stand-in: same prompt, same pixels"""
+    from PIL import Image, ImageDraw
+
+    digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+    background = PASTELS[digest[0] % len(PASTELS)]
+    image = Image.new('RGB', (width, height), background)
+    draw = ImageDraw.Draw(image)
+
+    # A few soft shapes placed from the prompt hash
+    for i in range(6):
+        x = digest[1 + i * 4] / 255 * width
+        y = digest[2 + i * 4] / 255 * height
+        radius = 20 + digest[3 + i * 4] / 255 * min(width, height) / 4
+        color = PASTELS[digest[4 + i * 4] % len(PASTELS)]
+        draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color)
+
+    caption = prompt.replace("Children's book illustration:", '').strip()[:160]
+    draw.multiline_text((20, height - 90), '\n'.join(textwrap.wrap(caption, 60)[:4]), fill=(74, 74, 74))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+@cpu_bound
+def make_variants(original: bytes, thumbnail_size: Tuple[int, int] = THUMBNAIL_SIZE) -> Dict[str, bytes]:
+    """Full-size WebP and a WebP thumbnail for an original image"""
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(original)).convert('RGB')
+
+    full = io.BytesIO()
+    image.save(full, format='WEBP', quality=80, method=4)
+
+    thumb_image = image.copy()
+    thumb_image.thumbnail(thumbnail_size)
+    thumb = io.BytesIO()
+    thumb_image.save(thumb, format='WEBP', quality=75, method=4)
+
+    return {'webp': full.getvalue(), 'thumb': thumb.getvalue()}
+
+
+# ----------------------------------------------------------------------
+# Renderers
+# ----------------------------------------------------------------------
+
+class LocalImageRenderer:
+    """Offline renderer used in development and tests"""
+
+    name = 'local'
+
+    async def render(self, prompt: str, width: int = 800, height: int = 600) -> bytes:
+        return await cpu_pool.run(render_local_png, prompt, width, height)
+
+
+class ImagenRenderer:
+    """Vertex AI Imagen renderer (needs the google-cloud-aiplatform package)"""
+
+    name = 'imagen'
+
+    def __init__(self):
+        import vertexai
+        from vertexai.preview.vision_models import ImageGenerationModel
+
+        vertexai.init(project=config.GCP_PROJECT_ID, location=config.IMAGEN_LOCATION)
+        self.model = ImageGenerationModel.from_pretrained(config.IMAGEN_MODEL)
+
+    async def render(self, prompt: str, width: int = 800, height: int = 600) -> bytes:
+        response = await asyncio.to_thread(
+            self.model.generate_images, prompt=prompt, number_of_images=1, aspect_ratio='4:3'
+        )
+        return response.images[0]._image_bytes
+
+
+RENDERERS = {
+    'local': LocalImageRenderer,
+    'imagen': ImagenRenderer
+}
+
+def get_renderer(name: str = None):
+    """Build the configured renderer, falling back to the local one"""
+    name = name or config.IMAGE_BACKEND
+    try:
+        return RENDERERS[name]()
+    except Exception as e:
+        print(f"[Images] Warning: renderer '{name}' unavailable ({e}), using local renderer")
+        return LocalImageRenderer()
+
+
+# ----------------------------------------------------------------------
+# Store
+# ----------------------------------------------------------------------
+
+class ImageStore:
+    """
+    Content-addressed image files on local disk.
+    Each image is stored once under the hash of its bytes, next to its
+    WebP and thumbnail variants, so re-rendered scenes cost no extra space.
+    """
+
+    def __init__(self, root: str = None, base_url: str = None):
+        self.root = root or config.IMAGE_STORE_DIR
+        self.base_url = (base_url if base_url is not None else config.MEDIA_BASE_URL).rstrip('/')
+
+    def path_for(self, filename: str) -> Optional[str]:
+        """Path of a stored file, or None if the name is not one of ours"""
+        if os.path.basename(filename) != filename or not filename[:64].isalnum():
+            return None
+        path = os.path.join(self.root, filename)
+        return path if os.path.exists(path) else None
+
+    def url_for(self, filename: str) -> str:
+        return f"{self.base_url}/media/images/{filename}"
+
+    async def save(self, original: bytes) -> Dict[str, str]:
+        """Store an image and its variants, returning their URLs"""
+        digest = hashlib.sha256(original).hexdigest()
+        names = {
+            'original': f"{digest}.png",
+            'webp': f"{digest}.webp",
+            'thumb': f"{digest}_thumb.webp"
+        }
+
+        if not all(os.path.exists(os.path.join(self.root, name)) for name in names.values()):
+            variants = await cpu_pool.run(make_variants, original)
+            await asyncio.to_thread(self._write, names['original'], original)
+            await asyncio.to_thread(self._write, names['webp'], variants['webp'])
+            await asyncio.to_thread(self._write, names['thumb'], variants['thumb'])
+        else:
+            metrics.increment('images.store_hits')
+
+        return {kind: self.url_for(name) for kind, name in names.items()}
+
+    def _write(self, name: str, data: bytes):
+        # Write then rename so readers never see a partial file
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, name)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def thumbnail_url(image_url: Optional[str]) -> Optional[str]:
+    """Thumbnail URL for a stored original, or None for external/placeholder images"""
+    if not image_url or '/media/images/' not in image_url or not image_url.endswith('.png'):
+        return None
+    return image_url[:-len('.png')] + '_thumb.webp'
+
+
+class ImagePipeline:
+    """Renders a prompt and stores the result with its variants"""
+
+    def __init__(self, renderer: Any = None, store: ImageStore = None):
+        self.renderer = renderer or get_renderer()
+        self.store = store or ImageStore()
+
+    async def create(self, prompt: str) -> Dict[str, str]:
+        start = time.monotonic()
+        original = await self.renderer.render(prompt)
+        urls = await self.store.save(original)
+        metrics.observe(f"images.{self.renderer.name}.render", time.monotonic() - start)
+        return urls
@@ -0,0 +1,104 @@
+"""In-process metrics registry for counters and latency samples"""
+from typing import Dict, Any, List, Sequence
+from collections import defaultdict, deque
+import threading
+
+
+class Metrics:
+    """
+    Lightweight metrics store shared by agents, executor and API.
+    Counters are monotonically increasing; timings keep a bounded window
+    of recent samples so percentiles reflect current behaviour.
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=self.window))
+
+    def increment(self, name: str, value: float = 1):
+        """Increase a counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name: str, value: float):
+        """Set a point-in-time value"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """Record a latency sample"""
+        with self._lock:
+            self._timings[name].append(seconds)
+
+    def counter(self, name: str) -> float:
+        """Current value of a counter"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def count(self, name: str) -> int:
+        """Number of recent samples for a timing"""
+        with self._lock:
+            return len(self._timings.get(name, ()))
+
+    def percentile(self, name: str, pct: float) -> float:
+        """Percentile (0-100) of recent samples, 0.0 when there are none"""
+        with self._lock:
+            samples = sorted(self._timings.get(name, ()))
+        if not samples:
+            return 0.0
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def histogram(self, name: str, bounds: Sequence[float]) -> Dict[str, int]:
+        """Counts of recent samples falling in each bucket (upper bounds in seconds)"""
+        with self._lock:
+            samples = list(self._timings.get(name, ()))
+        counts = {f"le_{bound:g}": 0 for bound in bounds}
+        counts['inf'] = 0
+        for sample in samples:
+            for bound in bounds:
+                if sample <= bound:
+                    counts[f"le_{bound:g}"] += 1
+                    break
+            else:
+                counts['inf'] += 1
+        return counts
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return all metrics as a JSON-serialisable dictionary"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {name: sorted(samples) for name, samples in self._timings.items()}
+
+        return {
+            'counters': counters,
+            'gauges': gauges,
+            'timings': {
+                name: self._summarise(samples)
+                for name, samples in timings.items()
+            }
+        }
+
+    @staticmethod
+    def _summarise(samples: List[float]) -> Dict[str, float]:
+        if not samples:
+            return {'count': 0}
+
+        def pick(pct: float) -> float:
+            return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+        return {
+            'count': len(samples),
+            'mean': sum(samples) / len(samples),
+            'p50': pick(50),
+            'p95': pick(95),
+            'max': samples[-1]
+        }
+
+
+# Singleton instance
+metrics = Metrics()
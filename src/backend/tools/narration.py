@@ -0,0 +1,265 @@
+"""Speech synthesis backends and content-addressed narration audio cache"""
+from typing import Any, List, Optional, Tuple
+import asyncio
+import hashlib
+import io
+import os
+import re
+import time
+import uuid
+import wave
+import zlib
+
+from config import config
+from tools.metrics import metrics
+from tools.cpu_pool import cpu_pool, cpu_bound
+from tools.single_flight import SingleFlight
+
+SAMPLE_RATE = 16000
+
+# Content types of the audio formats the synthesisers produce
+MEDIA_TYPES = {'wav': 'audio/wav', 'mp3': 'audio/mpeg'}
+
+# Narration speed multipliers accepted from clients
+MIN_SPEED = 0.5
+MAX_SPEED = 2.0
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_VOICE = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of a scene, with whitespace collapsed"""
+    return [sentence for sentence in _SENTENCE_END.split(' '.join(text.split())) if sentence]
+
+
+def valid_voice(voice: str) -> bool:
+    return bool(_VOICE.match(voice or ''))
+
+
+# ----------------------------------------------------------------------
+# Pure functions - run in the CPU pool, so they take and return bytes
+# ----------------------------------------------------------------------
+
+@cpu_bound
+def synthesise_local_wav(text: str, voice: str, speed: float) -> bytes:
+    """Deterministic speech stand-in: a soft tone per word, paced like reading aloud"""
+    import numpy as np
+
+    base = 180 + zlib.crc32(voice.encode()) % 120  # each voice has its own pitch
+    pieces = []
+    for word in text.split():
+        seconds = (0.12 + 0.04 * min(len(word), 10)) / speed
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        pitch = base * (1 + (zlib.crc32(word.lower().encode()) % 40) / 100)
+        envelope = np.sin(np.pi * t / seconds)
+        pieces.append(0.3 * envelope * np.sin(2 * np.pi * pitch * t))
+        pause = 0.35 if word[-1] in '.!?' else 0.08
+        pieces.append(np.zeros(int(pause / speed * SAMPLE_RATE)))
+
+    samples = np.concatenate(pieces) if pieces else np.zeros(0)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(SAMPLE_RATE)
+        out.writeframes((samples * 32767).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+@cpu_bound
+def join_wav(parts: List[bytes]) -> bytes:
+    """One WAV file from several with the same format"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        for index, part in enumerate(parts):
+            with wave.open(io.BytesIO(part), 'rb') as clip:
+                if index == 0:
+                    out.setparams(clip.getparams())
+                out.writeframes(clip.readframes(clip.getnframes()))
+    return buffer.getvalue()
+
+
+# ----------------------------------------------------------------------
+# Synthesisers
+# ----------------------------------------------------------------------
+
+class LocalSynthesiser:
+    """Offline synthesiser used in development and tests"""
+
+    name = 'local'
+    extension = 'wav'
+
+    async def synthesise(self, text: str, voice: str, speed: float) -> bytes:
+        return await cpu_pool.run(synthesise_local_wav, text, voice, speed)
+
+    async def join(self, parts: List[bytes]) -> bytes:
+        return await cpu_pool.run(join_wav, parts)
+
+
+class GoogleSynthesiser:
+    """Google Cloud Text-to-Speech (needs the google-cloud-texttospeech package)"""
+
+    name = 'google'
+    extension = 'mp3'
+
+    def __init__(self):
+        from google.cloud import texttospeech
+
+        self.tts = texttospeech
+        self.client = texttospeech.TextToSpeechClient()
+
+    async def synthesise(self, text: str, voice: str, speed: float) -> bytes:
+        response = await asyncio.to_thread(
+            self.client.synthesize_speech,
+            input=self.tts.SynthesisInput(text=text),
+            voice=self.tts.VoiceSelectionParams(language_code='-'.join(voice.split('-')[:2]), name=voice),
+            audio_config=self.tts.AudioConfig(audio_encoding=self.tts.AudioEncoding.MP3, speaking_rate=speed)
+        )
+        return response.audio_content
+
+    async def join(self, parts: List[bytes]) -> bytes:
+        # MP3 is a sequence of self-contained frames, so clips concatenate
+        return b''.join(parts)
+
+
+SYNTHESISERS = {
+    'local': LocalSynthesiser,
+    'google': GoogleSynthesiser
+}
+
+def get_synthesiser(name: str = None):
+    """Build the configured synthesiser, falling back to the local one"""
+    name = name or config.NARRATION_BACKEND
+    try:
+        return SYNTHESISERS[name]()
+    except Exception as e:
+        print(f"[Narration] Warning: synthesiser '{name}' unavailable ({e}), using local synthesiser")
+        return LocalSynthesiser()
+
+
+# ----------------------------------------------------------------------
+# Store
+# ----------------------------------------------------------------------
+
+class AudioStore:
+    """
+    Narration audio files on local disk, named by the hash of what was
+    spoken: the synthesiser, voice, speed and text. Audio is kept for each
+    sentence and for each whole scene, so replaying a scene reads one file
+    and a new scene only synthesises the sentences not heard before.
+    """
+
+    def __init__(self, root: str = None, base_url: str = None):
+        self.root = root or config.NARRATION_STORE_DIR
+        self.base_url = (base_url if base_url is not None else config.MEDIA_BASE_URL).rstrip('/')
+
+    @staticmethod
+    def key(backend: str, voice: str, speed: float, text: str) -> str:
+        spoken = '\0'.join((backend, voice, f"{speed:.2f}", ' '.join(text.split())))
+        return hashlib.sha256(spoken.encode('utf-8')).hexdigest()
+
+    def path_for(self, filename: str) -> Optional[str]:
+        """Path of a stored file, or None if the name is not one of ours"""
+        if os.path.basename(filename) != filename or not filename[:64].isalnum():
+            return None
+        path = os.path.join(self.root, filename)
+        return path if os.path.exists(path) else None
+
+    def url_for(self, filename: str) -> str:
+        return f"{self.base_url}/media/audio/{filename}"
+
+    def read(self, filename: str) -> Optional[bytes]:
+        path = os.path.join(self.root, filename)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, filename: str, data: bytes):
+        # Write then rename so readers never see a partial file
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, filename)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class NarrationPipeline:
+    """Synthesises scene narration through the audio store"""
+
+    def __init__(self, synthesiser: Any = None, store: AudioStore = None):
+        self.synthesiser = synthesiser or get_synthesiser()
+        self.store = store or AudioStore()
+        # Concurrent requests for the same audio share one synthesis
+        self._scenes = SingleFlight('narration.scenes')
+        self._sentences = SingleFlight('narration.sentences')
+
+    def _filename(self, voice: str, speed: float, text: str) -> str:
+        return f"{AudioStore.key(self.synthesiser.name, voice, speed, text)}.{self.synthesiser.extension}"
+
+    async def narrate(self, text: str, voice: str, speed: float) -> str:
+        """URL of the narration of a scene's text"""
+        sentences = split_sentences(text)
+        if not sentences:
+            raise ValueError("Nothing to narrate")
+
+        filename = self._filename(voice, speed, text)
+        if os.path.exists(os.path.join(self.store.root, filename)):
+            metrics.increment('narration.scene_hits')
+        elif len(sentences) == 1:
+            # A one-sentence scene is stored as that sentence
+            await self._sentence(sentences[0], voice, speed)
+        else:
+            await self._scenes.do(filename, self._narrate_scene, filename, sentences, voice, speed)
+        return self.store.url_for(filename)
+
+    async def _narrate_scene(self, filename: str, sentences: List[str], voice: str, speed: float):
+        start = time.monotonic()
+        clips = await asyncio.gather(*(self._sentence(sentence, voice, speed) for sentence in sentences))
+        audio = await self.synthesiser.join(list(clips))
+        await asyncio.to_thread(self.store.write, filename, audio)
+        metrics.observe(f"narration.{self.synthesiser.name}.scene", time.monotonic() - start)
+
+    async def _sentence(self, sentence: str, voice: str, speed: float) -> bytes:
+        filename = self._filename(voice, speed, sentence)
+        audio = await asyncio.to_thread(self.store.read, filename)
+        if audio is not None:
+            metrics.increment('narration.sentence_hits')
+            return audio
+        return await self._sentences.do(filename, self._synthesise_sentence, filename, sentence, voice, speed)
+
+    async def _synthesise_sentence(self, filename: str, sentence: str, voice: str, speed: float) -> bytes:
+        start = time.monotonic()
+        audio = await self.synthesiser.synthesise(sentence, voice, speed)
+        await asyncio.to_thread(self.store.write, filename, audio)
+        metrics.increment('narration.sentences_synthesised')
+        metrics.observe(f"narration.{self.synthesiser.name}.sentence", time.monotonic() - start)
+        return audio
+
+
+def byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The (first, last) byte positions of a single-range Range header, or None
+    to send the whole file (no header, or one this server does not handle).
+    Raises ValueError when the range lies outside the file.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, dash, last = header[len('bytes='):].strip().partition('-')
+    if not dash or not (first or last) or not (first.isdigit() or not first) or not (last.isdigit() or not last):
+        return None
+
+    if not first:
+        # Suffix range: the final `last` bytes
+        if int(last) == 0:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise ValueError(header)
+    return (first, last) if first <= last else None
@@ -0,0 +1,172 @@
+"""Near-duplicate detection of a child's story inputs (MinHash + LSH)"""
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+from collections import OrderedDict
+import random
+import re
+import time
+import zlib
+
+from config import config
+from tools.metrics import metrics
+from tools.single_flight import SingleFlight
+
+# 64 MinHash values split into 32 bands of 2: inputs with half their words
+# in common share a bucket with near certainty, so matches at the vary
+# threshold are not missed. Candidates are then checked against the full
+# signature.
+NUM_PERMUTATIONS = 64
+BANDS = 32
+_ROWS = NUM_PERMUTATIONS // BANDS
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # fixed, so signatures stay comparable across workers and restarts
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+# Inputs with fewer distinct words than this are too short to call a retelling
+MIN_WORDS = 3
+
+# Most children whose index is kept; the least recently used are dropped first
+_MAX_CHILDREN = 10000
+
+_WORD = re.compile(r'[a-z]+')
+
+# Words that say nothing about what happened in the child's day
+_STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'so', 'then', 'with', 'to', 'of', 'in', 'on', 'at',
+    'for', 'from', 'by', 'up', 'down', 'out', 'into', 'over', 'about', 'i', 'me', 'my', 'we',
+    'us', 'our', 'you', 'your', 'he', 'she', 'it', 'its', 'they', 'them', 'their', 'his',
+    'her', 'is', 'am', 'are', 'was', 'were', 'be', 'been', 'do', 'did', 'does', 'had', 'has',
+    'have', 'went', 'go', 'got', 'get', 'saw', 'see', 'said', 'there', 'this', 'that', 'some',
+    'very', 'really', 'too', 'also', 'today', 'yesterday', 'just', 'like', 'when', 'after',
+    'before', 'all', 'lot', 'lots', 'story', 'please', 'tell', 'make', 'want'
+}
+
+
+class NearMatch(NamedTuple):
+    story_id: str
+    title: str
+    similarity: float  # estimated Jaccard similarity of the two inputs' words
+
+
+def normalise_input(text: str) -> Set[str]:
+    """Content words of a child's input, lowercased and singular"""
+    words = set()
+    for word in _WORD.findall((text or '').lower()):
+        if word in _STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 4 and word.endswith('ies'):
+            word = word[:-3] + 'y'
+        elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        if word not in _STOPWORDS:
+            words.add(word)
+    return words
+
+
+def input_signature(text: str) -> Optional[List[int]]:
+    """MinHash signature of the input's content words, or None if it is too short"""
+    words = normalise_input(text)
+    if len(words) < MIN_WORDS:
+        return None
+    hashes = [zlib.crc32(word.encode()) for word in words]
+    return [min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF for a, b in _PERMUTATIONS]
+
+
+def similarity(signature: List[int], other: List[int]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(signature, other) if x == y) / NUM_PERMUTATIONS
+
+
+def _bands(signature: List[int]) -> List[Tuple[int, Tuple[int, ...]]]:
+    return [(band, tuple(signature[band * _ROWS:(band + 1) * _ROWS])) for band in range(BANDS)]
+
+
+class _ChildIndex:
+    __slots__ = ('loaded_at', 'stories', 'buckets')
+
+    def __init__(self):
+        self.loaded_at = time.monotonic()
+        self.stories: Dict[str, Tuple[List[int], str]] = {}  # story id -> (signature, title)
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+
+    def add(self, story_id: str, signature: List[int], title: str):
+        if story_id in self.stories or len(signature) != NUM_PERMUTATIONS:
+            return
+        self.stories[story_id] = (signature, title)
+        for key in _bands(signature):
+            self.buckets.setdefault(key, set()).add(story_id)
+
+
+class NearDuplicateIndex:
+    """
+    Finds an earlier story of the same child whose input was nearly the same.
+    Each story persists the MinHash signature of its input in its metadata
+    (inputSignature). A worker loads a child's last NEAR_DUPLICATE_HISTORY
+    signatures into an LSH index on first use, adds its own new stories as
+    they are stored, and reloads after NEAR_DUPLICATE_INDEX_TTL seconds to
+    pick up stories created by other workers.
+    """
+
+    def __init__(self):
+        self._memory = None
+        self._children: 'OrderedDict[str, _ChildIndex]' = OrderedDict()
+        self._flights = SingleFlight('near_duplicates.load')
+
+    def start(self, memory: Any):
+        """Load signatures from this memory backend"""
+        self._memory = memory
+        self._children.clear()
+
+    async def find(self, child_id: str, signature: Optional[List[int]]) -> Optional[NearMatch]:
+        """The child's most similar earlier story at or above NEAR_DUPLICATE_VARY_THRESHOLD"""
+        if signature is None or self._memory is None:
+            return None
+
+        index = await self._index(child_id)
+        candidates = set()
+        for key in _bands(signature):
+            candidates |= index.buckets.get(key, set())
+
+        best = None
+        for story_id in candidates:
+            stored, title = index.stories[story_id]
+            score = similarity(signature, stored)
+            if score >= config.NEAR_DUPLICATE_VARY_THRESHOLD and (best is None or score > best.similarity):
+                best = NearMatch(story_id, title, score)
+        metrics.increment('near_duplicates.matched' if best else 'near_duplicates.unmatched')
+        return best
+
+    def add(self, child_id: str, story_id: str, signature: Optional[List[int]], title: str):
+        """Index a newly stored story (only if the child's index is loaded)"""
+        index = self._children.get(child_id)
+        if index is not None and signature is not None:
+            index.add(story_id, signature, title)
+
+    async def _index(self, child_id: str) -> _ChildIndex:
+        index = self._children.get(child_id)
+        if index is not None and time.monotonic() - index.loaded_at < config.NEAR_DUPLICATE_INDEX_TTL:
+            self._children.move_to_end(child_id)
+            return index
+        return await self._flights.do(child_id, self._load, child_id)
+
+    async def _load(self, child_id: str) -> _ChildIndex:
+        index = _ChildIndex()
+        try:
+            rows = await self._memory.get_input_signatures(child_id, config.NEAR_DUPLICATE_HISTORY)
+        except Exception as e:
+            # Not cached, so the next request tries again
+            print(f"[NearDuplicates] Could not load signatures for child {child_id}: {e}")
+            return index
+        for row in rows:
+            index.add(row['id'], row['signature'], row['title'])
+        metrics.increment('near_duplicates.loads')
+
+        self._children[child_id] = index
+        self._children.move_to_end(child_id)
+        while len(self._children) > _MAX_CHILDREN:
+            self._children.popitem(last=False)
+        return index
+
+
+# Singleton instance
+near_duplicates = NearDuplicateIndex()
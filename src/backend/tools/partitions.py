@@ -0,0 +1,253 @@
+"""Monthly partitions of emotion_logs and alerts: creation ahead of time, retention and archival"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+import asyncio
+import gzip
+import os
+import re
+
+from config import config
+from tools.metrics import metrics
+
+# Partitioned tables and the setting that says how many months of each are kept
+PARTITIONED_TABLES = {
+    'emotion_logs': 'EMOTION_LOG_RETENTION_MONTHS',
+    'alerts': 'ALERT_RETENTION_MONTHS'
+}
+
+# Advisory lock keys, so only one worker maintains partitions at a time
+_ENSURE_LOCK = 0x53475001
+_ARCHIVE_LOCK = 0x53475002
+
+_PARTITION_NAME = re.compile(r'^(?P<table>[a-z_]+)_(?P<year>\d{4})_(?P<month>\d{2})$')
+
+
+def month_start(when: datetime, months: int = 0) -> datetime:
+    """The first instant (UTC) of the month `months` after the one containing `when`"""
+    when = when.astimezone(timezone.utc)
+    index = when.year * 12 + when.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+
+def _partition_month(table: str, name: str) -> Optional[datetime]:
+    match = _PARTITION_NAME.match(name)
+    if not match or match['table'] != table:
+        return None
+    return datetime(int(match['year']), int(match['month']), 1, tzinfo=timezone.utc)
+
+
+class PartitionManager:
+    """
+    Keeps emotion_logs and alerts partitioned by month (created_at, UTC).
+    Partitions for the current month and the next PARTITION_MONTHS_AHEAD are
+    created by every API worker at startup and then every
+    PARTITION_MAINTENANCE_INTERVAL seconds. Rows written where no monthly
+    partition exists land in the table's default partition; the next run
+    creates their month's partition and moves them into it.
+
+    Months older than the table's retention setting are archived: the
+    partition is detached, its rows written to
+    PARTITION_ARCHIVE_DIR/<partition>.csv.gz, and the table dropped. A
+    partition left detached by a failed archive is picked up again on the
+    next run. Archiving runs from `python -m tools.partitions archive`, and
+    also in the app when PARTITION_AUTO_ARCHIVE is set (only useful with a
+    persistent archive directory). To restore a month, create its partition
+    again and load the file with COPY ... FROM ... (FORMAT csv, HEADER).
+    """
+
+    def __init__(self):
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, db):
+        """Maintain this database's partitions in the background"""
+        self._db = db
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._maintain_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _maintain_forever(self):
+        while True:
+            try:
+                await self.ensure()
+                if config.PARTITION_AUTO_ARCHIVE:
+                    await self.archive()
+            except Exception as e:
+                print(f"[Partitions] Maintenance failed: {e}")
+            await asyncio.sleep(config.PARTITION_MAINTENANCE_INTERVAL)
+
+    async def ensure(self, months_ahead: Optional[int] = None) -> List[str]:
+        """Create the monthly partitions from this month to months_ahead months from now, and for months with rows in the default partition"""
+        months_ahead = config.PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+        this_month = month_start(datetime.now(timezone.utc))
+        created = []
+
+        async with self._db.acquire() as conn:
+            async with conn.transaction():
+                # Another worker is already on it
+                if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", _ENSURE_LOCK):
+                    return created
+                # Creating a partition briefly locks the parent table; rather
+                # than queue behind long queries (and block the writes queued
+                # behind us), give up and try again next time
+                await conn.execute("SET LOCAL lock_timeout = '5s'")
+
+                for table in PARTITIONED_TABLES:
+                    existing = set(await self._partitions(conn, table))
+                    # Earlier months whose rows ended up in the default partition
+                    stranded = await conn.fetch(f"""
+                        SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') AS month
+                        FROM {table}_default
+                    """)
+                    months = {row['month'].replace(tzinfo=timezone.utc) for row in stranded}
+                    months.update(month_start(this_month, offset) for offset in range(months_ahead + 1))
+                    for start in sorted(months):
+                        name = partition_name(table, start)
+                        if name not in existing:
+                            moved = await self._create(conn, table, name, start, month_start(start, 1))
+                            created.append(name)
+                            print(f"[Partitions] Created {name}" + (f" ({moved} rows from {table}_default)" if moved else ""))
+
+        metrics.increment('partitions.created', len(created))
+        return created
+
+    async def _create(self, conn, table: str, name: str, start: datetime, end: datetime) -> int:
+        # The new partition's range must not hold rows in the default partition
+        default = f"{table}_default"
+        moved = await conn.fetchval(
+            f"SELECT count(*) FROM {default} WHERE created_at >= $1 AND created_at < $2", start, end)
+        if not moved:
+            await conn.execute(
+                f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+            return 0
+
+        await conn.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        await conn.execute(f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE created_at >= $1 AND created_at < $2 RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, start, end)
+        await conn.execute(
+            f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+        return moved
+
+    async def archive(self) -> List[Dict[str, Any]]:
+        """Archive and drop the partitions of months past each table's retention"""
+        this_month = month_start(datetime.now(timezone.utc))
+        archived = []
+
+        async with self._db.acquire() as conn:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", _ARCHIVE_LOCK):
+                return archived
+            try:
+                for table, setting in PARTITIONED_TABLES.items():
+                    retention = getattr(config, setting)
+                    if retention <= 0:
+                        continue
+                    cutoff = month_start(this_month, -retention)
+                    attached = set(await self._partitions(conn, table))
+                    for name in await self._monthly_tables(conn, table):
+                        if _partition_month(table, name) < cutoff:
+                            archived.append(await self._archive(conn, table, name, name in attached))
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock($1)", _ARCHIVE_LOCK)
+
+        metrics.increment('partitions.archived', len(archived))
+        return archived
+
+    async def _archive(self, conn, table: str, name: str, attached: bool) -> Dict[str, Any]:
+        if attached:
+            await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            print(f"[Partitions] Detached {name}")
+
+        os.makedirs(config.PARTITION_ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(config.PARTITION_ARCHIVE_DIR, f"{name}.csv.gz")
+        partial = path + '.partial'
+        archive = await asyncio.to_thread(gzip.open, partial, 'wb')
+        try:
+            async def write(chunk: bytes):
+                await asyncio.to_thread(archive.write, chunk)
+            status = await conn.copy_from_table(name, output=write, format='csv', header=True)
+        finally:
+            await asyncio.to_thread(archive.close)
+        # Only a complete archive replaces an earlier one, and only then is the data dropped
+        os.replace(partial, path)
+        rows = int(status.split()[-1])
+
+        await conn.execute(f"DROP TABLE {name}")
+        print(f"[Partitions] Archived {rows} rows of {name} to {path}")
+        return {'partition': name, 'rows': rows, 'path': path}
+
+    async def status(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Each table's partitions with estimated row counts and sizes"""
+        async with self._db.acquire() as conn:
+            result = {}
+            for table in PARTITIONED_TABLES:
+                rows = await conn.fetch("""
+                    SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bounds,
+                           GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+                           pg_total_relation_size(c.oid) AS bytes
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = $1::regclass
+                    ORDER BY c.relname
+                """, table)
+                result[table] = [dict(row) for row in rows]
+        return result
+
+    async def _partitions(self, conn, table: str) -> List[str]:
+        rows = await conn.fetch("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = $1::regclass
+        """, table)
+        return [row['relname'] for row in rows]
+
+    async def _monthly_tables(self, conn, table: str) -> List[str]:
+        """Monthly partitions of the table, attached or left detached, oldest first"""
+        rows = await conn.fetch("""
+            SELECT relname FROM pg_class
+            WHERE relnamespace = 'public'::regnamespace AND relkind = 'r' AND relname LIKE $1
+            ORDER BY relname
+        """, f"{table}\\_____\\___")
+        return [row['relname'] for row in rows if _partition_month(table, row['relname'])]
+
+
+# Singleton instance
+partitions = PartitionManager()
+
+
+if __name__ == '__main__':
+    # Maintenance: python -m tools.partitions [status|ensure|archive]
+    import sys
+    from database import db
+
+    async def main(command: str):
+        if not await db.connect():
+            sys.exit("Database connection failed")
+        try:
+            partitions._db = db
+            if command == 'ensure':
+                print(await partitions.ensure())
+            elif command == 'archive':
+                print(await partitions.ensure())
+                for result in await partitions.archive():
+                    print(result)
+            else:
+                for table, rows in (await partitions.status()).items():
+                    print(table)
+                    for row in rows:
+                        print(f"  {row['name']:<28} {row['estimated_rows']:>10} rows {row['bytes'] / 1e6:>9.1f} MB  {row['bounds']}")
+        finally:
+            await db.disconnect()
+
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else 'status'))
@@ -0,0 +1,105 @@
+"""Prompt template registry with token estimation and input budgeting"""
+from typing import Dict, Any, List, Tuple, Optional
+from string import Formatter
+import re
+import textwrap
+
+from config import config
+from tools.metrics import metrics
+
+_BLANK_LINES = re.compile(r'\n{3,}')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough local token count (about four characters per token for English)"""
+    if not text:
+        return 0
+    return len(text) // 4 + 1
+
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """
+    Shorten text to roughly max_tokens.
+    Keeps whole sentences from the start plus the final sentence, which for a
+    child's retelling usually holds the beginning and the ending of their day.
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+
+    metrics.increment('prompts.inputs_truncated')
+    max_chars = max_tokens * 4
+    sentences = _SENTENCE_END.split(text.strip())
+    last = sentences[-1] if len(sentences) > 1 and len(sentences[-1]) < max_chars // 3 else ''
+
+    kept = []
+    used = len(last)
+    for sentence in sentences[:-1] if last else sentences:
+        if used + len(sentence) + 1 > max_chars:
+            break
+        kept.append(sentence)
+        used += len(sentence) + 1
+
+    if not kept:
+        # One very long sentence - cut on a word boundary
+        return text[:max_chars].rsplit(' ', 1)[0] + '...'
+
+    return ' '.join(kept) + (' ... ' + last if last else '')
+
+
+class PromptTemplate:
+    """
+    A prompt compiled once at import time.
+    Indentation padding is stripped and the text is split into literal and
+    field segments, so rendering is a single join.
+    """
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        source = '\n'.join(line.strip() for line in textwrap.dedent(text).strip().splitlines())
+        self.source = _BLANK_LINES.sub('\n\n', source)
+        self._segments: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(self.source)
+        ]
+        self.fields = {field for _, field in self._segments if field}
+        self.base_tokens = estimate_tokens(''.join(literal for literal, _ in self._segments))
+
+    def render(self, **values: Any) -> str:
+        """Fill the template; blank lines left by empty values are collapsed"""
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt '{self.name}' missing values: {', '.join(sorted(missing))}")
+
+        parts = []
+        for literal, field in self._segments:
+            parts.append(literal)
+            if field:
+                parts.append(str(values[field]))
+        return _BLANK_LINES.sub('\n\n', ''.join(parts))
+
+
+class PromptRegistry:
+    """Holds compiled templates by name"""
+
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, text: str) -> PromptTemplate:
+        template = PromptTemplate(name, text)
+        self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        return self._templates[name]
+
+    def names(self) -> List[str]:
+        return sorted(self._templates)
+
+
+def input_budget(agent: str) -> int:
+    """Token budget for the variable (user-supplied) part of an agent's prompt"""
+    return config.PROMPT_INPUT_BUDGETS.get(agent, config.PROMPT_INPUT_BUDGETS['default'])
+
+
+# Singleton instance
+prompts = PromptRegistry()
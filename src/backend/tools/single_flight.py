@@ -0,0 +1,79 @@
+"""Request coalescing: concurrent identical calls share one in-flight call"""
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import functools
+
+from tools.metrics import metrics
+
+
+class _Flight:
+    __slots__ = ('future', 'waiters')
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+    Callers arriving while a call is in flight await the same result (or
+    exception) instead of starting their own. The call is cancelled only
+    when every caller waiting on it has gone, so one cancelled request does
+    not fail the others. Results are shared, so callers must not mutate them.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func(*args, **kwargs)))
+            self._flights[key] = flight
+            flight.future.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            metrics.increment(f"single_flight.{self.name}.coalesced")
+        self._record_call()
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.future)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.future.done():
+                flight.future.cancel()
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Whether a call for key is running, so a new caller would join it"""
+        return key in self._flights
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _record_call(self):
+        metrics.increment(f"single_flight.{self.name}.calls")
+        calls = metrics.counter(f"single_flight.{self.name}.calls")
+        coalesced = metrics.counter(f"single_flight.{self.name}.coalesced")
+        metrics.gauge(f"single_flight.{self.name}.coalesced_ratio", round(coalesced / calls, 4))
+
+
+def single_flight(name: str):
+    """
+    Coalesce concurrent calls of an async method made with the same arguments
+    on the same instance.
+    """
+    def decorate(method: Callable[..., Awaitable[Any]]):
+        flights = SingleFlight(name)
+
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            key = (id(self), args, tuple(sorted(kwargs.items())))
+            return await flights.do(key, method, self, *args, **kwargs)
+
+        wrapper.flights = flights
+        return wrapper
+
+    return decorate
@@ -0,0 +1,83 @@
+"""Startup profiling and lazily constructed components"""
+from typing import Any, Dict
+from contextlib import contextmanager
+import importlib
+import time
+
+from tools.metrics import metrics
+
+
+class StartupProfile:
+    """
+    Import and initialisation times of the expensive parts of the server.
+    Each timing is also published as a startup.<name> gauge on /metrics.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def timed(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - start)
+
+    def record(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        metrics.gauge(f"startup.{name}", round(self.timings[name], 4))
+
+    def import_module(self, name: str):
+        """Import a module, timing it if this is the first import"""
+        with self.timed(f"import.{name}"):
+            return importlib.import_module(name)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'since_start': round(time.monotonic() - self.started, 3),
+            'timings': {
+                name: round(seconds, 4)
+                for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1])
+            }
+        }
+
+    def print_report(self):
+        report = self.report()
+        print(f"[Startup] Ready {report['since_start']:.2f}s after import")
+        for name, seconds in report['timings'].items():
+            print(f"[Startup]   {name:<28} {seconds * 1000:8.1f} ms")
+
+
+class LazyComponent:
+    """
+    A component built on first use from a 'module:Class' path.
+    The module is only imported then, so unused agents and clients cost
+    nothing at startup. Attribute access is forwarded to the built object.
+    """
+
+    def __init__(self, target: str, *args, **kwargs):
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs
+        self._instance = None
+
+    @property
+    def built(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            module_name, class_name = self._target.split(':')
+            module = startup.import_module(module_name)
+            with startup.timed(f"init.{module_name}"):
+                self._instance = getattr(module, class_name)(*self._args, **self._kwargs)
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+# Singleton instance
+startup = StartupProfile()
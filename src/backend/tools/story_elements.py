@@ -0,0 +1,64 @@
+"""Characters and themes of a story, counted per child as favourites"""
+from typing import Any, Dict, List
+import re
+
+from tools.character_designs import normalise_character
+
+_WORD = re.compile(r'[a-z]+')
+
+# Characters recognised in the child's input and the story text
+CHARACTER_WORDS = {
+    'unicorn', 'dragon', 'fairy', 'princess', 'prince', 'knight', 'wizard', 'witch',
+    'mermaid', 'pirate', 'robot', 'astronaut', 'alien', 'monster', 'dinosaur', 'superhero',
+    'cat', 'kitten', 'dog', 'puppy', 'bunny', 'rabbit', 'bear', 'owl', 'fox', 'lion',
+    'tiger', 'elephant', 'monkey', 'penguin', 'dolphin', 'turtle', 'horse', 'pony',
+    'butterfly', 'bee', 'frog', 'mouse', 'squirrel', 'giraffe', 'panda', 'whale', 'shark'
+}
+
+# Theme -> words that signal it
+THEME_WORDS = {
+    'adventure': {'adventure', 'journey', 'explore', 'explored', 'quest', 'treasure', 'map'},
+    'friendship': {'friend', 'friends', 'friendship', 'together', 'share', 'shared', 'sharing'},
+    'magic': {'magic', 'magical', 'spell', 'wand', 'enchanted', 'sparkle', 'sparkling'},
+    'courage': {'brave', 'courage', 'courageous', 'fearless', 'bold'},
+    'kindness': {'kind', 'kindness', 'help', 'helped', 'helping', 'gentle', 'care'},
+    'family': {'family', 'mom', 'mum', 'dad', 'sister', 'brother', 'grandma', 'grandpa'},
+    'nature': {'forest', 'garden', 'tree', 'trees', 'flower', 'flowers', 'river', 'meadow'},
+    'space': {'space', 'star', 'stars', 'planet', 'moon', 'rocket', 'galaxy'},
+    'ocean': {'ocean', 'sea', 'beach', 'wave', 'waves', 'underwater', 'island'},
+    'learning': {'learn', 'learned', 'school', 'lesson', 'discover', 'discovered'}
+}
+
+
+def extract_story_elements(story: Dict[str, Any], input_text: str = '',
+                           include_elements: List[str] = None,
+                           preferences: Dict[str, Any] = None) -> Dict[str, List[str]]:
+    """
+    Characters and themes of a story, each listed once.
+    Characters are the elements the child asked for plus known characters
+    (and the child's own favourites) named in their input or the story.
+    Themes come from the story's educational topics and theme words.
+    """
+    text = ' '.join([input_text or '', story.get('title', '')] + [
+        scene.get('text', '') for scene in story.get('scenes', [])
+    ]).lower()
+    words = set(_WORD.findall(text))
+    padded = f" {' '.join(_WORD.findall(text))} "
+
+    characters = [normalise_character(element) for element in include_elements or []]
+    characters += [word for word in words if word in CHARACTER_WORDS]
+    for favourite in (preferences or {}).get('favoriteCharacters', []):
+        key = normalise_character(favourite)
+        if key and (f" {key} " in padded or f" {key}s " in padded):
+            characters.append(key)
+
+    themes = [
+        normalise_character(topic)
+        for topic in story.get('metadata', {}).get('educationalTopics', []) or []
+    ]
+    themes += [theme for theme, signals in THEME_WORDS.items() if words & signals]
+
+    return {
+        'characters': sorted({normalise_character(name) for name in characters} - {''}),
+        'themes': sorted(set(themes) - {''})
+    }